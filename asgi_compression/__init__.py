@@ -1,17 +1,51 @@
-from .base import CompressionAlgorithm, ContentEncoding
+from .adaptive import AdaptiveEffort
+from .background import BackgroundRecompressor
+from .base import (
+    ENCODING_EXTENSION,
+    PRE_ENCODED_KEY,
+    CompressionAlgorithm,
+    ContentEncoding,
+)
 from .brotli import BrotliAlgorithm, BrotliMode
+from .cache import DiskVariantCache, MemoryVariantCache, VariantCache
+from .capture import TrafficCapture
+from .compressor import AsyncCompressionAlgorithm, AsyncCompressor
+from .etag import ETagMode
 from .gzip import GzipAlgorithm
+from .hooks import CompressionHooks, CompressionSummary
 from .identity import IdentityAlgorithm
+from .metrics import CompressionMetrics, SharedMetrics
 from .middleware import CompressionMiddleware
+from .pool import ThreadBudget
+from .registry import available_encodings, create_algorithm, register_algorithm
 from .zstd import ZstdAlgorithm
 
 __all__ = [
+    "AdaptiveEffort",
+    "AsyncCompressionAlgorithm",
+    "AsyncCompressor",
+    "ENCODING_EXTENSION",
+    "PRE_ENCODED_KEY",
+    "BackgroundRecompressor",
     "CompressionMiddleware",
     "CompressionAlgorithm",
+    "CompressionHooks",
+    "CompressionMetrics",
+    "CompressionSummary",
     "ContentEncoding",
+    "DiskVariantCache",
+    "ETagMode",
     "GzipAlgorithm",
     "BrotliAlgorithm",
     "BrotliMode",
     "IdentityAlgorithm",
+    "MemoryVariantCache",
+    "SharedMetrics",
+    "ThreadBudget",
+    "TrafficCapture",
+    "VariantCache",
     "ZstdAlgorithm",
+    "available_encodings",
+    "create_algorithm",
+    "register_algorithm",
 ]
@@ -0,0 +1,145 @@
+"""
+Command line tools.
+
+Usage:
+    python -m asgi_compression stats /dev/shm/compression-metrics
+    python -m asgi_compression stats /dev/shm/compression-metrics --json
+    python -m asgi_compression simulate /var/lib/app/captures
+    python -m asgi_compression simulate /var/lib/app/captures \\
+        --candidates gzip-6,br-4,br-6,zstd-3 --bytes-per-cpu-ms 50000
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import typing
+
+from .capture import load_captures
+from .metrics import read_shared_metrics
+from .simulate import DEFAULT_BYTES_PER_CPU_MS, DEFAULT_CANDIDATES, simulate
+
+
+def stats(args: argparse.Namespace) -> None:
+    metrics = read_shared_metrics(args.path)
+    if args.json:
+        json.dump(metrics, sys.stdout, indent=2)
+        print()
+        return
+
+    totals = metrics["totals"]
+    workers = metrics["workers"]
+    alive = sum(worker["alive"] for worker in workers)
+    ratio = (
+        totals["bytes_out"] / totals["bytes_in"] if totals["bytes_in"] else 0
+    )
+    print(f"workers              {len(workers)} ({alive} alive)")
+    print(f"responses            {totals['responses']}")
+    print(f"compressed           {totals['compressed_responses']}")
+    print(f"bypassed             {totals['bypassed_responses']}")
+    print(f"bytes in             {totals['bytes_in']}")
+    print(f"bytes out            {totals['bytes_out']} ({ratio:.1%})")
+    print(f"compression time     {totals['duration_ns'] / 1e9:.3f}s")
+
+    if workers:
+        print()
+        print(
+            f"{'pid':>8} {'alive':>5} {'responses':>10} {'compressed':>10} "
+            f"{'bytes in':>12} {'bytes out':>12} {'time':>9}"
+        )
+        for worker in workers:
+            print(
+                f"{worker['pid']:>8} {'yes' if worker['alive'] else 'no':>5} "
+                f"{worker['responses']:>10} "
+                f"{worker['compressed_responses']:>10} "
+                f"{worker['bytes_in']:>12} {worker['bytes_out']:>12} "
+                f"{worker['duration_ns'] / 1e9:>8.3f}s"
+            )
+
+
+def simulate_captures(args: argparse.Namespace) -> None:
+    report = asyncio.run(
+        simulate(
+            load_captures(args.directory),
+            args.candidates.split(","),
+            args.bytes_per_cpu_ms,
+        )
+    )
+    if args.json:
+        json.dump(report.to_dict(), sys.stdout, indent=2)
+        print()
+        return
+
+    for content_type, results in report.content_types.items():
+        first = next(iter(results.values()))
+        print(
+            f"{content_type} ({first.responses} responses, "
+            f"{first.bytes_in} bytes)"
+        )
+        print(
+            f"  {'candidate':<10} {'ratio':>7} {'bytes saved':>12} "
+            f"{'CPU ms':>9} {'pareto':>6}"
+        )
+        for result in results.values():
+            ratio = result.bytes_out / result.bytes_in if result.bytes_in else 0
+            print(
+                f"  {result.candidate:<10} {ratio:>7.1%} "
+                f"{result.bytes_saved:>12} {result.cpu_ns / 1e6:>9.2f} "
+                f"{'*' if result.pareto else '':>6}"
+            )
+        print()
+
+    print(
+        "Recommended, a CPU millisecond being worth "
+        f"{report.bytes_per_cpu_ms:g} bytes:"
+    )
+    print()
+    print(report.config)
+
+
+def parse_args(argv: typing.Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m asgi_compression")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats_parser = commands.add_parser(
+        "stats", help="Show metrics shared by all workers through a file"
+    )
+    stats_parser.add_argument("path", help="Path given to SharedMetrics")
+    stats_parser.add_argument(
+        "--json", action="store_true", help="Print the metrics as JSON"
+    )
+    stats_parser.set_defaults(handler=stats)
+
+    simulate_parser = commands.add_parser(
+        "simulate",
+        help="Replay captured responses through candidate algorithms",
+    )
+    simulate_parser.add_argument(
+        "directory", help="Directory given to TrafficCapture"
+    )
+    simulate_parser.add_argument(
+        "--candidates",
+        default=",".join(DEFAULT_CANDIDATES),
+        help="Comma-separated family-level configurations, e.g. gzip-6,br-4",
+    )
+    simulate_parser.add_argument(
+        "--bytes-per-cpu-ms",
+        type=float,
+        default=DEFAULT_BYTES_PER_CPU_MS,
+        help="Bytes of output worth a millisecond of CPU time",
+    )
+    simulate_parser.add_argument(
+        "--json", action="store_true", help="Print the report as JSON"
+    )
+    simulate_parser.set_defaults(handler=simulate_captures)
+
+    return parser.parse_args(argv)
+
+
+def main(argv: typing.Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
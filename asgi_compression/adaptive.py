@@ -0,0 +1,78 @@
+import typing
+from dataclasses import dataclass
+
+# Shortest send duration taken into account, faster sends are as good as
+# instant and would make the throughput estimate infinite.
+MIN_SEND_SECONDS = 1e-6
+
+
+@dataclass
+class AdaptiveEffort:
+    """
+    Bounds for adapting the level of streaming responses to the client.
+
+    The client's throughput is estimated from how long sending each streamed
+    chunk takes. Below `slow_throughput` bytes per second the response is
+    bandwidth bound and the level is raised by one, up to `max_level`. Above
+    `fast_throughput` it is lowered by one, down to `min_level`. The level
+    changes at most once every `interval` chunks.
+    """
+
+    min_level: int
+    max_level: int
+    slow_throughput: float = 1_000_000
+    fast_throughput: float = 100_000_000
+    interval: int = 4
+    # Weight of the latest send in the throughput estimate.
+    smoothing: float = 0.5
+
+    def __post_init__(self) -> None:
+        if self.min_level > self.max_level:
+            raise ValueError("min_level must not be greater than max_level")
+        if self.slow_throughput >= self.fast_throughput:
+            raise ValueError("slow_throughput must be below fast_throughput")
+
+
+class EffortController:
+    """Throughput estimate and level of a single streaming response."""
+
+    __slots__ = ("effort", "level", "throughput", "chunks")
+
+    def __init__(self, effort: AdaptiveEffort, level: int) -> None:
+        self.effort = effort
+        self.level = level
+        self.throughput: typing.Optional[float] = None
+        self.chunks = 0
+
+    def record(self, size: int, seconds: float) -> typing.Optional[int]:
+        """Record a send, returns the new level when it should change."""
+        if not size:
+            return None
+
+        effort = self.effort
+        throughput = size / max(seconds, MIN_SEND_SECONDS)
+        if self.throughput is not None:
+            throughput = (
+                effort.smoothing * throughput
+                + (1 - effort.smoothing) * self.throughput
+            )
+        self.throughput = throughput
+
+        self.chunks += 1
+        if self.chunks < effort.interval:
+            return None
+
+        if (
+            throughput < effort.slow_throughput
+            and self.level < effort.max_level
+        ):
+            self.level += 1
+        elif (
+            throughput > effort.fast_throughput
+            and self.level > effort.min_level
+        ):
+            self.level -= 1
+        else:
+            return None
+        self.chunks = 0
+        return self.level
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional
+
+from .base import CompressionAlgorithm
+from .cache import CachedVariant, VariantCache, VariantKey
+
+DEFAULT_HOT_THRESHOLD = 10
+DEFAULT_MAX_PENDING = 2
+
+
+class BackgroundRecompressor:
+    """
+    Recompresses hot cached variants at maximum quality in the background.
+
+    Responses are served at the algorithm's fast level. Once a cached variant
+    has been hit `hot_threshold` times, its body is recompressed at the
+    algorithm's background quality on `executor` (a process pool by default),
+    and the cache entry is replaced if the result is smaller. At most
+    `max_pending` jobs run at once, further hot variants are retried on
+    their next hit.
+    """
+
+    def __init__(
+        self,
+        hot_threshold: int = DEFAULT_HOT_THRESHOLD,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self.hot_threshold = hot_threshold
+        self.max_pending = max_pending
+        self._executor = executor
+        self.pending: dict[VariantKey, asyncio.Future[None]] = {}
+        # Guards `pending` and the executor, the recompressor may be shared
+        # by event loops in several threads.
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_pending
+                )
+            return self._executor
+
+    def record_hit(
+        self,
+        cache: VariantCache,
+        key: VariantKey,
+        variant: CachedVariant,
+        body: bytes,
+        algorithm: CompressionAlgorithm,
+    ) -> None:
+        """Schedule recompression of `variant` if it became hot."""
+        if variant.upgraded or variant.hits < self.hot_threshold:
+            return
+
+        compress = algorithm.background_compressor()
+        if compress is None:
+            return
+
+        executor = self.executor
+        loop = asyncio.get_running_loop()
+
+        async def recompress() -> None:
+            try:
+                recompressed = await loop.run_in_executor(
+                    executor, compress, body
+                )
+                # Disk caches write files, keep them off the event loop.
+                await loop.run_in_executor(
+                    None, self._store, cache, key, variant, recompressed
+                )
+            except Exception:
+                # Recompression is an optimization, the variant stays.
+                pass
+            finally:
+                with self._lock:
+                    del self.pending[key]
+
+        with self._lock:
+            if key in self.pending or len(self.pending) >= self.max_pending:
+                return
+            self.pending[key] = asyncio.ensure_future(recompress())
+
+    def _store(
+        self,
+        cache: VariantCache,
+        key: VariantKey,
+        variant: CachedVariant,
+        recompressed: bytes,
+    ) -> None:
+        """Replace `variant` with its recompressed body, if smaller."""
+        current = cache.get(key)
+        hits = current.hits if current is not None else variant.hits
+        if len(recompressed) < len(variant.body):
+            cache.set(
+                key,
+                CachedVariant(body=recompressed, hits=hits, upgraded=True),
+            )
+        elif current is not None:
+            # Not worth it, don't try again.
+            current.upgraded = True
+            cache.set(key, current)
+
+    async def drain(self) -> None:
+        """Wait for all pending recompressions."""
+        with self._lock:
+            pending = list(self.pending.values())
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
@@ -1,12 +1,55 @@
+import asyncio
+import hashlib
+import mmap
+import os
+import re
+import time
 import typing
-from abc import ABC, abstractmethod
+from abc import ABC
 from dataclasses import dataclass
 from enum import Enum
 
+from .cache import (
+    CachedVariant,
+    VariantCache,
+    VariantKey,
+    file_variant_key,
+    variant_key,
+    variant_params,
+)
+from .digest import content_digest, format_content_digest
+from .etag import ETagMode, encode_etag, etag_matches
+from .ranges import RangeNotSatisfiable, if_range_matches, parse_range
 from .types import ASGIApp, Headers, Message, Receive, Scope, Send
 
+if typing.TYPE_CHECKING:
+    from .adaptive import EffortController
+    from .background import BackgroundRecompressor
+    from .decompression import Decompressor
+    from .hooks import CompressionHooks, CompressionSummary
+
+T = typing.TypeVar("T")
+
 DEFAULT_EXCLUDED_CONTENT_TYPES = ("text/event-stream",)
 DEFAULT_MINIMUM_SIZE = 500
+# Scope extension the middleware publishes the negotiated encoding in, and
+# start message key apps mark bodies they already encoded with.
+ENCODING_EXTENSION = "asgi_compression.encoding"
+PRE_ENCODED_KEY = "asgi_compression.pre_encoded"
+# Statuses whose responses have no body.
+NO_BODY_STATUSES = (204, 304)
+# Files sent with `http.response.zerocopysend` are compressed in slices of
+# this size, off the event loop once they are at least FILE_OFFLOAD_SIZE.
+FILE_SLICE_SIZE = 1024 * 1024
+FILE_OFFLOAD_SIZE = 256 * 1024
+# Responder states, `send_with_compression` dispatches on them.
+STATE_START = 0  # Waiting for the start message.
+STATE_FIRST_BODY = 1  # Start message held until the first body.
+STATE_STREAMING = 2  # Headers sent, body chunks are encoded.
+STATE_PASSTHROUGH = 3  # Messages are forwarded unchanged.
+STATE_DISCARD = 4  # A 304 was sent, the app's body is dropped.
+# Encodings are HTTP tokens, compared case-insensitively, see RFC 9110.
+ENCODING_TOKEN = re.compile(r"[a-z0-9!#$%&'*+.^_`|~-]+")
 
 
 class ContentEncoding(str, Enum):
@@ -15,6 +58,33 @@ class ContentEncoding(str, Enum):
     ZSTD = "zstd"
     IDENTITY = "identity"
 
+    @classmethod
+    def register(cls, encoding: str) -> "ContentEncoding":
+        """
+        Member for an encoding the enum doesn't define, e.g. `lz4`.
+
+        Registered encodings behave like the built-in members, except that
+        iterating the enum only yields the latter.
+        """
+        member = cls._value2member_map_.get(encoding)
+        if member is not None:
+            return typing.cast(ContentEncoding, member)
+        if not ENCODING_TOKEN.fullmatch(encoding):
+            raise ValueError(f"Invalid content encoding: {encoding!r}")
+        member = str.__new__(cls, encoding)
+        member._name_ = encoding.upper()
+        member._value_ = encoding
+        # Concurrent registrations of an encoding agree on its member.
+        return typing.cast(
+            ContentEncoding,
+            cls._value2member_map_.setdefault(encoding, member),
+        )
+
+
+def is_cacheable(headers: Headers) -> bool:
+    cache_control = headers.get("cache-control", "").lower()
+    return "no-store" not in cache_control
+
 
 async def unattached_send(message: Message) -> typing.NoReturn:
     raise RuntimeError("send awaitable not set")  # pragma: no cover
@@ -23,16 +93,135 @@ async def unattached_send(message: Message) -> typing.NoReturn:
 class CompressionResponder(ABC):
     """Base class for all compression responders."""
 
+    __slots__ = (
+        "app",
+        "minimum_size",
+        "_send",
+        "_initial_message",
+        "_headers",
+        "_state",
+        "hooks",
+        "server_timing",
+        "_compressed",
+        "_bytes_in",
+        "_bytes_out",
+        "_duration_ns",
+        "_chunks",
+        "transcode_decoders",
+        "accept_encoding",
+        "_decompressor",
+        "etag_mode",
+        "etag_params",
+        "if_none_match",
+        "_encoded_etag",
+        "cache",
+        "recompressor",
+        "algorithm",
+        "early_headers",
+        "max_header_hold",
+        "_hold_task",
+        "pre_encoded",
+        "_pre_encoded",
+        "_effort",
+        "deterministic",
+        "content_digest",
+        "digest_trailers",
+        "_digest",
+        "overlap_sends",
+        "_pending_send",
+        "range_requests",
+        "request_range",
+        "if_range",
+        "_stable_variant",
+        "compressor",
+    )
+
     content_encoding: ContentEncoding
 
     def __init__(self, app: ASGIApp, minimum_size: int) -> None:
         self.app = app
         self.minimum_size = minimum_size
         self._send: Send = unattached_send
-        self._initial_message: Message = {}
-        self._started = False
-        self._content_encoding_set = False
-        self._content_type_is_excluded = False
+        # Set from the start message.
+        self._initial_message: Message
+        self._headers: Headers
+        self._state = STATE_START
+
+        # Instrumentation, configured by the middleware. Counters are only
+        # maintained when hooks or Server-Timing are enabled.
+        self.hooks: typing.Optional["CompressionHooks"] = None
+        self.server_timing = False
+        self._compressed = False
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._duration_ns = 0
+        self._chunks = 0
+
+        # Transcoding of responses the app already encoded, configured by the
+        # middleware. Disabled while `transcode_decoders` is None.
+        self.transcode_decoders: typing.Optional[
+            typing.Mapping[str, "CompressionAlgorithm"]
+        ] = None
+        self.accept_encoding = ""
+        self._decompressor: typing.Optional["Decompressor"] = None
+
+        # Per-encoding ETags and conditional requests, configured by the
+        # middleware. Disabled while `etag_mode` is None.
+        self.etag_mode: typing.Optional[ETagMode] = None
+        # Algorithm parameters folded into SUFFIX ETags, so that they are
+        # strong validators of the variant's bytes, as If-Range needs.
+        self.etag_params = ""
+        self.if_none_match = ""
+        self._encoded_etag: typing.Optional[str] = None
+
+        # Cache of encoded single-message bodies, configured by the
+        # middleware. Disabled while `cache` is None.
+        self.cache: typing.Optional[VariantCache] = None
+        self.recompressor: typing.Optional["BackgroundRecompressor"] = None
+        self.algorithm: typing.Optional["CompressionAlgorithm"] = None
+
+        # Sending the start message before the first body, configured by the
+        # middleware. `max_header_hold` is disabled while None.
+        self.early_headers = False
+        self.max_header_hold: typing.Optional[float] = None
+        self._hold_task: typing.Optional[asyncio.Task[None]] = None
+
+        # Bodies the app encoded itself, marked with `PRE_ENCODED_KEY`.
+        # Configured by the middleware.
+        self.pre_encoded = False
+        self._pre_encoded = False
+
+        # Level of streaming responses adapted to the client's throughput,
+        # set up by responders supporting `set_level`. Disabled while None.
+        self._effort: typing.Optional["EffortController"] = None
+
+        # Output that depends only on the body, configured by the middleware.
+        self.deterministic = False
+
+        # Content-Digest of encoded bodies, configured by the middleware.
+        # Streaming bodies are digested as they're sent, into a trailer, when
+        # `digest_trailers` tells the server supports them.
+        self.content_digest = False
+        self.digest_trailers = False
+        self._digest: typing.Any = None
+
+        # Sending encoded chunks while the next one is compressed,
+        # configured by the middleware. The chunk being sent is pending.
+        self.overlap_sends = False
+        self._pending_send: typing.Optional[asyncio.Task[None]] = None
+
+        # Range requests answered from cached variants, configured by the
+        # middleware, which holds the Range and If-Range headers back from
+        # the app. `_stable_variant` tells the encoded body is a cached
+        # variant whose bytes won't change.
+        self.range_requests = False
+        self.request_range = ""
+        self.if_range = ""
+        self._stable_variant = False
+
+        # Compression context of the responder. Created on first use,
+        # responses that are never compressed don't pay for the compressor.
+        self.compressor: typing.Any = None
 
     async def __call__(
         self,
@@ -41,88 +230,794 @@ class CompressionResponder(ABC):
         send: Send,
     ) -> None:
         self._send = send
-        await self.app(scope, receive, self.send_with_compression)
+        try:
+            if self.hooks is None:
+                await self.app(scope, receive, self.send_with_compression)
+                return
+
+            self.hooks.on_start(scope, self.content_encoding)
+            try:
+                await self.app(scope, receive, self.send_with_compression)
+            finally:
+                self.hooks.on_finish(self.summary())
+        except BaseException:
+            if self._pending_send is not None:
+                # The app's exception wins over one sending the last chunk.
+                pending_send, self._pending_send = self._pending_send, None
+                await asyncio.gather(pending_send, return_exceptions=True)
+            raise
+        finally:
+            if self._hold_task is not None:
+                await self._settle_hold()
+            if self._pending_send is not None:
+                await self._flush_send()
 
     async def send_with_compression(self, message: Message) -> None:
-        message_type = message["type"]
-        if message_type == "http.response.start":
-            # Don't send the initial message until we've determined how to
-            # modify the outgoing headers correctly.
-            self._initial_message = message
-            headers = Headers(raw=self._initial_message["headers"])
-
-            self._content_encoding_set = "content-encoding" in headers
-            self._content_type_is_excluded = headers.get(
-                "content-type", ""
-            ).startswith(DEFAULT_EXCLUDED_CONTENT_TYPES)
-
-        elif message_type == "http.response.body" and (
-            self._content_encoding_set or self._content_type_is_excluded
-        ):
-            if not self._started:
-                self._started = True
-                await self._send(self._initial_message)
+        if self._hold_task is not None:
+            await self._settle_hold()
+
+        state = self._state
+        if state == STATE_PASSTHROUGH:
             await self._send(message)
+        elif state == STATE_STREAMING:
+            if message["type"] == "http.response.zerocopysend":
+                await self._send_file(message)
+            else:
+                await self._send_chunk(message)
+        elif state == STATE_FIRST_BODY:
+            if message["type"] == "http.response.zerocopysend":
+                await self._send_file(message)
+            else:
+                await self._send_first_body(message)
+        elif state == STATE_START:
+            await self._start(message)
+        # Otherwise a 304 was already sent and the app's body is discarded.
 
-        elif message_type == "http.response.body" and not self._started:
-            self._started = True
-            body = message.get("body", b"")
-            more_body = message.get("more_body", False)
+    async def _start(self, message: Message) -> None:
+        if message.get("status", 200) in NO_BODY_STATUSES:
+            # Nothing to compress, send it unchanged right away.
+            if self.pre_encoded:
+                message.pop(PRE_ENCODED_KEY, None)
+            await self._pass_through(message)
+            return
 
-            if len(body) < self.minimum_size and not more_body:
-                # Don't apply compression to small outgoing responses.
-                # Don't add Vary header for small responses
-                await self._send(self._initial_message)
-                await self._send(message)
-            elif not more_body:
-                # Standard response.
-                body = self.apply_compression(body, more_body=False)
+        # Don't send the initial message until we've determined how to
+        # modify the outgoing headers correctly.
+        self._initial_message = message
+        headers = Headers(raw=message["headers"])
+
+        if self.pre_encoded and PRE_ENCODED_KEY in message:
+            self._mark_pre_encoded(message, headers)
+
+        if not self._pre_encoded:
+            if headers.get("content-type", "").startswith(
+                DEFAULT_EXCLUDED_CONTENT_TYPES
+            ):
+                await self._pass_through(message)
+                return
+
+            if "content-encoding" in headers:
+                if self.transcode_decoders is not None:
+                    self._decompressor = self._create_transcoding_decompressor(
+                        headers["content-encoding"]
+                    )
+                if self._decompressor is None:
+                    await self._pass_through(message)
+                    return
+
+        self._state = STATE_FIRST_BODY
+        self._headers = headers
+        if (
+            self.etag_mode is not None
+            and "etag" in headers
+            and self.content_encoding != ContentEncoding.IDENTITY
+        ):
+            self._encoded_etag = encode_etag(
+                headers["etag"],
+                self.content_encoding.value,
+                self.etag_mode,
+                self.etag_params,
+            )
+            if (
+                self.if_none_match
+                and message.get("status", 200) == 200
+                and etag_matches(self.if_none_match, self._encoded_etag)
+            ):
+                # The client already has this variant, don't compress.
+                await self._send_not_modified(headers)
+                return
+
+        if self.early_headers and (
+            "content-length" not in headers or self._pre_encoded
+        ):
+            # How the body will be encoded is already known.
+            await self._commit_headers()
+        elif self.max_header_hold is not None:
+            self._hold_task = asyncio.ensure_future(
+                self._commit_headers_after(self.max_header_hold)
+            )
+
+    async def _pass_through(self, message: Message) -> None:
+        """Send the start message and forward the rest unchanged."""
+        self._state = STATE_PASSTHROUGH
+        await self._send(message)
+
+    async def _send_first_body(self, message: Message) -> None:
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = self._headers
+
+        if self._pre_encoded:
+            self._state = STATE_PASSTHROUGH
+            self._set_pre_encoded_headers(
+                headers, None if more_body else len(body)
+            )
+        elif self._decompressor is not None:
+            if not body and not more_body:
+                # Nothing to transcode, e.g. a response to a HEAD request.
+                self._state = STATE_PASSTHROUGH
+                self._decompressor = None
+            else:
+                self._state = STATE_STREAMING
+                body = await self._transcode(body, more_body=more_body)
 
-                headers = Headers(raw=self._initial_message["headers"])
                 headers.add_vary_header("Accept-Encoding")
+                del headers["Content-Encoding"]
+                if self.content_encoding != ContentEncoding.IDENTITY:
+                    self._set_content_encoding(headers)
+                if more_body:
+                    if "Content-Length" in headers:
+                        del headers["Content-Length"]
+                    if self.content_digest:
+                        self._start_digest(headers)
+                else:
+                    headers["Content-Length"] = str(len(body))
+                    if self.content_digest:
+                        headers["Content-Digest"] = content_digest(body)
+
+                message["body"] = body
+                self._initial_message["headers"] = headers.encode()
+        elif len(body) < self.minimum_size and not more_body:
+            # Don't apply compression to small outgoing responses.
+            # Don't add Vary header for small responses
+            self._state = STATE_PASSTHROUGH
+        elif not more_body:
+            # Standard response.
+            self._state = STATE_PASSTHROUGH
+            headers.add_vary_header("Accept-Encoding")
+
+            if not self._is_noop():
+                if self.cache is not None and is_cacheable(headers):
+                    body = await self._compress_cached(body)
+                else:
+                    body = await self._compress(body, more_body=False)
 
                 if body != message["body"]:
-                    headers["Content-Encoding"] = self.content_encoding
-                    headers["Content-Length"] = str(len(body))
+                    self._set_content_encoding(headers)
+                    if self._stable_variant:
+                        body = self._select_range(headers, body)
+                    self._set_body_headers(headers, body)
+                    if self.server_timing:
+                        duration_ms = self._duration_ns / 1_000_000
+                        headers.add(
+                            "Server-Timing", f"compress;dur={duration_ms:.3f}"
+                        )
                     message["body"] = body
 
-                self._initial_message["headers"] = headers.encode()
-                await self._send(self._initial_message)
-                await self._send(message)
-            else:
-                # Initial body in streaming response.
-                body = self.apply_compression(body, more_body=True)
+            self._initial_message["headers"] = headers.encode()
+        else:
+            # Initial body in streaming response.
+            headers.add_vary_header("Accept-Encoding")
 
-                headers = Headers(raw=self._initial_message["headers"])
-                headers.add_vary_header("Accept-Encoding")
+            if self._is_noop():
+                # The remaining chunks are sent as they are.
+                self._state = STATE_PASSTHROUGH
+            else:
+                self._state = STATE_STREAMING
+                body = await self._compress(body, more_body=True)
 
                 if body != message["body"]:
-                    headers["Content-Encoding"] = self.content_encoding
+                    self._set_content_encoding(headers)
                     if "Content-Length" in headers:
                         del headers["Content-Length"]
+                    if self.content_digest:
+                        self._start_digest(headers)
 
                     message["body"] = body
 
+            self._initial_message["headers"] = headers.encode()
+
+        await self._send(self._initial_message)
+        if self._digest is not None:
+            self._digest.update(message["body"])
+        if self._state == STATE_STREAMING:
+            await self._send_body(message)
+        else:
+            await self._send(message)
+
+    async def _send_chunk(self, message: Message) -> None:
+        """Encode a body chunk following the first one."""
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._decompressor is not None:
+            message["body"] = await self._transcode(body, more_body=more_body)
+        else:
+            message["body"] = await self._compress(body, more_body=more_body)
+
+        if self._digest is not None:
+            self._digest.update(message["body"])
+
+        if self._effort is None or self.deterministic:
+            await self._send_body(message)
+        else:
+            if self._pending_send is not None:
+                await self._flush_send()
+            # How long the send takes tells how fast the client reads.
+            start = time.perf_counter()
+            await self._send(message)
+            level = self._effort.record(
+                len(message["body"]), time.perf_counter() - start
+            )
+            if level is not None:
+                self.set_level(level)
+
+        if self._digest is not None and not more_body:
+            await self._send_digest_trailer()
+
+    async def _send_body(self, message: Message) -> None:
+        """Send an encoded chunk, once the previous one has been sent."""
+        if self._pending_send is not None:
+            await self._flush_send()
+        if self.overlap_sends and message.get("more_body", False):
+            # Sent while the app produces the next chunk and it's compressed.
+            # An error sending it is raised from the app's next send.
+            self._pending_send = asyncio.ensure_future(self._send(message))
+        else:
+            await self._send(message)
+
+    async def _flush_send(self) -> None:
+        """Wait until the chunk being sent has been sent."""
+        assert self._pending_send is not None
+        pending_send, self._pending_send = self._pending_send, None
+        await pending_send
+
+    def _is_noop(self) -> bool:
+        """Whether compressing would neither change nor count anything."""
+        return (
+            self.content_encoding == ContentEncoding.IDENTITY
+            and self.hooks is None
+            and not self.server_timing
+        )
+
+    async def _compress_cached(self, body: bytes) -> bytes:
+        assert self.cache is not None
+        if self.content_encoding == ContentEncoding.IDENTITY:
+            return await self._compress(body, more_body=False)
+
+        key = variant_key(
+            self.content_encoding.value, body, variant_params(self.algorithm)
+        )
+        variant = await self._call_cache(self.cache.get, key)
+        if variant is None:
+            compressed = await self._compress(body, more_body=False)
+            variant = CachedVariant(body=compressed)
+            await self._call_cache(self.cache.set, key, variant)
+            if len(compressed) <= self.cache.max_entry_size:
+                self._stable_variant = self._is_stable(variant)
+            return compressed
+
+        self.cache.hit(key, variant)
+        if self.recompressor is not None and self.algorithm is not None:
+            self.recompressor.record_hit(
+                self.cache, key, variant, body, self.algorithm
+            )
+        self._stable_variant = self._is_stable(variant)
+        return variant.body
+
+    async def _call_cache(
+        self, method: typing.Callable[..., T], *args: typing.Any
+    ) -> T:
+        """Call a cache method, on a worker thread if it does I/O."""
+        assert self.cache is not None
+        if self.cache.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def _is_stable(self, variant: CachedVariant) -> bool:
+        """Whether ranges of a cached variant can be served."""
+        if not self.range_requests:
+            return False
+        # The recompressor would replace its body once it becomes hot.
+        return (
+            variant.upgraded
+            or self.recompressor is None
+            or self.algorithm is None
+            or self.algorithm.background_compressor() is None
+        )
+
+    def _set_body_headers(self, headers: Headers, body: bytes) -> None:
+        """Set the headers describing a single-message encoded body."""
+        headers["Content-Length"] = str(len(body))
+        if (
+            self.content_digest
+            and self._initial_message.get("status", 200) != 416
+        ):
+            headers["Content-Digest"] = content_digest(body)
+
+    def _select_range(self, headers: Headers, body: bytes) -> bytes:
+        """Part of a stable variant's body the request asks for."""
+        selected = self._range(headers, len(body))
+        if selected is None:
+            return body
+        start, end = selected
+        return body[start:end]
+
+    def _range(
+        self, headers: Headers, size: int
+    ) -> typing.Optional[tuple[int, int]]:
+        """
+        Start and end of the range of a stable variant of `size` bytes to
+        send, None for the whole body. Sets the status and headers of a
+        partial response.
+        """
+        headers["Accept-Ranges"] = "bytes"
+        if (
+            not self.request_range
+            or self._initial_message.get("status", 200) != 200
+            or (
+                self.if_range
+                # Dates are shared by every variant, only ETags tell
+                # which one the client has.
+                and not if_range_matches(
+                    self.if_range, headers.get("etag"), None
+                )
+            )
+        ):
+            return None
+
+        try:
+            selected = parse_range(self.request_range, size)
+        except RangeNotSatisfiable:
+            self._initial_message["status"] = 416
+            headers["Content-Range"] = f"bytes */{size}"
+            # Nothing of the variant is sent, the empty body isn't encoded.
+            for name in ("Content-Encoding", "Content-Digest", "ETag"):
+                if name in headers:
+                    del headers[name]
+            return 0, 0
+        if selected is not None:
+            start, end = selected
+            self._initial_message["status"] = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        return selected
+
+    async def _send_file(self, message: Message) -> None:
+        """
+        Compress the file of a `http.response.zerocopysend` message.
+
+        The file is mmapped and compressed in slices, so its contents are
+        never read into Python bytes. Messages compression doesn't apply to
+        are passed through, keeping the zero-copy send.
+        """
+        file = message["file"]
+        fd = file if isinstance(file, int) else file.fileno()
+        more_body = message.get("more_body", False)
+        offset = message.get("offset")
+        position = os.lseek(fd, 0, os.SEEK_CUR) if offset is None else offset
+        available = max(0, os.fstat(fd).st_size - position)
+        count = message.get("count")
+        count = available if count is None else min(count, available)
+        if self._pending_send is not None:
+            await self._flush_send()
+
+        first = self._state == STATE_FIRST_BODY
+        if self._pre_encoded:
+            # Only reached with the first body, later ones pass through.
+            self._state = STATE_PASSTHROUGH
+            self._set_pre_encoded_headers(
+                self._headers, None if more_body else count
+            )
+            await self._send(self._initial_message)
+            await self._send(message)
+            return
+
+        if self._decompressor is None and (
+            self.content_encoding == ContentEncoding.IDENTITY
+            or (first and not more_body and count < self.minimum_size)
+        ):
+            if first:
+                self._state = STATE_PASSTHROUGH
+                await self._send(self._initial_message)
+            await self._send(message)
+            return
+
+        if offset is None:
+            # Like sendfile, consume the file from its current position.
+            os.lseek(fd, position + count, os.SEEK_SET)
+
+        headers: typing.Optional[Headers] = None
+        key: typing.Optional[VariantKey] = None
+        if first:
+            self._state = STATE_STREAMING
+            headers = self._headers
+            headers.add_vary_header("Accept-Encoding")
+            if self._decompressor is not None:
+                del headers["Content-Encoding"]
+            if self.content_encoding != ContentEncoding.IDENTITY:
+                self._set_content_encoding(headers)
+
+            if (
+                self.cache is not None
+                and not more_body
+                and self._decompressor is None
+                and is_cacheable(headers)
+            ):
+                key = file_variant_key(
+                    self.content_encoding.value,
+                    fd,
+                    position,
+                    count,
+                    variant_params(self.algorithm),
+                )
+                if await self._send_cached_file(key, headers):
+                    return
+
+        body = await self._compress_file(fd, position, count, more_body)
+
+        if headers is not None:
+            if more_body:
+                if "Content-Length" in headers:
+                    del headers["Content-Length"]
+                if self.content_digest:
+                    self._start_digest(headers)
+            else:
+                if key is not None:
+                    assert self.cache is not None
+                    await self._call_cache(
+                        self.cache.set, key, CachedVariant(body=body)
+                    )
+                    if (
+                        self.range_requests
+                        and len(body) <= self.cache.max_entry_size
+                    ):
+                        # Compressed files are never recompressed.
+                        body = self._select_range(headers, body)
+                self._set_body_headers(headers, body)
+                if self.server_timing:
+                    duration_ms = self._duration_ns / 1_000_000
+                    headers.add(
+                        "Server-Timing", f"compress;dur={duration_ms:.3f}"
+                    )
+            self._initial_message["headers"] = headers.encode()
+            await self._send(self._initial_message)
+
+        if self._digest is not None:
+            self._digest.update(body)
+        await self._send_body(
+            {
+                "type": "http.response.body",
+                "body": body,
+                "more_body": more_body,
+            }
+        )
+        if self._digest is not None and not more_body:
+            await self._send_digest_trailer()
+
+    async def _compress_file(
+        self,
+        fd: int,
+        offset: int,
+        count: int,
+        more_body: bool,
+    ) -> bytes:
+        if not count:
+            if self._decompressor is not None:
+                return await self._transcode(b"", more_body=more_body)
+            return await self._compress(b"", more_body=more_body)
+
+        offload = count >= FILE_OFFLOAD_SIZE
+        output = []
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for start in range(offset, offset + count, FILE_SLICE_SIZE):
+                    end = min(start + FILE_SLICE_SIZE, offset + count)
+                    more = more_body or end < offset + count
+                    with view[start:end] as piece:
+                        # Compressors accept any buffer, not just bytes.
+                        data = typing.cast(bytes, piece)
+                        if self._decompressor is not None:
+                            chunk = await self._transcode(data, more_body=more)
+                        else:
+                            chunk = await self._compress(
+                                data, more_body=more, offload=offload
+                            )
+                    output.append(chunk)
+        return b"".join(output)
+
+    async def _send_cached_file(
+        self, key: VariantKey, headers: Headers
+    ) -> bool:
+        """Send a cached variant of a file, returns whether one was found."""
+        assert self.cache is not None
+        file = await self._call_cache(self.cache.open, key)
+        if file is not None:
+            with file:
+                size = os.fstat(file.fileno()).st_size
+                message: Message = {
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "more_body": False,
+                }
+                selected = None
+                if self.range_requests:
+                    # Compressed files are never recompressed.
+                    selected = self._range(headers, size)
+                if selected is not None:
+                    start, end = selected
+                    size = end - start
+                    message.update(offset=start, count=size)
+                    if not size:
+                        message = {"type": "http.response.body", "body": b""}
+                headers["Content-Length"] = str(size)
                 self._initial_message["headers"] = headers.encode()
                 await self._send(self._initial_message)
                 await self._send(message)
-        elif message_type == "http.response.body":  # pragma: no branch
-            # Remaining body in streaming response.
-            body = message.get("body", b"")
-            more_body = message.get("more_body", False)
+            return True
 
-            message["body"] = self.apply_compression(body, more_body=more_body)
-            await self._send(message)
+        variant = await self._call_cache(self.cache.get, key)
+        if variant is None:
+            return False
+        self.cache.hit(key, variant)
+        body = variant.body
+        if self.range_requests:
+            body = self._select_range(headers, body)
+        self._set_body_headers(headers, body)
+        self._initial_message["headers"] = headers.encode()
+        await self._send(self._initial_message)
+        await self._send({"type": "http.response.body", "body": body})
+        return True
+
+    async def _commit_headers(self) -> None:
+        """
+        Send the held start message before the first body arrives.
+
+        Responses whose Content-Length is below the minimum size are sent
+        unchanged, others are compressed as a streaming response.
+        """
+        headers = self._headers
+        content_length = headers.get("content-length", "")
+        if self._pre_encoded:
+            # The app's Content-Length is that of the encoded body.
+            self._state = STATE_PASSTHROUGH
+            self._set_pre_encoded_headers(
+                headers,
+                int(content_length) if content_length.isdigit() else None,
+            )
+        elif (
+            self._decompressor is None
+            and content_length.isdigit()
+            and int(content_length) < self.minimum_size
+        ):
+            self._state = STATE_PASSTHROUGH
+        else:
+            self._state = STATE_STREAMING
+            headers.add_vary_header("Accept-Encoding")
+            if self._decompressor is not None:
+                del headers["Content-Encoding"]
+            if self.content_encoding != ContentEncoding.IDENTITY:
+                self._set_content_encoding(headers)
+            if "Content-Length" in headers:
+                del headers["Content-Length"]
+            if self.content_digest:
+                self._start_digest(headers)
+            self._initial_message["headers"] = headers.encode()
+        await self._send(self._initial_message)
+
+    async def _commit_headers_after(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self._commit_headers()
+
+    async def _settle_hold(self) -> None:
+        """Stop the hold timer, or wait for the start message it's sending."""
+        assert self._hold_task is not None
+        hold_task, self._hold_task = self._hold_task, None
+        if self._state != STATE_FIRST_BODY:
+            await hold_task
+        else:
+            hold_task.cancel()
+
+    def _mark_pre_encoded(self, message: Message, headers: Headers) -> None:
+        """Handle a start message marked with `PRE_ENCODED_KEY`."""
+        encoding = message.pop(PRE_ENCODED_KEY)
+        if encoding == self.content_encoding.value:
+            if self.content_encoding != ContentEncoding.IDENTITY:
+                self._pre_encoded = True
+        elif encoding != ContentEncoding.IDENTITY.value:
+            # Not the negotiated encoding, handled like any response the app
+            # encoded itself.
+            headers["Content-Encoding"] = encoding
+            message["headers"] = headers.encode()
+
+    def _set_pre_encoded_headers(
+        self,
+        headers: Headers,
+        content_length: typing.Optional[int],
+    ) -> None:
+        headers.add_vary_header("Accept-Encoding")
+        self._set_content_encoding(headers)
+        if content_length is not None:
+            headers["Content-Length"] = str(content_length)
+        elif "Content-Length" in headers:
+            del headers["Content-Length"]
+        self._initial_message["headers"] = headers.encode()
+
+    def _start_digest(self, headers: Headers) -> None:
+        """Digest a streaming body as it's sent, to send it as a trailer."""
+        # The app's digest, if any, is that of the body before encoding.
+        if "Content-Digest" in headers:
+            del headers["Content-Digest"]
+        if self.digest_trailers and not self._initial_message.get("trailers"):
+            self._digest = hashlib.sha256()
+            headers["Trailer"] = "Content-Digest"
+            self._initial_message["trailers"] = True
+
+    async def _send_digest_trailer(self) -> None:
+        digest, self._digest = self._digest, None
+        await self._send(
+            {
+                "type": "http.response.trailers",
+                "headers": [
+                    (
+                        b"content-digest",
+                        format_content_digest(digest.digest()).encode(),
+                    )
+                ],
+                "more_trailers": False,
+            }
+        )
+
+    def _set_content_encoding(self, headers: Headers) -> None:
+        self._compressed = True
+        headers["Content-Encoding"] = self.content_encoding
+        if self.range_requests and "Accept-Ranges" in headers:
+            # The app's ranges are of the unencoded body, encoded ones are
+            # only served from stable cached variants.
+            del headers["Accept-Ranges"]
+        if self._encoded_etag is not None:
+            headers["ETag"] = self._encoded_etag
+
+    async def _send_not_modified(self, headers: Headers) -> None:
+        assert self._encoded_etag is not None
+        self._state = STATE_DISCARD
+
+        for name in ("Content-Length", "Content-Type", "Content-Encoding"):
+            if name in headers:
+                del headers[name]
+        headers["ETag"] = self._encoded_etag
+        headers.add_vary_header("Accept-Encoding")
+
+        self._initial_message["status"] = 304
+        self._initial_message["headers"] = headers.encode()
+        await self._send(self._initial_message)
+        await self._send({"type": "http.response.body", "body": b""})
+
+    def _create_transcoding_decompressor(
+        self, app_encoding: str
+    ) -> typing.Optional["Decompressor"]:
+        """Decide whether a response the app already encoded is transcoded.
+
+        The response is passed through unchanged when its encoding is the
+        one negotiated for this request, when it can't be decoded, or when
+        nothing better is available and the client accepts it.
+        """
+        assert self.transcode_decoders is not None
+        app_encoding = app_encoding.strip().lower()
+        if app_encoding == self.content_encoding.value:
+            return None
+
+        decoder = self.transcode_decoders.get(app_encoding)
+        if decoder is None:
+            return None
+
+        if (
+            self.content_encoding == ContentEncoding.IDENTITY
+            and app_encoding in self.accept_encoding
+        ):
+            return None
+
+        return decoder.create_decompressor()
+
+    async def _transcode(self, body: bytes, *, more_body: bool) -> bytes:
+        """Decode an encoded chunk and re-encode it piece by piece."""
+        assert self._decompressor is not None
+        output = []
+        for piece in self._decompressor.decompress(body):
+            output.append(await self._compress(piece, more_body=True))
+        if not more_body:
+            self._decompressor.finish()
+            output.append(await self._compress(b"", more_body=False))
+        return b"".join(output)
+
+    async def _compress(
+        self,
+        body: bytes,
+        *,
+        more_body: bool,
+        offload: bool = False,
+    ) -> bytes:
+        if self.hooks is None and not self.server_timing:
+            return await self.compress(
+                body, more_body=more_body, offload=offload
+            )
+
+        start = time.perf_counter_ns()
+        compressed = await self.compress(
+            body, more_body=more_body, offload=offload
+        )
+        duration_ns = time.perf_counter_ns() - start
+
+        self._bytes_in += len(body)
+        self._bytes_out += len(compressed)
+        self._duration_ns += duration_ns
+        self._chunks += 1
+        if self.hooks is not None:
+            self.hooks.on_chunk(len(body), len(compressed), duration_ns)
+        return compressed
+
+    def summary(self) -> "CompressionSummary":
+        """Summary of the compression work done so far."""
+        from .hooks import CompressionSummary
+
+        return CompressionSummary(
+            encoding=(
+                self.content_encoding
+                if self._compressed
+                else ContentEncoding.IDENTITY
+            ),
+            bytes_in=self._bytes_in,
+            bytes_out=self._bytes_out,
+            duration_ns=self._duration_ns,
+            chunks=self._chunks,
+        )
+
+    async def compress(
+        self,
+        body: bytes,
+        *,
+        more_body: bool,
+        offload: bool = False,
+    ) -> bytes:
+        """Compress a body chunk.
+
+        Defaults to `apply_compression`, on a worker thread when `offload` is
+        set. Override to compress off the event loop in other ways, e.g. on a
+        thread pool.
+        """
+        if offload:
+            return await asyncio.to_thread(
+                self.apply_compression, body, more_body=more_body
+            )
+        return self.apply_compression(body, more_body=more_body)
+
+    def set_level(self, level: int) -> None:
+        """
+        Use `level` for the chunks still to come, see `AdaptiveEffort`.
+        Responders without levels ignore it.
+        """
 
-    @abstractmethod
     def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
         """Apply compression on the response body.
 
-        If more_body is False, any compression file should be closed. If it
-        isn't, it won't be closed automatically until all background tasks
-        complete.
+        Used by the default `compress`, responders overriding `compress`
+        don't need it. If more_body is False, any compression file should be
+        closed. If it isn't, it won't be closed automatically until all
+        background tasks complete.
         """
-        raise NotImplementedError
+        raise NotImplementedError(
+            f"{type(self).__name__} must implement apply_compression or "
+            "compress"
+        )
 
 
 @dataclass
@@ -136,5 +1031,27 @@ class CompressionAlgorithm(ABC):
         """Create a responder for this compression algorithm."""
         raise NotImplementedError
 
+    def background_compressor(
+        self,
+    ) -> typing.Optional[typing.Callable[[bytes], bytes]]:
+        """One-shot compressor used to recompress hot responses.
+
+        The callable must be picklable, as it may run in another process.
+        Returns None when the algorithm has no better background quality.
+        """
+        return None
+
+    def create_decompressor(self) -> "Decompressor":
+        """Create a decompressor for request bodies in this encoding."""
+        raise NotImplementedError
+
+    @property
+    def can_decompress(self) -> bool:
+        """Whether the algorithm implements `create_decompressor`."""
+        return (
+            type(self).create_decompressor
+            is not CompressionAlgorithm.create_decompressor
+        )
+
     def check_available(self) -> None:
         """Check if the algorithm is available in the current environment."""
@@ -1,23 +1,41 @@
 import io
+import threading
+import typing
 from dataclasses import dataclass
 from enum import Enum
+from functools import partial
 from typing import TYPE_CHECKING
 
 from .base import CompressionAlgorithm, CompressionResponder, ContentEncoding
+from .decompression import (
+    DECOMPRESSED_CHUNK_SIZE,
+    DecompressionError,
+    Decompressor,
+)
 from .types import ASGIApp
 
 if TYPE_CHECKING:
     import brotli
 
 
+# Serializes the first import, threads may race to it without the GIL.
+_import_lock = threading.Lock()
+_imported = False
+
+
 def import_brotli() -> None:
-    global brotli
-    try:
-        import brotli
-    except ImportError as e:
-        raise ImportError(
-            'brotli is not installed, run `pip install "asgi-compression[br]"`'
-        ) from e
+    global brotli, _imported
+    if _imported:
+        return
+    with _import_lock:
+        try:
+            import brotli
+        except ImportError as e:
+            raise ImportError(
+                "brotli is not installed, run "
+                '`pip install "asgi-compression[br]"`'
+            ) from e
+        _imported = True
 
 
 class BrotliMode(Enum):
@@ -36,9 +54,34 @@ class BrotliMode(Enum):
             assert False, f"Expected code to be unreachable, but got: {self}"
 
 
+def compress_brotli(
+    body: bytes,
+    quality: int,
+    mode: BrotliMode,
+    lgwin: int,
+    lgblock: int,
+) -> bytes:
+    import_brotli()
+    return brotli.compress(
+        body,
+        quality=quality,
+        mode=mode.to_brotli_mode(),
+        lgwin=lgwin,
+        lgblock=lgblock,
+    )
+
+
 class BrotliResponder(CompressionResponder):
     """Responder that applies brotli compression."""
 
+    __slots__ = (
+        "quality",
+        "mode",
+        "lgwin",
+        "lgblock",
+        "brotli_buffer",
+    )
+
     content_encoding = ContentEncoding.BROTLI
 
     def __init__(
@@ -54,15 +97,22 @@ class BrotliResponder(CompressionResponder):
 
         import_brotli()
 
-        self.brotli_buffer = io.BytesIO()
-        self.compressor = brotli.Compressor(
-            quality=quality,
-            mode=mode.to_brotli_mode(),
-            lgwin=lgwin,
-            lgblock=lgblock,
-        )
+        self.quality = quality
+        self.mode = mode
+        self.lgwin = lgwin
+        self.lgblock = lgblock
+        self.brotli_buffer: typing.Optional[io.BytesIO] = None
 
     def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self.brotli_buffer is None or self.compressor is None:
+            self.brotli_buffer = io.BytesIO()
+            self.compressor = brotli.Compressor(
+                quality=self.quality,
+                mode=self.mode.to_brotli_mode(),
+                lgwin=self.lgwin,
+                lgblock=self.lgblock,
+            )
+
         compressed = self.compressor.process(body)
         self.brotli_buffer.write(compressed)
 
@@ -72,11 +122,58 @@ class BrotliResponder(CompressionResponder):
 
         compressed_data = self.brotli_buffer.getvalue()
 
-        self.brotli_buffer.seek(0)
-        self.brotli_buffer.truncate()
+        if more_body:
+            self.brotli_buffer.seek(0)
+            self.brotli_buffer.truncate()
+        else:
+            # Done, don't keep the window until the app returns.
+            self.brotli_buffer = None
+            self.compressor = None
         return compressed_data
 
 
+def brotli_limits_output() -> bool:
+    """
+    Whether brotli can limit the output of a decompression call, which needs
+    brotli >= 1.2. Without it a few bytes of input can decompress to
+    gigabytes at once, so request bodies aren't decoded.
+    """
+    import_brotli()
+    return hasattr(brotli.Decompressor, "can_accept_more_data")
+
+
+class BrotliDecompressor(Decompressor):
+    """Incremental brotli decompressor."""
+
+    def __init__(self) -> None:
+        if not brotli_limits_output():
+            raise ImportError(
+                "brotli >= 1.2 is required to decompress request bodies, run "
+                '`pip install -U "asgi-compression[br]"`'
+            )
+
+        self._decompressor = brotli.Decompressor()
+
+    def decompress(self, data: bytes) -> typing.Iterator[bytes]:
+        decompressor = self._decompressor
+        while True:
+            chunk = decompressor.process(
+                data, output_buffer_limit=DECOMPRESSED_CHUNK_SIZE
+            )
+            data = b""
+            if chunk:
+                yield chunk
+            if (
+                len(chunk) < DECOMPRESSED_CHUNK_SIZE
+                and decompressor.can_accept_more_data()
+            ):
+                return
+
+    def finish(self) -> None:
+        if not self._decompressor.is_finished():
+            raise DecompressionError("Truncated brotli request body")
+
+
 @dataclass
 class BrotliAlgorithm(CompressionAlgorithm):
     """Brotli compression algorithm."""
@@ -86,6 +183,8 @@ class BrotliAlgorithm(CompressionAlgorithm):
     mode: BrotliMode = BrotliMode.TEXT
     lgwin: int = 22
     lgblock: int = 0
+    # Quality used when recompressing hot responses in the background.
+    background_quality: int = 11
 
     def create_responder(self, app: ASGIApp) -> "BrotliResponder":
         return BrotliResponder(
@@ -97,5 +196,24 @@ class BrotliAlgorithm(CompressionAlgorithm):
             lgblock=self.lgblock,
         )
 
+    def background_compressor(self) -> typing.Callable[[bytes], bytes]:
+        return partial(
+            compress_brotli,
+            quality=self.background_quality,
+            mode=self.mode,
+            lgwin=self.lgwin,
+            lgblock=self.lgblock,
+        )
+
+    def create_decompressor(self) -> BrotliDecompressor:
+        return BrotliDecompressor()
+
+    @property
+    def can_decompress(self) -> bool:
+        try:
+            return brotli_limits_output()
+        except ImportError:
+            return False
+
     def check_available(self) -> None:
         import_brotli()
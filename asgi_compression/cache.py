@@ -0,0 +1,301 @@
+import hashlib
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, fields, is_dataclass
+from enum import Enum
+from typing import BinaryIO, Optional
+
+# Encoding and digest of the uncompressed body and algorithm parameters.
+VariantKey = tuple[str, bytes]
+
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_ENTRY_SIZE = 1024 * 1024
+DEFAULT_DISK_CACHE_SIZE = 1024 * 1024 * 1024
+DEFAULT_DISK_MAX_ENTRY_SIZE = 256 * 1024 * 1024
+
+
+def variant_params(algorithm: object) -> str:
+    """
+    Stable representation of the parameters of an algorithm dataclass, so
+    that variants compressed with other levels or options aren't shared.
+    Resources such as thread budgets don't change the output and are left
+    out.
+    """
+    if not is_dataclass(algorithm):
+        return ""
+    params = [type(algorithm).__qualname__]
+    for field in fields(algorithm):
+        value = getattr(algorithm, field.name)
+        if is_dataclass(value):
+            value = variant_params(value)
+        elif isinstance(value, Enum):
+            value = value.value
+        elif not isinstance(value, (str, int, float, type(None))):
+            continue
+        params.append(f"{field.name}={value!r}")
+    return ",".join(params)
+
+
+def _digest(data: bytes, params: str, person: bytes = b"") -> bytes:
+    # Keyed by the parameters, which variants without any don't need.
+    key = b""
+    if params:
+        key = hashlib.blake2b(params.encode(), digest_size=16).digest()
+    return hashlib.blake2b(
+        data, digest_size=16, key=key, person=person
+    ).digest()
+
+
+def variant_key(encoding: str, body: bytes, params: str = "") -> VariantKey:
+    """
+    Content-addressed key of the `encoding` variant of `body`, compressed
+    with the algorithm `params` (see `variant_params`).
+    """
+    return encoding, _digest(body, params)
+
+
+def file_variant_key(
+    encoding: str,
+    fd: int,
+    offset: int,
+    count: int,
+    params: str = "",
+) -> VariantKey:
+    """
+    Key of the `encoding` variant of a range of an open file, compressed
+    with the algorithm `params`.
+
+    Files are identified by their inode, size and modification time rather
+    than a digest of their contents, so looking them up doesn't read them.
+    """
+    stat = os.fstat(fd)
+    identity = (
+        f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}:"
+        f"{offset}:{count}"
+    )
+    return encoding, _digest(identity.encode(), params, person=b"file")
+
+
+@dataclass
+class CachedVariant:
+    """An encoded response body stored in a `VariantCache`."""
+
+    body: bytes
+    hits: int = 0
+    # Whether the body was recompressed at the background quality.
+    upgraded: bool = False
+
+
+class VariantCache(ABC):
+    """Base class for caches of encoded response bodies."""
+
+    max_entry_size: int = DEFAULT_MAX_ENTRY_SIZE
+    # Whether `get`, `set` and `open` do I/O, responders then call them on a
+    # worker thread.
+    blocking: bool = False
+
+    @abstractmethod
+    def get(self, key: VariantKey) -> Optional[CachedVariant]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: VariantKey, variant: CachedVariant) -> None:
+        raise NotImplementedError
+
+    def hit(self, key: VariantKey, variant: CachedVariant) -> None:
+        """
+        Count a hit of `variant`, as returned by `get(key)`.
+
+        Caches shared between threads count it under their lock.
+        """
+        variant.hits += 1
+
+    def open(self, key: VariantKey) -> Optional[BinaryIO]:
+        """
+        Open the file backing a variant, so it can be sent with zero-copy.
+
+        Returns None when the variant isn't cached, or the cache doesn't
+        store variants in files.
+        """
+        return None
+
+
+class MemoryVariantCache(VariantCache):
+    """
+    In-process LRU cache bounded by the total size of cached bodies.
+
+    Safe to share between threads, e.g. event loops in several threads of a
+    free-threaded interpreter.
+    """
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        max_entry_size: int = DEFAULT_MAX_ENTRY_SIZE,
+    ) -> None:
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.size = 0
+        self._entries: OrderedDict[VariantKey, CachedVariant] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: VariantKey) -> Optional[CachedVariant]:
+        with self._lock:
+            variant = self._entries.get(key)
+            if variant is not None:
+                self._entries.move_to_end(key)
+            return variant
+
+    def set(self, key: VariantKey, variant: CachedVariant) -> None:
+        if len(variant.body) > self.max_entry_size:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+
+            self._entries[key] = variant
+            self.size += len(variant.body)
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def hit(self, key: VariantKey, variant: CachedVariant) -> None:
+        # Variants are shared by the requests hitting them.
+        with self._lock:
+            variant.hits += 1
+
+
+class DiskVariantCache(VariantCache):
+    """
+    Cache storing encoded bodies as files in `directory`.
+
+    The directory can be shared between workers. Entries are written
+    atomically, and once the directory grows past `max_size` the least
+    recently used files are removed, down to `EVICTION_RATIO` of it. The
+    size is tracked as entries are written, the directory is only scanned
+    to evict, which also accounts for the entries of other workers. Hit
+    counts are tracked per process.
+    """
+
+    blocking = True
+    # Evicting leaves room for a few more entries before the next scan.
+    EVICTION_RATIO = 0.9
+
+    def __init__(
+        self,
+        directory: str,
+        max_size: int = DEFAULT_DISK_CACHE_SIZE,
+        max_entry_size: int = DEFAULT_DISK_MAX_ENTRY_SIZE,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self._hits: dict[VariantKey, int] = {}
+        self._upgraded: set[VariantKey] = set()
+        self._hits_lock = threading.Lock()
+        self.size = sum(size for _, size, _ in self._scan())
+        # Guards `size`, entries are written from worker threads.
+        self._lock = threading.Lock()
+
+    def path(self, key: VariantKey) -> str:
+        encoding, digest = key
+        return os.path.join(self.directory, f"{digest.hex()}.{encoding}")
+
+    def get(self, key: VariantKey) -> Optional[CachedVariant]:
+        file = self.open(key)
+        if file is None:
+            return None
+        with file:
+            body = file.read()
+
+        # Variants are rebuilt on each lookup, so count the hit here, the
+        # caller counts it in its own copy with `hit`.
+        with self._hits_lock:
+            hits = self._hits.get(key, 0)
+            self._hits[key] = hits + 1
+        return CachedVariant(
+            body=body, hits=hits, upgraded=key in self._upgraded
+        )
+
+    def hit(self, key: VariantKey, variant: CachedVariant) -> None:
+        with self._hits_lock:
+            variant.hits += 1
+
+    def open(self, key: VariantKey) -> Optional[BinaryIO]:
+        path = self.path(key)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            # Mark the entry as recently used.
+            os.utime(path)
+        except FileNotFoundError:  # pragma: no cover
+            pass
+        return file
+
+    def set(self, key: VariantKey, variant: CachedVariant) -> None:
+        if len(variant.body) > self.max_entry_size:
+            return
+
+        if variant.upgraded:
+            self._upgraded.add(key)
+        path = self.path(key)
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(variant.body)
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        with self._lock:
+            self.size += len(variant.body) - replaced
+            over = self.size > self.max_size
+        if over:
+            self.evict()
+
+    def _scan(self) -> list[tuple[int, int, str]]:
+        """Modification time, size and path of the entries."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # pragma: no cover
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def evict(self) -> None:
+        """Remove the least recently used entries over `max_size`."""
+        entries = self._scan()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_size * self.EVICTION_RATIO
+        entries.sort()
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:  # pragma: no cover
+                pass
+            size -= entry_size
+        with self._lock:
+            self.size = size
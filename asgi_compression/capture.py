@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import typing
+import uuid
+from dataclasses import dataclass, field
+
+from .base import PRE_ENCODED_KEY
+from .types import ASGIApp, Headers, Message, Receive, Scope, Send
+
+CAPTURE_VERSION = 1
+CAPTURE_SUFFIX = ".capture"
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_MAX_CAPTURED_BODY_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_CAPTURE_SIZE = 1024 * 1024 * 1024
+
+
+@dataclass
+class CapturedResponse:
+    """An uncompressed response body, as the app sent it."""
+
+    content_type: str
+    accept_encoding: str
+    # Body messages, so streaming responses are replayed chunk by chunk.
+    chunks: list[bytes] = field(default_factory=list)
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self.chunks)
+
+    @property
+    def streaming(self) -> bool:
+        return len(self.chunks) > 1
+
+
+class TrafficCapture:
+    """
+    Records a sample of responses to `directory` for offline replay.
+
+    Each sampled response is stored in its own file along with its
+    Content-Type, chunk boundaries and the client's Accept-Encoding, see
+    `python -m asgi_compression simulate`. Responses the app already encoded,
+    zero-copy file responses and bodies over `max_body_size` are skipped, and
+    nothing more is recorded once the directory holds `max_size` bytes.
+    Files are written in the background, `drain` waits for them.
+
+    Captured bodies are stored as is, keep them as private as the responses.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        max_body_size: int = DEFAULT_MAX_CAPTURED_BODY_SIZE,
+        max_size: int = DEFAULT_MAX_CAPTURE_SIZE,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_body_size = max_body_size
+        self.max_size = max_size
+        self.size = sum(
+            entry.stat().st_size
+            for entry in os.scandir(directory)
+            if entry.name.endswith(CAPTURE_SUFFIX)
+        )
+        # Writes in progress, they run on the loop's default executor.
+        self.pending: set[asyncio.Future[None]] = set()
+        self._lock = threading.Lock()
+
+    def sample(self, app: ASGIApp, accept_encoding: str) -> ASGIApp:
+        """`app`, wrapped to record its response if it is sampled."""
+        if self.size >= self.max_size or random.random() >= self.sample_rate:
+            return app
+
+        async def recorder(scope: Scope, receive: Receive, send: Send) -> None:
+            response: typing.Optional[CapturedResponse] = None
+            size = 0
+
+            async def capture_send(message: Message) -> None:
+                nonlocal response, size
+                message_type = message["type"]
+                if message_type == "http.response.start":
+                    headers = Headers(raw=message["headers"])
+                    if (
+                        "content-encoding" not in headers
+                        and PRE_ENCODED_KEY not in message
+                    ):
+                        response = CapturedResponse(
+                            content_type=headers.get("content-type", ""),
+                            accept_encoding=accept_encoding,
+                        )
+                elif message_type == "http.response.body":
+                    if response is not None:
+                        body = message.get("body", b"")
+                        size += len(body)
+                        if size > self.max_body_size:
+                            response = None
+                        else:
+                            response.chunks.append(bytes(body))
+                else:
+                    response = None
+                await send(message)
+
+            await app(scope, receive, capture_send)
+            if response is not None:
+                self._save_later(response)
+
+        return recorder
+
+    def _save_later(self, response: CapturedResponse) -> None:
+        """Save `response` in the background, off the request path."""
+        future = asyncio.get_running_loop().run_in_executor(
+            None, self.save, response
+        )
+        with self._lock:
+            self.pending.add(future)
+
+        def done(future: "asyncio.Future[None]") -> None:
+            with self._lock:
+                self.pending.discard(future)
+            if not future.cancelled():
+                # A failed write only loses a sample.
+                future.exception()
+
+        future.add_done_callback(done)
+
+    async def drain(self) -> None:
+        """Wait for the captures being written."""
+        with self._lock:
+            pending = list(self.pending)
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def save(self, response: CapturedResponse) -> None:
+        header = {
+            "version": CAPTURE_VERSION,
+            "content_type": response.content_type,
+            "accept_encoding": response.accept_encoding,
+            "chunks": [len(chunk) for chunk in response.chunks],
+        }
+        data = json.dumps(header).encode() + b"\n" + response.body
+        with self._lock:
+            if self.size >= self.max_size:
+                return
+            self.size += len(data)
+
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(
+                temporary,
+                os.path.join(self.directory, uuid.uuid4().hex + CAPTURE_SUFFIX),
+            )
+        except BaseException:
+            os.unlink(temporary)
+            with self._lock:
+                self.size -= len(data)
+            raise
+
+
+def load_captures(directory: str) -> typing.Iterator[CapturedResponse]:
+    """Responses recorded by a `TrafficCapture` in `directory`."""
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(CAPTURE_SUFFIX):
+            continue
+        with open(os.path.join(directory, name), "rb") as file:
+            header = json.loads(file.readline())
+            if header.get("version") != CAPTURE_VERSION:
+                continue
+            chunks = [file.read(size) for size in header["chunks"]]
+        yield CapturedResponse(
+            content_type=header["content_type"],
+            accept_encoding=header["accept_encoding"],
+            chunks=chunks,
+        )
@@ -0,0 +1,100 @@
+import typing
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+from .base import CompressionAlgorithm, CompressionResponder, ContentEncoding
+from .types import ASGIApp, Receive, Scope, Send
+
+
+class AsyncCompressor(ABC):
+    """
+    Compressor of a single response body with an asynchronous API.
+
+    For compressors with native async APIs, or that run out of process, e.g.
+    on a compression sidecar over a Unix socket or in a subprocess pool.
+    Chunks are compressed one at a time, in order.
+    """
+
+    @abstractmethod
+    async def compress_chunk(self, data: bytes) -> bytes:
+        """Compress a chunk, returns the output available so far."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def finish(self) -> bytes:
+        """End the body, returns the rest of the output."""
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        """Release the compressor of a body abandoned before `finish`."""
+
+
+class AsyncCompressionResponder(CompressionResponder):
+    """Responder that compresses with an `AsyncCompressor`."""
+
+    __slots__ = ("content_encoding", "create_compressor")
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int,
+        content_encoding: ContentEncoding,
+        create_compressor: typing.Callable[[], AsyncCompressor],
+    ) -> None:
+        super().__init__(app, minimum_size)
+        self.content_encoding = content_encoding
+        self.create_compressor = create_compressor
+
+    async def __call__(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.compressor is not None:
+                compressor, self.compressor = self.compressor, None
+                await compressor.aclose()
+
+    async def compress(
+        self,
+        body: bytes,
+        *,
+        more_body: bool,
+        offload: bool = False,
+    ) -> bytes:
+        if self.compressor is None:
+            self.compressor = self.create_compressor()
+        compressor = self.compressor
+
+        output = await compressor.compress_chunk(body) if body else b""
+        if not more_body:
+            self.compressor = None
+            output += await compressor.finish()
+        return output
+
+
+@dataclass
+class AsyncCompressionAlgorithm(CompressionAlgorithm):
+    """
+    Base class for algorithms compressing with an `AsyncCompressor`.
+
+    Subclasses default `type` to their encoding, registering it with
+    `ContentEncoding.register` if it isn't a built-in one, and implement
+    `create_compressor`.
+    """
+
+    @abstractmethod
+    def create_compressor(self) -> AsyncCompressor:
+        """Create the compressor of a response body."""
+        raise NotImplementedError
+
+    def create_responder(self, app: ASGIApp) -> AsyncCompressionResponder:
+        return AsyncCompressionResponder(
+            app=app,
+            minimum_size=self.minimum_size,
+            content_encoding=self.type,
+            create_compressor=self.create_compressor,
+        )
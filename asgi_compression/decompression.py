@@ -0,0 +1,176 @@
+import typing
+from abc import ABC, abstractmethod
+
+from .types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+DECOMPRESSED_CHUNK_SIZE = 64 * 1024
+
+
+class DecompressionError(Exception):
+    """Raised when a request body can't be decompressed."""
+
+    status_code = 400
+
+
+class DecompressedSizeError(DecompressionError):
+    """Raised when a decompressed request body exceeds the allowed size."""
+
+    status_code = 413
+
+
+class Decompressor(ABC):
+    """Incremental decompressor for a single content-coded stream."""
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> typing.Iterator[bytes]:
+        """Decompress `data`, yielding output in bounded pieces.
+
+        Pieces are produced lazily, so the caller controls how much
+        decompressed data is held in memory at once.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def finish(self) -> None:
+        """Check that the compressed stream was complete."""
+        raise NotImplementedError
+
+
+class RequestDecompressor:
+    """
+    Wraps an ASGI app, decompressing the request body on `receive`.
+
+    Decompressed data is handed to the app chunk by chunk as it is requested.
+    If decompression fails or the body grows past `max_size` before the app
+    started responding, an error response is sent and anything the app sends
+    afterwards is discarded.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        decompressor: Decompressor,
+        max_size: int = DEFAULT_MAX_DECOMPRESSED_SIZE,
+    ) -> None:
+        self.app = app
+        self.decompressor = decompressor
+        self.max_size = max_size
+        self._receive: typing.Optional[Receive] = None
+        self._send: typing.Optional[Send] = None
+        self._pieces: typing.Optional[typing.Iterator[bytes]] = None
+        self._more_body = True
+        self._done = False
+        self._size = 0
+        self._response_started = False
+        self._error_sent = False
+
+    async def __call__(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        self._receive = receive
+        self._send = send
+
+        scope = dict(scope)
+        scope["headers"] = [
+            (key, value)
+            for key, value in scope["headers"]
+            if key.lower() not in (b"content-encoding", b"content-length")
+        ]
+        try:
+            await self.app(scope, self.receive, self.send)
+        except DecompressionError:
+            if not self._error_sent:
+                raise
+
+    async def receive(self) -> Message:
+        assert self._receive is not None
+        while True:
+            if self._pieces is not None:
+                try:
+                    piece = next(self._pieces, None)
+                    if piece is None and not self._more_body:
+                        self.decompressor.finish()
+                except DecompressionError as exc:
+                    await self._fail(exc)
+                    raise
+                except Exception as exc:
+                    error = DecompressionError(
+                        "Invalid compressed request body"
+                    )
+                    await self._fail(error)
+                    raise error from exc
+
+                if piece is not None:
+                    self._size += len(piece)
+                    if self._size > self.max_size:
+                        error = DecompressedSizeError(
+                            "Decompressed request body is too large"
+                        )
+                        await self._fail(error)
+                        raise error
+                    return {
+                        "type": "http.request",
+                        "body": piece,
+                        "more_body": True,
+                    }
+
+                self._pieces = None
+                if not self._more_body:
+                    self._done = True
+                    return {
+                        "type": "http.request",
+                        "body": b"",
+                        "more_body": False,
+                    }
+
+            if self._done:
+                return await self._receive()
+
+            message = await self._receive()
+            if message["type"] != "http.request":
+                return message
+
+            self._more_body = message.get("more_body", False)
+            self._pieces = self.decompressor.decompress(
+                message.get("body", b"")
+            )
+
+    async def send(self, message: Message) -> None:
+        assert self._send is not None
+        if self._error_sent:
+            return
+        if message["type"] == "http.response.start":
+            self._response_started = True
+        await self._send(message)
+
+    async def _fail(self, error: DecompressionError) -> None:
+        if self._response_started or self._error_sent:
+            return
+        assert self._send is not None
+        self._error_sent = True
+        await send_error_response(self._send, error.status_code, str(error))
+
+
+async def send_error_response(
+    send: Send,
+    status_code: int,
+    detail: str,
+    headers: typing.Optional[list[tuple[bytes, bytes]]] = None,
+) -> None:
+    body = detail.encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                *(headers or []),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
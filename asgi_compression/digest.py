@@ -0,0 +1,15 @@
+import base64
+import hashlib
+
+# ASGI extension servers advertise when they can send HTTP trailers.
+TRAILERS_EXTENSION = "http.response.trailers"
+
+
+def format_content_digest(digest: bytes) -> str:
+    """Content-Digest field value of a SHA-256 digest (RFC 9530)."""
+    return f"sha-256=:{base64.b64encode(digest).decode()}:"
+
+
+def content_digest(body: bytes) -> str:
+    """Content-Digest field value of a complete body."""
+    return format_content_digest(hashlib.sha256(body).digest())
@@ -0,0 +1,55 @@
+import hashlib
+import re
+from enum import Enum
+
+ENTITY_TAG_RE = re.compile(r'(?:W/)?"[^"]*"|\*')
+
+
+class ETagMode(Enum):
+    """How the app's ETag is derived for an encoded response."""
+
+    # `"abc"` becomes `"abc-gzip"`, a distinct validator per encoding.
+    SUFFIX = "suffix"
+    # `"abc"` becomes `W/"abc"`, all encodings share a weak validator.
+    WEAK = "weak"
+
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def encode_etag(
+    etag: str, encoding: str, mode: ETagMode, params: str = ""
+) -> str:
+    """
+    Derive the ETag of the `encoding` variant of a representation.
+
+    With `ETagMode.SUFFIX`, a digest of the algorithm `params` is appended
+    too when given, so that variants compressed with other parameters, a
+    different byte sequence, get a different tag.
+    """
+    etag = etag.strip()
+    weak = etag.startswith("W/")
+    opaque = _opaque_tag(etag)
+
+    if mode == ETagMode.WEAK:
+        return f"W/{opaque}"
+
+    if params:
+        digest = hashlib.blake2b(params.encode(), digest_size=4).hexdigest()
+        encoding = f"{encoding}-{digest}"
+    if len(opaque) >= 2 and opaque.endswith('"'):
+        opaque = f'{opaque[:-1]}-{encoding}"'
+    else:
+        opaque = f"{opaque}-{encoding}"
+    return f"W/{opaque}" if weak else opaque
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of `etag` against an If-None-Match header value."""
+    opaque = _opaque_tag(etag)
+    for candidate in ENTITY_TAG_RE.findall(if_none_match):
+        if candidate == "*" or _opaque_tag(candidate) == opaque:
+            return True
+    return False
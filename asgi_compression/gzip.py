@@ -1,14 +1,85 @@
-import gzip
-import io
+import asyncio
+import struct
+import time
+import typing
+import zlib
 from dataclasses import dataclass
+from typing import Optional
 
+from .adaptive import AdaptiveEffort, EffortController
 from .base import CompressionAlgorithm, CompressionResponder, ContentEncoding
+from .decompression import (
+    DECOMPRESSED_CHUNK_SIZE,
+    DecompressionError,
+    Decompressor,
+)
+from .pool import ThreadBudget, get_default_budget
 from .types import ASGIApp, Receive, Scope, Send
 
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# Deflate back-references reach at most 32 KiB back.
+DEFLATE_WINDOW_SIZE = 32 * 1024
+DEFAULT_PARALLEL_BLOCK_SIZE = 128 * 1024
+
+
+def gzip_header(compresslevel: int, mtime: Optional[int] = None) -> bytes:
+    """
+    Gzip member header, as written by `gzip.GzipFile`, with the current
+    time unless `mtime` is given.
+    """
+    if compresslevel == zlib.Z_BEST_COMPRESSION:
+        extra_flags = 2
+    elif compresslevel == zlib.Z_BEST_SPEED:
+        extra_flags = 4
+    else:
+        extra_flags = 0
+    # Magic, deflate, no flags, mtime, extra flags, unknown OS.
+    if mtime is None:
+        mtime = int(time.time())
+    return struct.pack("<BBBBLBB", 0x1F, 0x8B, 8, 0, mtime, extra_flags, 255)
+
+
+def compress_block(
+    block: bytes,
+    compresslevel: int,
+    zdict: bytes,
+    last: bool,
+) -> bytes:
+    """
+    Compress one block of a parallel deflate stream.
+
+    The compressor is primed with the tail of the previous block, so
+    back-references across the block boundary still work, and the output is
+    sync flushed to end on a byte boundary, so blocks can be concatenated.
+    """
+    if zdict:
+        compressor = zlib.compressobj(
+            compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict
+        )
+    else:
+        compressor = zlib.compressobj(
+            compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS
+        )
+    return compressor.compress(block) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    )
+
 
 class GzipResponder(CompressionResponder):
     """Responder that applies gzip compression."""
 
+    __slots__ = (
+        "compresslevel",
+        "parallel_threshold",
+        "parallel_block_size",
+        "parallel_threads",
+        "thread_budget",
+        "crc",
+        "size",
+        "window",
+        "level_changed",
+    )
+
     content_encoding = ContentEncoding.GZIP
 
     def __init__(
@@ -16,15 +87,28 @@ class GzipResponder(CompressionResponder):
         app: ASGIApp,
         minimum_size: int,
         compresslevel: int = 9,
+        parallel_threshold: Optional[int] = None,
+        parallel_block_size: int = DEFAULT_PARALLEL_BLOCK_SIZE,
+        parallel_threads: int = 0,
+        thread_budget: Optional[ThreadBudget] = None,
+        adaptive_effort: Optional[AdaptiveEffort] = None,
     ) -> None:
         super().__init__(app, minimum_size)
 
-        self.gzip_buffer = io.BytesIO()
-        self.gzip_file = gzip.GzipFile(
-            mode="wb",
-            fileobj=self.gzip_buffer,
-            compresslevel=compresslevel,
-        )
+        self.compresslevel = compresslevel
+        self.parallel_threshold = parallel_threshold
+        self.parallel_block_size = parallel_block_size
+        self.parallel_threads = parallel_threads
+        self.thread_budget = thread_budget
+        self.crc = 0
+        self.size = 0
+        # Last 32 KiB of input, only tracked when parallel compression or
+        # adaptive effort is enabled, to prime the compressor that continues
+        # after it.
+        self.window = b""
+        self.level_changed = False
+        if adaptive_effort is not None:
+            self._effort = EffortController(adaptive_effort, compresslevel)
 
     async def __call__(
         self,
@@ -32,18 +116,193 @@ class GzipResponder(CompressionResponder):
         receive: Receive,
         send: Send,
     ) -> None:
-        with self.gzip_buffer, self.gzip_file:
+        try:
             await super().__call__(scope, receive, send)
+        finally:
+            self.compressor = None
+
+    async def compress(
+        self,
+        body: bytes,
+        *,
+        more_body: bool,
+        offload: bool = False,
+    ) -> bytes:
+        if (
+            self.parallel_threshold is None
+            or len(body) < self.parallel_threshold
+            # Nothing to split, e.g. the empty chunk ending a stream.
+            or not body
+        ):
+            return await super().compress(
+                body, more_body=more_body, offload=offload
+            )
+
+        budget = self.thread_budget or get_default_budget()
+        threads = budget.acquire(self.parallel_threads or budget.max_threads)
+        if not threads and not self.deterministic:
+            return await super().compress(
+                body, more_body=more_body, offload=offload
+            )
+        try:
+            return await self.apply_parallel_compression(
+                body, more_body=more_body, budget=budget, threads=threads
+            )
+        finally:
+            budget.release(threads)
 
     def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
-        self.gzip_file.write(body)
+        output = []
+        if self.compressor is None:
+            output.append(self._header())
+            self.compressor = zlib.compressobj(
+                self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS
+            )
+        elif self.level_changed:
+            # End the output so far on a byte boundary, and continue the
+            # deflate stream at the new level.
+            output.append(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+            self.compressor = self._continuation()
+        self.level_changed = False
+
+        output.append(self.compressor.compress(body))
+        self.crc = zlib.crc32(body, self.crc)
+        self.size += len(body)
+        if more_body and (
+            self.parallel_threshold is not None or self._effort is not None
+        ):
+            # Only the end of the chunk can reach the window.
+            window = self.window + bytes(body[-DEFLATE_WINDOW_SIZE:])
+            self.window = window[-DEFLATE_WINDOW_SIZE:]
+
         if not more_body:
-            self.gzip_file.close()
+            output.append(self.compressor.flush())
+            output.append(self._trailer())
+            # Done, don't keep the compressor until the app returns.
+            self.compressor = None
+            self.window = b""
+        return b"".join(output)
+
+    async def apply_parallel_compression(
+        self,
+        body: bytes,
+        *,
+        more_body: bool,
+        budget: ThreadBudget,
+        threads: int,
+    ) -> bytes:
+        """
+        Compress `body` in blocks on up to `threads` pool threads, pigz style.
+
+        The result is a single deflate stream, each block primed with the
+        32 KiB before it, so the output is plain gzip for any client and
+        barely larger than serial compression. In deterministic mode,
+        bodies no thread could be granted for are compressed in the same
+        blocks on the event loop, so the output doesn't depend on the load.
+        """
+        output = []
+        if self.compressor is None:
+            output.append(self._header())
+        else:
+            # End the serial output so far on a byte boundary.
+            output.append(self.compressor.flush(zlib.Z_SYNC_FLUSH))
 
-        body = self.gzip_buffer.getvalue()
-        self.gzip_buffer.seek(0)
-        self.gzip_buffer.truncate()
-        return body
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(threads)
+
+        async def run(
+            func: typing.Callable[..., typing.Any], *args: typing.Any
+        ) -> typing.Any:
+            if not threads:
+                return func(*args)
+            async with semaphore:
+                return await loop.run_in_executor(budget.executor, func, *args)
+
+        block_size = self.parallel_block_size
+        offsets = range(0, len(body), block_size)
+        jobs = [
+            run(
+                compress_block,
+                body[offset : offset + block_size],
+                self.compresslevel,
+                bytes(body[max(0, offset - DEFLATE_WINDOW_SIZE) : offset])
+                if offset
+                else self.window,
+                not more_body and offset == offsets[-1],
+            )
+            for offset in offsets
+        ]
+        crc, *blocks = await asyncio.gather(
+            run(zlib.crc32, body, self.crc), *jobs
+        )
+        output.extend(blocks)
+        self.crc = crc
+        self.size += len(body)
+        # Copied, the body may be a view of a memory-mapped file.
+        self.window = bytes(body[-DEFLATE_WINDOW_SIZE:])
+
+        if more_body:
+            # Continue the stream serially, primed with the last block.
+            self.compressor = self._continuation()
+            self.level_changed = False
+        else:
+            output.append(self._trailer())
+        return b"".join(output)
+
+    def set_level(self, level: int) -> None:
+        if level != self.compresslevel:
+            self.compresslevel = level
+            self.level_changed = True
+
+    def _continuation(self) -> typing.Any:
+        """Compressor continuing the deflate stream after `window`."""
+        if not self.window:
+            return zlib.compressobj(
+                self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS
+            )
+        return zlib.compressobj(
+            self.compresslevel,
+            zlib.DEFLATED,
+            -zlib.MAX_WBITS,
+            zdict=self.window,
+        )
+
+    def _header(self) -> bytes:
+        # The modification time is that of the response, unless the output
+        # must not depend on when it's produced.
+        return gzip_header(
+            self.compresslevel, 0 if self.deterministic else None
+        )
+
+    def _trailer(self) -> bytes:
+        return struct.pack("<LL", self.crc & 0xFFFFFFFF, self.size & 0xFFFFFFFF)
+
+
+class GzipDecompressor(Decompressor):
+    """Incremental gzip decompressor, supporting multi-member streams."""
+
+    def __init__(self) -> None:
+        self._decompressor = zlib.decompressobj(GZIP_WBITS)
+
+    def decompress(self, data: bytes) -> typing.Iterator[bytes]:
+        while True:
+            decompressor = self._decompressor
+            chunk = decompressor.decompress(data, DECOMPRESSED_CHUNK_SIZE)
+            if decompressor.eof:
+                data = decompressor.unused_data
+                if data:
+                    self._decompressor = zlib.decompressobj(GZIP_WBITS)
+            else:
+                data = decompressor.unconsumed_tail
+
+            if chunk:
+                yield chunk
+            if not data and len(chunk) < DECOMPRESSED_CHUNK_SIZE:
+                return
+
+    def finish(self) -> None:
+        if not self._decompressor.eof:
+            raise DecompressionError("Truncated gzip request body")
 
 
 @dataclass
@@ -52,10 +311,29 @@ class GzipAlgorithm(CompressionAlgorithm):
 
     type: ContentEncoding = ContentEncoding.GZIP
     compresslevel: int = 9
+    # Bodies, or streamed chunks, of at least this many bytes are compressed
+    # in parallel blocks, `None` disables parallel compression.
+    parallel_threshold: Optional[int] = None
+    parallel_block_size: int = DEFAULT_PARALLEL_BLOCK_SIZE
+    # Threads per response, 0 means as many as the budget allows.
+    parallel_threads: int = 0
+    # Worker-wide thread budget, defaults to the shared budget.
+    thread_budget: Optional[ThreadBudget] = None
+    # Adapts `compresslevel` of streaming responses to the client's
+    # throughput, within these bounds. Disabled while None.
+    adaptive_effort: Optional[AdaptiveEffort] = None
 
     def create_responder(self, app: ASGIApp) -> GzipResponder:
         return GzipResponder(
             app=app,
             minimum_size=self.minimum_size,
             compresslevel=self.compresslevel,
+            parallel_threshold=self.parallel_threshold,
+            parallel_block_size=self.parallel_block_size,
+            parallel_threads=self.parallel_threads,
+            thread_budget=self.thread_budget,
+            adaptive_effort=self.adaptive_effort,
         )
+
+    def create_decompressor(self) -> GzipDecompressor:
+        return GzipDecompressor()
@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+
+from .base import ContentEncoding
+from .types import Scope
+
+
+@dataclass
+class CompressionSummary:
+    """Summary of the compression work done for a single response."""
+
+    encoding: ContentEncoding
+    bytes_in: int = 0
+    bytes_out: int = 0
+    duration_ns: int = 0
+    chunks: int = 0
+
+
+class CompressionHooks:
+    """
+    Per-request instrumentation hooks.
+
+    Subclass and override the methods you are interested in. All hooks are
+    called from the task serving the request, so context variables set in
+    `on_start` are visible in `on_chunk` and `on_finish`.
+    """
+
+    def on_start(self, scope: Scope, encoding: ContentEncoding) -> None:
+        """Called before the application is invoked."""
+
+    def on_chunk(self, in_bytes: int, out_bytes: int, ns: int) -> None:
+        """Called after every body chunk passed through the compressor."""
+
+    def on_finish(self, summary: CompressionSummary) -> None:
+        """Called once the application has finished, even if it raised."""
@@ -7,6 +7,8 @@ from .types import ASGIApp
 class IdentityResponder(CompressionResponder):
     """Responder that doesn't apply any compression."""
 
+    __slots__ = ()
+
     content_encoding = ContentEncoding.IDENTITY
 
     def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
@@ -0,0 +1,246 @@
+import contextlib
+import mmap
+import os
+import struct
+import sys
+import threading
+import typing
+
+from .base import ContentEncoding
+from .hooks import CompressionHooks, CompressionSummary
+
+
+class CompressionMetrics(CompressionHooks):
+    """
+    Hooks implementation aggregating compression counters in-process.
+
+    Counters are updated under a lock, so one instance can be shared by
+    middlewares running in several threads.
+    """
+
+    def __init__(self) -> None:
+        self.responses = 0
+        self.compressed_responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.duration_ns = 0
+        self._lock = threading.Lock()
+
+    @property
+    def bypassed_responses(self) -> int:
+        return self.responses - self.compressed_responses
+
+    def on_finish(self, summary: CompressionSummary) -> None:
+        with self._lock:
+            self._record(summary)
+
+    def _record(self, summary: CompressionSummary) -> None:
+        self.responses += 1
+        if summary.encoding != ContentEncoding.IDENTITY:
+            self.compressed_responses += 1
+        self.bytes_in += summary.bytes_in
+        self.bytes_out += summary.bytes_out
+        self.duration_ns += summary.duration_ns
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "responses": self.responses,
+                "compressed_responses": self.compressed_responses,
+                "bypassed_responses": self.bypassed_responses,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "duration_ns": self.duration_ns,
+            }
+
+
+# Layout of a shared metrics file: a header, then one slot per worker holding
+# its pid followed by its counters, all unsigned 64-bit little-endian.
+SHARED_METRICS_MAGIC = b"ACMS"
+SHARED_METRICS_VERSION = 1
+SHARED_METRICS_FIELDS = (
+    "responses",
+    "compressed_responses",
+    "bytes_in",
+    "bytes_out",
+    "duration_ns",
+)
+DEFAULT_SHARED_METRICS_SLOTS = 256
+_HEADER = struct.Struct("<4sII")
+_SLOT = struct.Struct(f"<Q{len(SHARED_METRICS_FIELDS)}Q")
+
+
+@contextlib.contextmanager
+def _locked(fd: int) -> typing.Iterator[None]:
+    """Hold an exclusive lock on a file, where the platform supports it."""
+    if sys.platform == "win32":  # pragma: no cover
+        yield
+        return
+
+    import fcntl
+
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # pragma: no cover
+        return True
+    return True
+
+
+def _slot_offset(index: int) -> int:
+    return _HEADER.size + index * _SLOT.size
+
+
+class SharedMetrics(CompressionMetrics):
+    """
+    Compression counters shared by all workers through a memory-mapped file.
+
+    Each worker process claims a slot in the file the first time it records
+    a response, and from then on only writes its own slot, so recording
+    takes no locks and no IPC. Any process can read the totals of all
+    workers with `aggregate()` or `read_shared_metrics()`, e.g. the
+    `python -m asgi_compression stats` command.
+
+    A slot left by a dead worker is reused by the next one along with its
+    counters, so totals don't go backwards when workers are restarted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        slots: int = DEFAULT_SHARED_METRICS_SLOTS,
+    ) -> None:
+        super().__init__()
+        self.path = path
+        self.slots = slots
+        self._pid = 0
+        self._offset = 0
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            with _locked(fd):
+                if os.fstat(fd).st_size == 0:
+                    os.ftruncate(fd, _slot_offset(slots))
+                    os.write(
+                        fd,
+                        _HEADER.pack(
+                            SHARED_METRICS_MAGIC, SHARED_METRICS_VERSION, slots
+                        ),
+                    )
+                    os.lseek(fd, 0, os.SEEK_SET)
+                self.slots = _read_header(os.read(fd, _HEADER.size))
+            self._mmap = mmap.mmap(fd, _slot_offset(self.slots))
+        finally:
+            os.close(fd)
+
+    def _record(self, summary: CompressionSummary) -> None:
+        if self._pid != os.getpid():
+            # First response of this worker, or the metrics were created
+            # before the server forked it.
+            self._attach()
+        super()._record(summary)
+        _SLOT.pack_into(
+            self._mmap,
+            self._offset,
+            self._pid,
+            self.responses,
+            self.compressed_responses,
+            self.bytes_in,
+            self.bytes_out,
+            self.duration_ns,
+        )
+
+    def _attach(self) -> None:
+        """Claim a slot for the current process."""
+        pid = os.getpid()
+        with open(self.path, "rb") as file, _locked(file.fileno()):
+            claimed = None
+            for index in range(self.slots):
+                slot_pid = _SLOT.unpack_from(self._mmap, _slot_offset(index))[0]
+                if slot_pid == pid:
+                    claimed = index
+                    break
+                if claimed is None and (
+                    slot_pid == 0 or not _is_alive(slot_pid)
+                ):
+                    claimed = index
+            if claimed is None:
+                raise RuntimeError(
+                    f"No free slot in {self.path}, all {self.slots} are used "
+                    "by running workers"
+                )
+
+            self._offset = _slot_offset(claimed)
+            _, *counters = _SLOT.unpack_from(self._mmap, self._offset)
+            for field, value in zip(SHARED_METRICS_FIELDS, counters):
+                setattr(self, field, value)
+            _SLOT.pack_into(self._mmap, self._offset, pid, *counters)
+            self._pid = pid
+
+    def aggregate(self) -> dict[str, int]:
+        """Counters summed over all workers."""
+        return _aggregate(self._mmap, self.slots)
+
+    def close(self) -> None:
+        self._mmap.close()
+
+
+def _read_header(header: bytes) -> int:
+    """Validate the header of a shared metrics file, returns its slots."""
+    magic, version, slots = _HEADER.unpack(header)
+    if magic != SHARED_METRICS_MAGIC or version != SHARED_METRICS_VERSION:
+        raise ValueError("Not a shared metrics file")
+    return slots
+
+
+def _workers(
+    buffer: typing.Union[mmap.mmap, bytes], slots: int
+) -> list[dict[str, int]]:
+    workers = []
+    for index in range(slots):
+        pid, *counters = _SLOT.unpack_from(buffer, _slot_offset(index))
+        if pid:
+            worker: dict[str, int] = {"pid": pid}
+            worker.update(zip(SHARED_METRICS_FIELDS, counters))
+            workers.append(worker)
+    return workers
+
+
+def _aggregate(
+    buffer: typing.Union[mmap.mmap, bytes], slots: int
+) -> dict[str, int]:
+    workers = _workers(buffer, slots)
+    totals = {
+        field: sum(worker[field] for worker in workers)
+        for field in SHARED_METRICS_FIELDS
+    }
+    totals["bypassed_responses"] = (
+        totals["responses"] - totals["compressed_responses"]
+    )
+    totals["workers"] = len(workers)
+    return totals
+
+
+def read_shared_metrics(path: str) -> dict[str, typing.Any]:
+    """
+    Read a shared metrics file without claiming a slot.
+
+    Returns the `totals` over all workers, and a `workers` list with the
+    counters, pid and liveness of each worker that recorded responses.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    slots = _read_header(data[: _HEADER.size])
+    workers = _workers(data, slots)
+    for worker in workers:
+        worker["alive"] = _is_alive(worker["pid"])
+    return {"totals": _aggregate(data, slots), "workers": workers}
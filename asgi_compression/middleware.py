@@ -1,11 +1,26 @@
-from typing import List, Optional, Union
+from typing import Iterable, List, Mapping, Optional, Union
 
+from .background import BackgroundRecompressor
 from .base import (
     DEFAULT_MINIMUM_SIZE,
+    ENCODING_EXTENSION,
     CompressionAlgorithm,
     CompressionResponder,
+    ContentEncoding,
 )
+from .cache import VariantCache, variant_params
+from .capture import TrafficCapture
+from .decompression import (
+    DEFAULT_MAX_DECOMPRESSED_SIZE,
+    RequestDecompressor,
+    send_error_response,
+)
+from .digest import TRAILERS_EXTENSION
+from .etag import ETagMode
+from .hooks import CompressionHooks
 from .identity import IdentityAlgorithm
+from .profiles import CompressionProfile
+from .rules import compile_path_rules, compile_route_rules
 from .types import ASGIApp, Headers, Receive, Scope, Send
 
 
@@ -22,6 +37,26 @@ class CompressionMiddleware:
         app: ASGIApp,
         algorithms: Optional[List[CompressionAlgorithm]] = None,
         minimum_size: int = DEFAULT_MINIMUM_SIZE,
+        hooks: Optional[CompressionHooks] = None,
+        server_timing: bool = False,
+        decompress_requests: bool = False,
+        max_decompressed_size: int = DEFAULT_MAX_DECOMPRESSED_SIZE,
+        transcode: bool = False,
+        etag_mode: Optional[ETagMode] = None,
+        cache: Optional[VariantCache] = None,
+        recompressor: Optional[BackgroundRecompressor] = None,
+        early_headers: bool = False,
+        max_header_hold: Optional[float] = None,
+        pre_encoded: bool = False,
+        exclude_paths: Optional[Iterable[str]] = None,
+        include_paths: Optional[Iterable[str]] = None,
+        exclude_methods: Iterable[str] = (),
+        profiles: Optional[Mapping[str, List[CompressionAlgorithm]]] = None,
+        capture: Optional[TrafficCapture] = None,
+        deterministic: bool = False,
+        content_digest: bool = False,
+        overlap_sends: bool = False,
+        range_requests: bool = False,
     ) -> None:
         """
         Initialize the compression middleware.
@@ -32,27 +67,123 @@ class CompressionMiddleware:
                 If not provided, no compression will be applied.
             minimum_size: The minimum response size to apply compression.
                 This will be used as the default for algorithms that don't specify it.
+            hooks: Instrumentation hooks called for every HTTP response.
+            server_timing: Whether to add a `Server-Timing: compress;dur=...`
+                header to compressed non-streaming responses.
+            decompress_requests: Whether to transparently decompress request
+                bodies sent with a `Content-Encoding` matching one of the
+                configured algorithms. Other encodings are rejected with 415.
+            max_decompressed_size: The maximum size of a decompressed request
+                body, larger bodies are rejected with 413.
+            transcode: Whether to re-encode responses the app already encoded
+                when their encoding isn't accepted by the client or isn't the
+                preferred one. Only encodings of the configured algorithms
+                are decoded, other responses pass through unchanged.
+            etag_mode: How the app's ETag is derived for compressed responses.
+                When set, GET requests whose If-None-Match matches the
+                derived ETag get a 304 without compressing anything.
+            cache: Cache of encoded bodies of single-message responses, keyed
+                by encoding, algorithm parameters and a digest of the
+                uncompressed body.
+            recompressor: Recompresses hot cached bodies at the algorithm's
+                background quality. Requires `cache`.
+            early_headers: Whether to send the response headers as soon as
+                the app starts the response, when the encoding can already be
+                decided: no Content-Length, or a response passed through
+                unchanged. The body is then compressed as a stream.
+            max_header_hold: Seconds the response headers are held waiting
+                for the first body, after which they are sent and the body is
+                compressed as a stream, or passed through if its
+                Content-Length is below the minimum size.
+            pre_encoded: Whether to publish the negotiated encoding in the
+                `asgi_compression.encoding` scope extension, and accept
+                bodies the app already encoded, marked by setting the
+                `asgi_compression.pre_encoded` key of the start message to
+                their encoding.
+            exclude_paths: Paths whose requests are passed to the app
+                untouched. Rules containing `*`, `?` or `[` are shell-style
+                globs matched against the whole path, others are prefixes.
+            include_paths: When given, only requests to paths matching one
+                of these rules are handled, others are passed through.
+            exclude_methods: Request methods passed to the app untouched.
+                HEAD requests are always passed through.
+            profiles: Algorithms to use instead of `algorithms` for requests
+                to matching paths, keyed by path rule (a prefix or glob, as
+                for `exclude_paths`). The first matching rule wins.
+            capture: Records a sample of the uncompressed responses, to
+                choose algorithms offline with `python -m asgi_compression
+                simulate`.
+            deterministic: Whether encoded bodies depend only on the body,
+                not on when or on which worker they are produced: gzip
+                headers carry no modification time, levels aren't adapted
+                to the client, and parallel gzip and multi-threaded zstd
+                output doesn't depend on the threads available.
+            content_digest: Whether to add a `Content-Digest` (SHA-256) of
+                the encoded body to responses the middleware encodes. It's
+                computed as chunks are produced, and sent as a trailer for
+                streaming responses when the server supports trailers.
+            overlap_sends: Whether to send each encoded chunk of streaming
+                responses in the background, so the app produces the next
+                chunk and it's compressed meanwhile. Pays off when
+                compression doesn't hold the event loop, as with
+                `AsyncCompressionAlgorithm`. An error sending a chunk is
+                raised from the app's next send.
+            range_requests: Whether to answer Range and If-Range requests
+                against the encoded representation, serving 206 responses
+                from cached variants, and advertising `Accept-Ranges` on
+                responses with one. The app then gets neither header for
+                requests whose response may be encoded. Requires `cache`,
+                and implies `deterministic`, so that a range resumed on
+                another worker or after the variant was evicted is taken
+                from the same encoded body. It also implies
+                `ETagMode.SUFFIX`, with a digest of the algorithm's
+                parameters in the tag: If-Range is only honoured for the
+                ETag of the variant, dates are ignored.
         """
 
         self.app = app
         self.minimum_size = minimum_size
+        self.hooks = hooks
+        self.server_timing = server_timing
+        self.decompress_requests = decompress_requests
+        self.max_decompressed_size = max_decompressed_size
+        self.transcode = transcode
+        # If-Range needs a strong validator per variant.
+        self.etag_mode = ETagMode.SUFFIX if range_requests else etag_mode
+        self.cache = cache
+        self.recompressor = recompressor
+        self.early_headers = early_headers
+        self.max_header_hold = max_header_hold
+        self.pre_encoded = pre_encoded
+        self.capture = capture
+        # Ranges must be of the same encoded body whenever it's produced.
+        self.deterministic = deterministic or range_requests
+        self.content_digest = content_digest
+        self.overlap_sends = overlap_sends
+        self.range_requests = range_requests
+        self._bypass_paths = compile_path_rules(exclude_paths, include_paths)
+        self._bypass_methods = frozenset(
+            method.upper() for method in (*exclude_methods, "HEAD")
+        )
+        if recompressor is not None and cache is None:
+            raise ValueError("recompressor requires a cache")
+        if range_requests and cache is None:
+            raise ValueError("range_requests requires a cache")
+        if range_requests and etag_mode == ETagMode.WEAK:
+            raise ValueError("range_requests requires ETagMode.SUFFIX")
 
-        self.algorithms = algorithms or []
-        for algorithm in self.algorithms:
-            try:
-                algorithm.check_available()
-            except ImportError as e:
-                raise e from e
-
+        self._default_profile = CompressionProfile(
+            algorithms or [], minimum_size
+        )
+        self.algorithms = self._default_profile.algorithms
         self._default_algorithm = IdentityAlgorithm(minimum_size=minimum_size)
 
-        # Set minimum_size if not explicitly set in the algorithm
-        for algorithm in self.algorithms:
-            if (
-                algorithm.minimum_size == DEFAULT_MINIMUM_SIZE
-                and minimum_size != DEFAULT_MINIMUM_SIZE
-            ):
-                algorithm.minimum_size = minimum_size
+        profiles = profiles or {}
+        self._profiles = [
+            CompressionProfile(profile_algorithms, minimum_size)
+            for profile_algorithms in profiles.values()
+        ]
+        self._profile_paths = compile_route_rules(list(profiles))
 
     async def __call__(
         self,
@@ -65,18 +196,116 @@ class CompressionMiddleware:
             await self.app(scope, receive, send)
             return
 
+        if scope["method"] in self._bypass_methods or (
+            self._bypass_paths is not None
+            and self._bypass_paths.match(scope["path"])
+        ):
+            await self.app(scope, receive, send)
+            return
+
         headers = Headers(scope=scope)
         accept_encoding = headers.get("Accept-Encoding", "")
 
+        profile = self._default_profile
+        if self._profile_paths is not None:
+            match = self._profile_paths.match(scope["path"])
+            if match is not None:
+                assert match.lastgroup is not None
+                profile = self._profiles[int(match.lastgroup[4:])]
+
+        app = self.app
+        if self.capture is not None:
+            app = self.capture.sample(app, accept_encoding)
+
         # Find the first supported algorithm that matches the Accept-Encoding header
         responder: Union[CompressionResponder, None] = None
-        for algorithm in self.algorithms:
-            if str(algorithm.type.value) in accept_encoding:
-                responder = algorithm.create_responder(self.app)
-                break
+        algorithm = profile.negotiate(accept_encoding)
+        if algorithm is not None:
+            responder = algorithm.create_responder(app)
+            responder.algorithm = algorithm
 
         # If no matching algorithm, use identity (no compression)
         if responder is None:
-            responder = self._default_algorithm.create_responder(self.app)
+            responder = self._default_algorithm.create_responder(app)
+
+        responder.hooks = self.hooks
+        responder.server_timing = self.server_timing
+        if self.transcode:
+            responder.transcode_decoders = profile.decoders
+            responder.accept_encoding = accept_encoding
+        if self.cache is not None:
+            responder.cache = self.cache
+            responder.recompressor = self.recompressor
+        if self.etag_mode is not None:
+            responder.etag_mode = self.etag_mode
+            if scope["method"] == "GET":
+                responder.if_none_match = headers.get("If-None-Match", "")
+            if self.range_requests:
+                responder.etag_params = variant_params(algorithm)
+        responder.early_headers = self.early_headers
+        responder.max_header_hold = self.max_header_hold
+        if self.deterministic:
+            responder.deterministic = True
+        if self.content_digest:
+            responder.content_digest = True
+            responder.digest_trailers = TRAILERS_EXTENSION in (
+                scope.get("extensions") or {}
+            )
+        if self.overlap_sends:
+            responder.overlap_sends = True
+        if (
+            self.range_requests
+            and scope["method"] == "GET"
+            and responder.content_encoding != ContentEncoding.IDENTITY
+        ):
+            responder.range_requests = True
+            responder.request_range = headers.get("Range", "")
+            responder.if_range = headers.get("If-Range", "")
+            if responder.request_range or responder.if_range:
+                # Ranges of the encoded body are served from the cache, the
+                # app sends it whole.
+                scope = {
+                    **scope,
+                    "headers": [
+                        (name, value)
+                        for name, value in scope["headers"]
+                        if name.lower() not in (b"range", b"if-range")
+                    ],
+                }
+        if self.pre_encoded:
+            responder.pre_encoded = True
+            scope = {
+                **scope,
+                "extensions": {
+                    **(scope.get("extensions") or {}),
+                    ENCODING_EXTENSION: {
+                        "encoding": responder.content_encoding.value,
+                        "accepted": profile.accepted(accept_encoding),
+                    },
+                },
+            }
+
+        request_encoding = headers.get("Content-Encoding", "").strip().lower()
+        if self.decompress_requests and request_encoding not in (
+            "",
+            ContentEncoding.IDENTITY.value,
+        ):
+            decoder = profile.decoders.get(request_encoding)
+            if decoder is None:
+                supported = ", ".join(profile.decoders)
+                await send_error_response(
+                    send,
+                    415,
+                    "Unsupported Content-Encoding",
+                    headers=[(b"accept-encoding", supported.encode())],
+                )
+                return
+
+            await RequestDecompressor(
+                app=responder,
+                decompressor=decoder.create_decompressor(),
+                max_size=self.max_decompressed_size,
+            )(scope, receive, send)
+            return
 
         await responder(scope, receive, send)
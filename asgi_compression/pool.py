@@ -0,0 +1,67 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+
+class ThreadBudget:
+    """
+    Worker-wide budget of compression threads.
+
+    Parallel gzip and multi-threaded zstd draw their threads from a shared
+    budget so that concurrent large responses don't oversubscribe the CPU.
+    Requests never wait for threads: `acquire` grants whatever is free,
+    possibly nothing, and the caller falls back to compressing serially.
+    """
+
+    def __init__(self, max_threads: Optional[int] = None) -> None:
+        self.max_threads = max_threads or os.cpu_count() or 1
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def available(self) -> int:
+        return self.max_threads - self.in_use
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread pool shared by all users of this budget."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_threads,
+                    thread_name_prefix="asgi-compression",
+                )
+            return self._executor
+
+    def acquire(self, threads: int) -> int:
+        """Reserve up to `threads` threads, returns the number granted."""
+        with self._lock:
+            granted = max(0, min(threads, self.max_threads - self.in_use))
+            self.in_use += granted
+            return granted
+
+    def release(self, threads: int) -> None:
+        with self._lock:
+            self.in_use -= threads
+            assert self.in_use >= 0, "released more threads than acquired"
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+_default_budget: Optional[ThreadBudget] = None
+_default_budget_lock = threading.Lock()
+
+
+def get_default_budget() -> ThreadBudget:
+    """Budget shared by all algorithms that weren't given their own."""
+    global _default_budget
+    with _default_budget_lock:
+        if _default_budget is None:
+            _default_budget = ThreadBudget()
+        return _default_budget
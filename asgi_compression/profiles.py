@@ -0,0 +1,74 @@
+from dataclasses import replace
+from typing import List, Optional
+
+from .base import DEFAULT_MINIMUM_SIZE, CompressionAlgorithm, ContentEncoding
+
+# Distinct Accept-Encoding values remembered per profile, the cache is
+# cleared once full so odd headers can't grow it without bound.
+MAX_NEGOTIATION_CACHE_SIZE = 256
+
+
+class CompressionProfile:
+    """
+    Algorithms used for a set of routes, prepared once at startup.
+
+    Negotiation results are cached by Accept-Encoding value, as a handful of
+    distinct values make up almost all requests. The cache isn't locked:
+    concurrent misses compute the same result, and single dict operations are
+    atomic on free-threaded builds too.
+    """
+
+    def __init__(
+        self,
+        algorithms: List[CompressionAlgorithm],
+        minimum_size: int = DEFAULT_MINIMUM_SIZE,
+    ) -> None:
+        for algorithm in algorithms:
+            algorithm.check_available()
+
+        # Set minimum_size if not explicitly set in the algorithm, on a copy:
+        # algorithms may be shared by several middlewares and threads.
+        self.algorithms = [
+            replace(algorithm, minimum_size=minimum_size)
+            if algorithm.minimum_size == DEFAULT_MINIMUM_SIZE
+            and minimum_size != DEFAULT_MINIMUM_SIZE
+            else algorithm
+            for algorithm in algorithms
+        ]
+
+        self.decoders = {
+            algorithm.type.value: algorithm
+            for algorithm in self.algorithms
+            if algorithm.type != ContentEncoding.IDENTITY
+            and algorithm.can_decompress
+        }
+        self._negotiated: dict[str, Optional[CompressionAlgorithm]] = {}
+
+    def negotiate(
+        self,
+        accept_encoding: str,
+    ) -> Optional[CompressionAlgorithm]:
+        """First algorithm matching the Accept-Encoding header, if any."""
+        try:
+            return self._negotiated[accept_encoding]
+        except KeyError:
+            pass
+
+        negotiated = None
+        for algorithm in self.algorithms:
+            if str(algorithm.type.value) in accept_encoding:
+                negotiated = algorithm
+                break
+
+        if len(self._negotiated) >= MAX_NEGOTIATION_CACHE_SIZE:
+            self._negotiated.clear()
+        self._negotiated[accept_encoding] = negotiated
+        return negotiated
+
+    def accepted(self, accept_encoding: str) -> List[str]:
+        """Encodings of all algorithms matching the Accept-Encoding header."""
+        return [
+            algorithm.type.value
+            for algorithm in self.algorithms
+            if algorithm.type.value in accept_encoding
+        ]
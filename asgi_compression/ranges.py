@@ -0,0 +1,63 @@
+import re
+from typing import Optional
+
+from .etag import ENTITY_TAG_RE
+
+BYTE_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class RangeNotSatisfiable(Exception):
+    """No byte of the requested range is within the body."""
+
+
+def parse_range(range_header: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    Start and end (exclusive) of the byte range of a body of `size` bytes
+    requested by a Range header.
+
+    Returns None when the header should be ignored and the whole body sent:
+    invalid headers, other units and multiple ranges, which are rarely worth
+    a multipart response.
+    """
+    match = BYTE_RANGE_RE.fullmatch(range_header.replace(" ", "").lower())
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # A suffix: the last bytes of the body.
+        length = int(last)
+        if not length or not size:
+            raise RangeNotSatisfiable
+        return max(0, size - length), size
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = min(int(last) + 1, size) if last else size
+    return start, end
+
+
+def if_range_matches(
+    if_range: str,
+    etag: Optional[str],
+    last_modified: Optional[str],
+) -> bool:
+    """
+    Whether the representation is the one an If-Range header refers to.
+
+    Entity tags use the strong comparison, so weak ETags never match, and
+    dates must be exactly the Last-Modified value.
+    """
+    if_range = if_range.strip()
+    if ENTITY_TAG_RE.fullmatch(if_range):
+        return (
+            etag is not None
+            and not if_range.startswith("W/")
+            and etag.strip() == if_range
+        )
+    return last_modified is not None and last_modified.strip() == if_range
@@ -0,0 +1,102 @@
+import threading
+import typing
+import warnings
+from importlib.metadata import EntryPoint, entry_points
+
+from .base import CompressionAlgorithm, ContentEncoding
+from .brotli import BrotliAlgorithm
+from .gzip import GzipAlgorithm
+from .identity import IdentityAlgorithm
+from .zstd import ZstdAlgorithm
+
+# Entry point group packages declare their algorithms in, named after their
+# encoding, e.g. `lz4 = "package.module:Lz4Algorithm"`.
+ENTRY_POINT_GROUP = "asgi_compression.algorithms"
+
+AlgorithmFactory = typing.Callable[..., CompressionAlgorithm]
+
+_factories: dict[str, AlgorithmFactory] = {
+    ContentEncoding.GZIP.value: GzipAlgorithm,
+    ContentEncoding.BROTLI.value: BrotliAlgorithm,
+    ContentEncoding.ZSTD.value: ZstdAlgorithm,
+    ContentEncoding.IDENTITY.value: IdentityAlgorithm,
+}
+# Declared but not loaded yet, packages are only imported once used.
+_entry_points: dict[str, EntryPoint] = {}
+_lock = threading.Lock()
+_loaded = False
+
+
+def find_entry_points() -> list[EntryPoint]:
+    found = entry_points()
+    if hasattr(found, "select"):
+        return list(found.select(group=ENTRY_POINT_GROUP))
+    # Python 3.9 returns a dict of groups.
+    return list(typing.cast(dict, found).get(ENTRY_POINT_GROUP, []))
+
+
+def load_entry_points() -> None:
+    """Register the encodings installed packages declare, once."""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if _loaded:
+            return
+        for entry_point in find_entry_points():
+            try:
+                ContentEncoding.register(entry_point.name)
+            except ValueError:
+                # One broken package mustn't make every encoding unusable.
+                warnings.warn(
+                    f"Ignoring {ENTRY_POINT_GROUP} entry point "
+                    f"{entry_point.value}: {entry_point.name!r} isn't a "
+                    "valid content encoding",
+                    RuntimeWarning,
+                    stacklevel=2,
+                )
+                continue
+            _entry_points.setdefault(entry_point.name, entry_point)
+        _loaded = True
+
+
+def register_algorithm(encoding: str, factory: AlgorithmFactory) -> None:
+    """
+    Make `factory` create the algorithms of `encoding`.
+
+    Registrations take precedence over entry points, and replace earlier
+    registrations of the encoding, built-in ones included.
+    """
+    ContentEncoding.register(encoding)
+    with _lock:
+        _factories[encoding] = factory
+
+
+def create_algorithm(
+    encoding: str, **options: typing.Any
+) -> CompressionAlgorithm:
+    """
+    Algorithm of `encoding` configured with `options`, e.g.
+    `create_algorithm("br", quality=5)`.
+
+    Encodings are built-in, registered with `register_algorithm`, or declared
+    by installed packages in the `asgi_compression.algorithms` entry point
+    group.
+    """
+    load_entry_points()
+    factory = _factories.get(encoding)
+    if factory is None:
+        entry_point = _entry_points.get(encoding)
+        if entry_point is None:
+            raise ValueError(f"Unknown content encoding: {encoding}")
+        factory = entry_point.load()
+        with _lock:
+            factory = _factories.setdefault(encoding, factory)
+    return factory(**options)
+
+
+def available_encodings() -> list[str]:
+    """Encodings `create_algorithm` can create algorithms for."""
+    load_entry_points()
+    with _lock:
+        return sorted({*_factories, *_entry_points})
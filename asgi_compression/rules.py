@@ -0,0 +1,56 @@
+import fnmatch
+import re
+import typing
+
+GLOB_CHARACTERS = frozenset("*?[")
+
+
+def _path_pattern(path: str) -> str:
+    """Regex for a path rule: a shell-style glob, or else a path prefix."""
+    if GLOB_CHARACTERS.intersection(path):
+        return fnmatch.translate(path)
+    return re.escape(path)
+
+
+def _combined(paths: typing.Iterable[str]) -> str:
+    return "|".join(f"(?:{_path_pattern(path)})" for path in paths)
+
+
+def compile_path_rules(
+    exclude: typing.Optional[typing.Iterable[str]] = None,
+    include: typing.Optional[typing.Iterable[str]] = None,
+) -> typing.Optional["re.Pattern[str]"]:
+    """
+    Compile path rules into one regex matching the paths to bypass.
+
+    Paths matching any `exclude` rule are bypassed, and when `include` is
+    given, so are paths matching none of its rules. Returns None when there
+    are no rules.
+    """
+    alternatives = []
+    if exclude:
+        alternatives.append(_combined(exclude))
+    if include:
+        alternatives.append(f"(?!{_combined(include)})")
+    if not alternatives:
+        return None
+    return re.compile("|".join(alternatives))
+
+
+def compile_route_rules(
+    rules: typing.Sequence[str],
+) -> typing.Optional["re.Pattern[str]"]:
+    """
+    Compile path rules into one regex telling which rule matched first.
+
+    Each rule is captured by a group named `rule<index>`, so the index of
+    the matching rule is `int(match.lastgroup[4:])`.
+    """
+    if not rules:
+        return None
+    return re.compile(
+        "|".join(
+            f"(?P<rule{index}>{_path_pattern(rule)})"
+            for index, rule in enumerate(rules)
+        )
+    )
@@ -0,0 +1,232 @@
+import time
+import typing
+from dataclasses import asdict, dataclass
+
+from .base import CompressionAlgorithm
+from .brotli import BrotliAlgorithm
+from .capture import CapturedResponse
+from .gzip import GzipAlgorithm
+from .types import Message, Receive, Scope, Send
+from .zstd import ZstdAlgorithm
+
+# Candidate families by encoding, with the field holding their level.
+CANDIDATE_FAMILIES: dict[str, tuple[type[CompressionAlgorithm], str]] = {
+    "gzip": (GzipAlgorithm, "compresslevel"),
+    "br": (BrotliAlgorithm, "quality"),
+    "zstd": (ZstdAlgorithm, "level"),
+}
+DEFAULT_CANDIDATES = ["gzip-6", "gzip-9", "br-4", "br-6", "zstd-3", "zstd-9"]
+# Bytes of output a millisecond of CPU time is worth when recommending a
+# configuration, the exchange rate between bandwidth and compute.
+DEFAULT_BYTES_PER_CPU_MS = 10_000
+
+
+def parse_candidate(candidate: str) -> tuple[str, int]:
+    """Split a `family-level` candidate such as `br-4`."""
+    family, _, level = candidate.partition("-")
+    if family not in CANDIDATE_FAMILIES or not level.isdigit():
+        raise ValueError(f"Unknown candidate configuration: {candidate}")
+    return family, int(level)
+
+
+def candidate_algorithm(candidate: str) -> CompressionAlgorithm:
+    family, level = parse_candidate(candidate)
+    algorithm_class, field = CANDIDATE_FAMILIES[family]
+    options: dict[str, typing.Any] = {field: level}
+    return algorithm_class(**options)
+
+
+def candidate_config(candidate: str) -> str:
+    """Python expression configuring the candidate's algorithm."""
+    family, level = parse_candidate(candidate)
+    algorithm_class, field = CANDIDATE_FAMILIES[family]
+    return f"{algorithm_class.__name__}({field}={level})"
+
+
+@dataclass
+class CandidateResult:
+    """Cost and savings of a candidate on the responses of a content type."""
+
+    candidate: str
+    responses: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    cpu_ns: int = 0
+    # Whether no other candidate is both faster and smaller.
+    pareto: bool = False
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_in - self.bytes_out
+
+    def score(self, bytes_per_cpu_ms: float) -> float:
+        """Output size plus CPU time converted to bytes, lower is better."""
+        return self.bytes_out + self.cpu_ns / 1_000_000 * bytes_per_cpu_ms
+
+    def add(self, other: "CandidateResult") -> None:
+        self.responses += other.responses
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+        self.cpu_ns += other.cpu_ns
+
+
+@dataclass
+class SimulationReport:
+    # Results by content type, then by candidate.
+    content_types: dict[str, dict[str, CandidateResult]]
+    # Candidates in the order they should be configured.
+    recommended: list[str]
+    bytes_per_cpu_ms: float
+
+    @property
+    def config(self) -> str:
+        """Middleware configuration using the recommended candidates."""
+        algorithms = "".join(
+            f"        {candidate_config(candidate)},\n"
+            for candidate in self.recommended
+        )
+        return (
+            "CompressionMiddleware(\n"
+            "    app=app,\n"
+            f"    algorithms=[\n{algorithms}    ],\n"
+            ")"
+        )
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        return {
+            "content_types": {
+                content_type: [asdict(result) for result in results.values()]
+                for content_type, results in self.content_types.items()
+            },
+            "recommended": self.recommended,
+            "bytes_per_cpu_ms": self.bytes_per_cpu_ms,
+            "config": self.config,
+        }
+
+
+async def replay(
+    algorithm: CompressionAlgorithm, response: CapturedResponse
+) -> tuple[int, int]:
+    """Compress a captured response, returns its size and the CPU time."""
+    chunks = response.chunks or [b""]
+    output = 0
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        headers = []
+        if response.content_type:
+            headers.append((b"content-type", response.content_type.encode()))
+        await send(
+            {"type": "http.response.start", "status": 200, "headers": headers}
+        )
+        for index, chunk in enumerate(chunks):
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": index < len(chunks) - 1,
+                }
+            )
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal output
+        if message["type"] == "http.response.body":
+            output += len(message.get("body", b""))
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+    start = time.process_time_ns()
+    await algorithm.create_responder(app)(scope, receive, send)
+    return output, time.process_time_ns() - start
+
+
+def media_type(content_type: str) -> str:
+    return content_type.partition(";")[0].strip().lower() or "unknown"
+
+
+def pareto_front(results: typing.Iterable[CandidateResult]) -> None:
+    """Mark the results no other result beats on both CPU time and size."""
+    results = list(results)
+    for result in results:
+        result.pareto = not any(
+            other.cpu_ns <= result.cpu_ns
+            and other.bytes_out <= result.bytes_out
+            and (
+                other.cpu_ns < result.cpu_ns
+                or other.bytes_out < result.bytes_out
+            )
+            for other in results
+        )
+
+
+def recommend(
+    totals: typing.Iterable[CandidateResult],
+    accepted: set[str],
+    bytes_per_cpu_ms: float,
+) -> list[str]:
+    """
+    Best scoring candidate of each family accepted by some client, best
+    family first, as the middleware uses the first accepted algorithm.
+    """
+    best: dict[str, CandidateResult] = {}
+    for result in totals:
+        family, _ = parse_candidate(result.candidate)
+        if family not in accepted:
+            continue
+        current = best.get(family)
+        if current is None or result.score(bytes_per_cpu_ms) < current.score(
+            bytes_per_cpu_ms
+        ):
+            best[family] = result
+    return [
+        result.candidate
+        for result in sorted(
+            best.values(), key=lambda result: result.score(bytes_per_cpu_ms)
+        )
+    ]
+
+
+async def simulate(
+    captures: typing.Iterable[CapturedResponse],
+    candidates: typing.Optional[list[str]] = None,
+    bytes_per_cpu_ms: float = DEFAULT_BYTES_PER_CPU_MS,
+) -> SimulationReport:
+    """Replay captured responses through every candidate configuration."""
+    candidates = candidates or DEFAULT_CANDIDATES
+    algorithms = {
+        candidate: candidate_algorithm(candidate) for candidate in candidates
+    }
+    # Import the libraries now, rather than while timing the first replay.
+    for algorithm in algorithms.values():
+        algorithm.check_available()
+    content_types: dict[str, dict[str, CandidateResult]] = {}
+    accepted: set[str] = set()
+
+    for response in captures:
+        results = content_types.setdefault(
+            media_type(response.content_type),
+            {candidate: CandidateResult(candidate) for candidate in candidates},
+        )
+        size = len(response.body)
+        for candidate, algorithm in algorithms.items():
+            if algorithm.type.value in response.accept_encoding:
+                accepted.add(parse_candidate(candidate)[0])
+            bytes_out, cpu_ns = await replay(algorithm, response)
+            result = results[candidate]
+            result.responses += 1
+            result.bytes_in += size
+            result.bytes_out += bytes_out
+            result.cpu_ns += cpu_ns
+
+    totals = {candidate: CandidateResult(candidate) for candidate in candidates}
+    for results in content_types.values():
+        pareto_front(results.values())
+        for candidate, result in results.items():
+            totals[candidate].add(result)
+
+    return SimulationReport(
+        content_types=content_types,
+        recommended=recommend(totals.values(), accepted, bytes_per_cpu_ms),
+        bytes_per_cpu_ms=bytes_per_cpu_ms,
+    )
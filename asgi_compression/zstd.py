@@ -1,27 +1,83 @@
 import io
+import threading
+import typing
 from dataclasses import dataclass
+from functools import partial
 from typing import TYPE_CHECKING
 
+from .adaptive import AdaptiveEffort, EffortController
 from .base import CompressionAlgorithm, CompressionResponder, ContentEncoding
+from .decompression import (
+    DECOMPRESSED_CHUNK_SIZE,
+    DecompressionError,
+    Decompressor,
+)
+from .pool import ThreadBudget, get_default_budget
 from .types import ASGIApp, Receive, Scope, Send
 
 if TYPE_CHECKING:
     import zstandard
 
 
+# Serializes the first import, threads may race to it without the GIL.
+_import_lock = threading.Lock()
+_imported = False
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# Skippable frames start with 0x184D2A5?, little endian.
+ZSTD_SKIPPABLE_MAGIC = b"\x2a\x4d\x18"
+
+# Parts of the input ZstdDecompressor expects next.
+ZSTD_FRAME = 0
+ZSTD_FRAME_HEADER = 1
+ZSTD_SKIPPABLE = 2
+ZSTD_BLOCK = 3
+ZSTD_CHECKSUM = 4
+
+
 def import_zstandard() -> None:
-    global zstandard
-    try:
-        import zstandard
-    except ImportError as e:
-        raise ImportError(
-            'zstandard is not installed, run `pip install "asgi-compression[zstd]"`'
-        ) from e
+    global zstandard, _imported
+    if _imported:
+        return
+    with _import_lock:
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                'zstandard is not installed, run `pip install "asgi-compression[zstd]"`'
+            ) from e
+        _imported = True
+
+
+def compress_zstd(
+    body: bytes,
+    level: int,
+    write_checksum: bool,
+    write_content_size: bool,
+) -> bytes:
+    import_zstandard()
+    return zstandard.ZstdCompressor(
+        level=level,
+        write_checksum=write_checksum,
+        write_content_size=write_content_size,
+    ).compress(body)
 
 
 class ZstdResponder(CompressionResponder):
     """Responder that applies Zstandard compression."""
 
+    __slots__ = (
+        "level",
+        "threads",
+        "write_checksum",
+        "write_content_size",
+        "thread_budget",
+        "granted_threads",
+        "zstd_buffer",
+        "compression_stream",
+        "level_changed",
+    )
+
     content_encoding = ContentEncoding.ZSTD
 
     def __init__(
@@ -32,21 +88,27 @@ class ZstdResponder(CompressionResponder):
         threads: int = 0,
         write_checksum: bool = False,
         write_content_size: bool = True,
+        thread_budget: typing.Optional[ThreadBudget] = None,
+        adaptive_effort: typing.Optional[AdaptiveEffort] = None,
     ) -> None:
         super().__init__(app, minimum_size)
 
         import_zstandard()
 
-        self.zstd_buffer = io.BytesIO()
-        self.compressor = zstandard.ZstdCompressor(
-            level=level,
-            threads=threads,
-            write_checksum=write_checksum,
-            write_content_size=write_content_size,
-        )
-        self.compression_stream = self.compressor.stream_writer(
-            self.zstd_buffer
-        )
+        self.level = level
+        self.threads = threads
+        self.write_checksum = write_checksum
+        self.write_content_size = write_content_size
+        self.thread_budget = thread_budget
+        # Worker threads drawn from the thread budget for this response.
+        self.granted_threads = 0
+        self.zstd_buffer: typing.Optional[io.BytesIO] = None
+        self.compression_stream: typing.Optional[
+            zstandard.ZstdCompressionWriter
+        ] = None
+        self.level_changed = False
+        if adaptive_effort is not None:
+            self._effort = EffortController(adaptive_effort, level)
 
     async def __call__(
         self,
@@ -54,20 +116,197 @@ class ZstdResponder(CompressionResponder):
         receive: Receive,
         send: Send,
     ) -> None:
-        with self.zstd_buffer, self.compression_stream:
+        try:
             await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+    def set_level(self, level: int) -> None:
+        if level != self.level:
+            self.level = level
+            self.level_changed = True
+
+    def _stream_writer(
+        self, buffer: io.BytesIO
+    ) -> "zstandard.ZstdCompressionWriter":
+        threads = self.granted_threads
+        if self.threads and self.deterministic:
+            # Multi-threaded output doesn't depend on the number of threads
+            # but differs from single-threaded output, use at least one even
+            # when the budget is exhausted.
+            threads = max(threads, 1)
+        compressor = zstandard.ZstdCompressor(
+            level=self.level,
+            threads=threads,
+            write_checksum=self.write_checksum,
+            write_content_size=self.write_content_size,
+        )
+        # The buffer outlives the writer when the level changes.
+        return compressor.stream_writer(buffer, closefd=False)
+
+    def _release(self) -> None:
+        """Free the compression context and the threads drawn for it."""
+        if self.compression_stream is not None:
+            self.compression_stream.close()
+            self.compression_stream = None
+        if self.zstd_buffer is not None:
+            self.zstd_buffer.close()
+            self.zstd_buffer = None
+        if self.granted_threads:
+            budget = self.thread_budget or get_default_budget()
+            budget.release(self.granted_threads)
+            self.granted_threads = 0
 
     def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self.zstd_buffer is None or self.compression_stream is None:
+            self.zstd_buffer = io.BytesIO()
+            if self.threads:
+                budget = self.thread_budget or get_default_budget()
+                # -1 asks for as many threads as there are cores.
+                self.granted_threads = budget.acquire(
+                    budget.max_threads if self.threads < 0 else self.threads
+                )
+            self.compression_stream = self._stream_writer(self.zstd_buffer)
+        elif self.level_changed:
+            # Levels can't change within a frame, end it and continue in a
+            # new frame at the new level.
+            self.compression_stream.flush(zstandard.FLUSH_FRAME)
+            self.compression_stream.close()
+            self.compression_stream = self._stream_writer(self.zstd_buffer)
+        self.level_changed = False
+
         self.compression_stream.write(body)
         if not more_body:
             self.compression_stream.flush(zstandard.FLUSH_FRAME)
 
         body = self.zstd_buffer.getvalue()
-        self.zstd_buffer.seek(0)
-        self.zstd_buffer.truncate()
+        if more_body:
+            self.zstd_buffer.seek(0)
+            self.zstd_buffer.truncate()
+        else:
+            # Done, don't keep the context until the app returns.
+            self._release()
         return body
 
 
+class ZstdDecompressor(Decompressor):
+    """
+    Incremental Zstandard decompressor, supporting multiple frames.
+
+    zstandard's decompressobj has no output limit, and a few input bytes can
+    decompress to a whole block. The framing (RFC 8878) is parsed so that
+    the input is fed one block at a time, and a block decompresses to at
+    most 128 KiB. Skippable frames are dropped as they arrive.
+    """
+
+    # Largest window decoders are required to support for HTTP (RFC 8878).
+    MAX_WINDOW_SIZE = 8 * 1024 * 1024
+    MAX_BLOCK_SIZE = 128 * 1024
+
+    def __init__(self) -> None:
+        import_zstandard()
+
+        self._context = zstandard.ZstdDecompressor(
+            max_window_size=self.MAX_WINDOW_SIZE
+        )
+        self._decompressor = self._context.decompressobj()
+        self._buffer = bytearray()
+        self._state = ZSTD_FRAME
+        # Whether the current frame ends with a checksum.
+        self._checksum = False
+        # Bytes of a skippable frame still to drop.
+        self._skip = 0
+
+    def decompress(self, data: bytes) -> typing.Iterator[bytes]:
+        buffer = self._buffer
+        buffer += data
+        while True:
+            if self._skip:
+                skipped = min(self._skip, len(buffer))
+                del buffer[:skipped]
+                self._skip -= skipped
+                if self._skip:
+                    return
+
+            size = self._unit_size()
+            if size is None or len(buffer) < size:
+                return
+            unit = bytes(buffer[:size])
+            del buffer[:size]
+            if self._state == ZSTD_SKIPPABLE:
+                self._skip = int.from_bytes(unit[4:8], "little")
+                self._state = ZSTD_FRAME
+                continue
+
+            if self._state == ZSTD_FRAME_HEADER and self._decompressor.eof:
+                self._decompressor = self._context.decompressobj()
+            output = self._decompressor.decompress(unit)
+            self._advance(unit)
+            for offset in range(0, len(output), DECOMPRESSED_CHUNK_SIZE):
+                yield output[offset : offset + DECOMPRESSED_CHUNK_SIZE]
+
+    def _unit_size(self) -> typing.Optional[int]:
+        """
+        Size of the next part of the input fed at once: a frame header, a
+        block or a checksum. None while not enough is known about it.
+        """
+        buffer = self._buffer
+        state = self._state
+        if state == ZSTD_BLOCK:
+            if len(buffer) < 3:
+                return None
+            header = int.from_bytes(buffer[:3], "little")
+            block_type = (header >> 1) & 3
+            block_size = header >> 3
+            if block_type == 3 or block_size > self.MAX_BLOCK_SIZE:
+                raise DecompressionError("Invalid zstd request body")
+            # RLE blocks repeat a single byte.
+            return 3 + (1 if block_type == 1 else block_size)
+        if state == ZSTD_CHECKSUM:
+            return 4
+
+        if len(buffer) < 5:
+            return None
+        if buffer[:4] == ZSTD_MAGIC:
+            # A new frame, its header holds optional fields.
+            descriptor = buffer[4]
+            single_segment = (descriptor >> 5) & 1
+            content_size_flag = descriptor >> 6
+            size = 5 + (not single_segment) + (0, 1, 2, 4)[descriptor & 3]
+            if content_size_flag:
+                size += (0, 2, 4, 8)[content_size_flag]
+            elif single_segment:
+                size += 1
+            self._state = ZSTD_FRAME_HEADER
+            return size
+        if buffer[0] & 0xF0 == 0x50 and buffer[1:4] == ZSTD_SKIPPABLE_MAGIC:
+            self._state = ZSTD_SKIPPABLE
+            return 8
+        raise DecompressionError("Invalid zstd request body")
+
+    def _advance(self, unit: bytes) -> None:
+        """Move past a unit fed to the decompressor."""
+        state = self._state
+        if state == ZSTD_FRAME_HEADER:
+            self._checksum = bool(unit[4] & 0x04)
+            self._state = ZSTD_BLOCK
+        elif state == ZSTD_BLOCK:
+            if unit[0] & 1:
+                # The last block of the frame.
+                self._state = ZSTD_CHECKSUM if self._checksum else ZSTD_FRAME
+        else:
+            self._state = ZSTD_FRAME
+
+    def finish(self) -> None:
+        if (
+            self._state != ZSTD_FRAME
+            or self._buffer
+            or self._skip
+            or not self._decompressor.eof
+        ):
+            raise DecompressionError("Truncated zstd request body")
+
+
 @dataclass
 class ZstdAlgorithm(CompressionAlgorithm):
     """Zstandard compression algorithm."""
@@ -77,6 +316,16 @@ class ZstdAlgorithm(CompressionAlgorithm):
     threads: int = 0
     write_checksum: bool = False
     write_content_size: bool = True
+    # Worker-wide budget `threads` are drawn from, defaults to the shared
+    # budget. Responses fall back to single-threaded compression when the
+    # budget is exhausted.
+    thread_budget: typing.Optional[ThreadBudget] = None
+    # Level used when recompressing hot responses in the background.
+    background_level: int = 19
+    # Adapts `level` of streaming responses to the client's throughput,
+    # within these bounds. Each change starts a new frame. Disabled while
+    # None.
+    adaptive_effort: typing.Optional[AdaptiveEffort] = None
 
     def create_responder(self, app: ASGIApp) -> ZstdResponder:
         return ZstdResponder(
@@ -86,7 +335,20 @@ class ZstdAlgorithm(CompressionAlgorithm):
             threads=self.threads,
             write_checksum=self.write_checksum,
             write_content_size=self.write_content_size,
+            thread_budget=self.thread_budget,
+            adaptive_effort=self.adaptive_effort,
         )
 
+    def background_compressor(self) -> typing.Callable[[bytes], bytes]:
+        return partial(
+            compress_zstd,
+            level=self.background_level,
+            write_checksum=self.write_checksum,
+            write_content_size=self.write_content_size,
+        )
+
+    def create_decompressor(self) -> ZstdDecompressor:
+        return ZstdDecompressor()
+
     def check_available(self) -> None:
         import_zstandard()
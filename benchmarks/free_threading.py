@@ -0,0 +1,186 @@
+"""
+Throughput scaling of one middleware shared by event loops in many threads.
+
+Runs 1, 2, 4, ... threads up to the number of cores, each with its own event
+loop serving requests through the same `CompressionMiddleware` and metrics,
+and reports the aggregate throughput and speedup over a single thread. With
+`--cache`, responses are served from a shared variant cache instead of being
+compressed, which measures the middleware's own overhead.
+
+Under the GIL only the compressors' own work runs in parallel, on a
+free-threaded build (3.13t, 3.14t) the middleware's Python code does too.
+Whether the GIL was enabled is recorded in the report's metadata, run the
+benchmark under both builds to compare.
+
+Usage:
+    python -m benchmarks.free_threading
+    python3.14t -m benchmarks.free_threading --algorithms gzip-6,zstd-3 \\
+        --sizes 64K,1M --threads 1,2,4,8 --output free-threading.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from asgi_compression import (
+    CompressionMetrics,
+    CompressionMiddleware,
+    MemoryVariantCache,
+)
+
+from .harness import CONTENT_TYPES, KB, MB, get_corpus, make_app, make_scope
+from .harness import run_request as run_single_request
+from .loadtest import algorithm_from_name
+from .parallel_gzip import default_threads
+from .run import metadata, parse_size
+
+DEFAULT_ALGORITHMS = ["gzip-6", "br-4", "zstd-3"]
+DEFAULT_SIZES = [64 * KB, MB]
+
+
+@dataclass
+class ThreadScalingResult:
+    algorithm: str
+    size: int
+    threads: int
+    requests: int
+    mb_per_s: float
+    speedup: float
+
+
+def bench_case(
+    name: str,
+    size: int,
+    threads: int,
+    min_time: float,
+    cache: bool,
+) -> tuple[int, float]:
+    """Return the requests served by all threads and the seconds taken."""
+    algorithm = algorithm_from_name(name)
+    middleware = CompressionMiddleware(
+        app=make_app(get_corpus("json", size), CONTENT_TYPES["json"]),
+        algorithms=[algorithm] if algorithm else [],
+        hooks=CompressionMetrics(),
+        cache=MemoryVariantCache() if cache else None,
+    )
+    scope = make_scope(
+        accept_encoding=algorithm.type.value if algorithm else "identity"
+    )
+    # Warm up lazy imports and the cache.
+    asyncio.run(run_single_request(middleware, scope))
+
+    barrier = threading.Barrier(threads + 1)
+    counts = [0] * threads
+    deadline = 0.0
+
+    async def serve(index: int) -> None:
+        while time.perf_counter() < deadline:
+            await run_single_request(middleware, scope)
+            counts[index] += 1
+
+    def run(index: int) -> None:
+        barrier.wait()
+        asyncio.run(serve(index))
+
+    workers = [
+        threading.Thread(target=run, args=(index,)) for index in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    start = time.perf_counter()
+    deadline = start + min_time
+    barrier.wait()
+    for worker in workers:
+        worker.join()
+    return sum(counts), time.perf_counter() - start
+
+
+def main(args: argparse.Namespace) -> dict[str, Any]:
+    algorithms = (
+        args.algorithms.split(",") if args.algorithms else DEFAULT_ALGORITHMS
+    )
+    sizes = (
+        [parse_size(size) for size in args.sizes.split(",")]
+        if args.sizes
+        else DEFAULT_SIZES
+    )
+    thread_counts = (
+        [int(threads) for threads in args.threads.split(",")]
+        if args.threads
+        else default_threads()
+    )
+
+    meta = metadata()
+    print(
+        f"GIL {'enabled' if meta['gil_enabled'] else 'disabled'}",
+        file=sys.stderr,
+    )
+    print(
+        f"{'algorithm':<10} {'size':>8} {'threads':>7} "
+        f"{'MB/s':>10} {'speedup':>8}",
+        file=sys.stderr,
+    )
+    results = []
+    for name in algorithms:
+        for size in sizes:
+            baseline: Optional[float] = None
+            for threads in thread_counts:
+                requests, seconds = bench_case(
+                    name, size, threads, args.min_time, args.cache
+                )
+                mb_per_s = requests * size / MB / seconds
+                if baseline is None:
+                    baseline = mb_per_s
+                result = ThreadScalingResult(
+                    algorithm=name,
+                    size=size,
+                    threads=threads,
+                    requests=requests,
+                    mb_per_s=mb_per_s,
+                    speedup=mb_per_s / baseline,
+                )
+                print(
+                    f"{name:<10} {size // KB:>7}K {threads:>7} "
+                    f"{mb_per_s:>10.1f} {result.speedup:>7.2f}x",
+                    file=sys.stderr,
+                )
+                results.append(asdict(result))
+
+    return {"meta": meta, "results": results}
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Thread scaling of a middleware shared by event loops."
+    )
+    parser.add_argument(
+        "--algorithms",
+        help=f"Comma-separated, default {','.join(DEFAULT_ALGORITHMS)}",
+    )
+    parser.add_argument("--sizes", help="Comma-separated sizes, e.g. 64K,1M")
+    parser.add_argument(
+        "--threads", help="Comma-separated thread counts, e.g. 1,2,4,8"
+    )
+    parser.add_argument("--min-time", type=float, default=1.0)
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Serve cached variants instead of compressing every response",
+    )
+    parser.add_argument("--output", help="Write JSON results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = main(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
@@ -0,0 +1,221 @@
+"""In-process ASGI harness and corpora shared by the benchmark scripts."""
+
+import json
+import random
+import time
+from typing import Callable, Optional, Sequence
+
+from asgi_compression.types import ASGIApp, Message, Receive, Scope, Send
+
+KB = 1024
+MB = 1024 * KB
+
+CONTENT_TYPES = {
+    "json": b"application/json",
+    "html": b"text/html; charset=utf-8",
+    "js": b"application/javascript",
+    "compressed": b"application/octet-stream",
+}
+
+_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo "
+    "consequat duis aute irure in reprehenderit voluptate velit esse cillum"
+).split()
+
+
+def _json_corpus(rng: random.Random, size: int) -> bytes:
+    parts = []
+    total = 0
+    index = 0
+    while total < size:
+        record = {
+            "id": index,
+            "uuid": f"{rng.getrandbits(128):032x}",
+            "name": " ".join(rng.choices(_WORDS, k=2)).title(),
+            "email": f"{rng.choice(_WORDS)}{index}@example.com",
+            "score": round(rng.random() * 100, 3),
+            "active": rng.random() > 0.3,
+            "tags": rng.sample(_WORDS, k=rng.randint(1, 5)),
+        }
+        part = json.dumps(record).encode()
+        parts.append(part)
+        total += len(part) + 1
+        index += 1
+    return b"[" + b",".join(parts) + b"]"
+
+
+def _html_corpus(rng: random.Random, size: int) -> bytes:
+    parts = [b"<!DOCTYPE html><html><head><title>Report</title></head><body>"]
+    total = len(parts[0])
+    index = 0
+    while total < size:
+        text = " ".join(rng.choices(_WORDS, k=rng.randint(5, 30)))
+        href = rng.choice(_WORDS)
+        part = (
+            f'<div class="row row-{index % 7}" id="item-{index}">'
+            f'<a href="/{href}/{index}">{href.title()}</a>'
+            f"<p>{text}</p><span>{rng.random():.5f}</span></div>\n"
+        ).encode()
+        parts.append(part)
+        total += len(part)
+        index += 1
+    parts.append(b"</body></html>")
+    return b"".join(parts)
+
+
+def _js_corpus(rng: random.Random, size: int) -> bytes:
+    parts = []
+    total = 0
+    index = 0
+    while total < size:
+        name = f"{rng.choice(_WORDS)}_{index}"
+        arg = rng.choice(_WORDS)
+        part = (
+            f"export function {name}({arg}, options = {{}}) {{\n"
+            f"  const value = {arg} * {rng.randint(0, 1000)};\n"
+            f"  if (options.{rng.choice(_WORDS)}) {{\n"
+            f'    return "{" ".join(rng.choices(_WORDS, k=4))}";\n'
+            f"  }}\n"
+            f"  return value + {rng.random():.4f};\n"
+            f"}}\n"
+        ).encode()
+        parts.append(part)
+        total += len(part)
+        index += 1
+    return b"".join(parts)
+
+
+def _compressed_corpus(rng: random.Random, size: int) -> bytes:
+    # High-entropy bytes behave like already-compressed payloads.
+    return rng.randbytes(size)
+
+
+_GENERATORS: dict[str, Callable[[random.Random, int], bytes]] = {
+    "json": _json_corpus,
+    "html": _html_corpus,
+    "js": _js_corpus,
+    "compressed": _compressed_corpus,
+}
+
+_corpus_cache: dict[str, bytes] = {}
+
+
+def get_corpus(name: str, size: int, seed: int = 0) -> bytes:
+    """Return `size` bytes of the named corpus.
+
+    The largest requested corpus is generated once and prefixes of it are
+    returned, so generation cost is paid once per corpus.
+    """
+    cached = _corpus_cache.get(name)
+    if cached is None or len(cached) < size:
+        cached = _GENERATORS[name](random.Random(seed), size)
+        _corpus_cache[name] = cached
+    return cached[:size]
+
+
+def make_app(
+    body: bytes,
+    content_type: bytes,
+    chunk_size: Optional[int] = None,
+) -> ASGIApp:
+    """Raw ASGI app returning `body`, optionally streamed in chunks."""
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        headers = [(b"content-type", content_type)]
+        if chunk_size is None:
+            headers.append((b"content-length", str(len(body)).encode()))
+        await send(
+            {"type": "http.response.start", "status": 200, "headers": headers}
+        )
+        if chunk_size is None:
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        view = memoryview(body)
+        for offset in range(0, len(body), chunk_size):
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": bytes(view[offset : offset + chunk_size]),
+                    "more_body": True,
+                }
+            )
+        await send({"type": "http.response.body", "body": b""})
+
+    return app
+
+
+def make_scope(
+    accept_encoding: str = "gzip, br, zstd",
+    path: str = "/",
+    method: str = "GET",
+    headers: Optional[list[tuple[bytes, bytes]]] = None,
+) -> Scope:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"accept-encoding", accept_encoding.encode()),
+            *(headers or []),
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("127.0.0.1", 80),
+        "extensions": {},
+    }
+
+
+class ResponseCollector:
+    """ASGI `send` collecting the status, headers and body size."""
+
+    def __init__(self, keep_body: bool = False) -> None:
+        self.keep_body = keep_body
+        self.status = 0
+        self.headers: list[tuple[bytes, bytes]] = []
+        self.body_size = 0
+        self.chunks: list[bytes] = []
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            self.headers = list(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            self.body_size += len(body)
+            if self.keep_body:
+                self.chunks.append(body)
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+async def receive() -> Message:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def run_request(
+    app: ASGIApp,
+    scope: Scope,
+    keep_body: bool = False,
+) -> tuple[ResponseCollector, int]:
+    """Run a single request, returning the collected response and ns spent."""
+    collector = ResponseCollector(keep_body=keep_body)
+    start = time.perf_counter_ns()
+    await app(dict(scope), receive, collector)
+    return collector, time.perf_counter_ns() - start
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return float(ordered[index])
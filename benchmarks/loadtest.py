@@ -0,0 +1,377 @@
+"""
+End-to-end load test against a real local ASGI server.
+
+For every framework and algorithm configuration, a server process (uvicorn or
+hypercorn) is started with the test applications from `tests/conftest.py`
+wrapped in `CompressionMiddleware`. The driver then issues requests with an
+async HTTP client at the configured concurrency and reports throughput,
+latency percentiles, event-loop lag and worker RSS as JSON.
+
+Both servers are in the dev dependency group.
+
+Usage:
+    python -m benchmarks.loadtest --frameworks starlette \\
+        --algorithms identity,gzip-6,br-4,zstd-3 --concurrency 64 \\
+        --duration 10 --output loadtest.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Optional
+
+from asgi_compression import (
+    BrotliAlgorithm,
+    CompressionAlgorithm,
+    CompressionMiddleware,
+    GzipAlgorithm,
+    ZstdAlgorithm,
+)
+from asgi_compression.types import ASGIApp, Receive, Scope, Send
+
+from .harness import percentile
+
+STATS_PATH = "/__loadtest__/stats"
+RESET_PATH = "/__loadtest__/reset"
+LAG_INTERVAL = 0.01
+
+
+def algorithm_from_name(name: str) -> Optional[CompressionAlgorithm]:
+    """Build an algorithm from a `family-level` name such as `br-4`."""
+    if name == "identity":
+        return None
+    family, _, level = name.partition("-")
+    if family == "gzip":
+        return GzipAlgorithm(compresslevel=int(level or 9))
+    if family == "br":
+        return BrotliAlgorithm(quality=int(level or 4))
+    if family == "zstd":
+        return ZstdAlgorithm(level=int(level or 3))
+    raise ValueError(f"Unknown algorithm configuration: {name}")
+
+
+def get_framework_app(framework: str) -> ASGIApp:
+    from tests import conftest
+
+    return getattr(conftest, f"get_{framework}_app")()
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Peak RSS, reported in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class LoadTestApp:
+    """Wraps the app under test with a loop lag monitor and stats endpoint."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.lag_samples: list[float] = []
+        self.peak_rss = 0
+        self._monitor: Optional[asyncio.Task[None]] = None
+
+    async def _monitor_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lag_samples.append(max(0.0, loop.time() - expected))
+            if len(self.lag_samples) % 100 == 0:
+                self.peak_rss = max(self.peak_rss, current_rss())
+
+    def stats(self) -> dict[str, Any]:
+        lag_ms = [sample * 1000 for sample in self.lag_samples] or [0.0]
+        rss = current_rss()
+        return {
+            "loop_lag_p50_ms": percentile(lag_ms, 0.5),
+            "loop_lag_p99_ms": percentile(lag_ms, 0.99),
+            "loop_lag_max_ms": max(lag_ms),
+            "rss_bytes": rss,
+            "peak_rss_bytes": max(self.peak_rss, rss),
+        }
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self._monitor is None:
+            self._monitor = asyncio.ensure_future(self._monitor_lag())
+
+        if scope["path"] in (STATS_PATH, RESET_PATH):
+            if scope["path"] == RESET_PATH:
+                self.lag_samples.clear()
+                self.peak_rss = 0
+            body = json.dumps(self.stats()).encode()
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", b"application/json")],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        await self.app(scope, receive, send)
+
+
+def serve(args: argparse.Namespace) -> None:
+    app: ASGIApp = get_framework_app(args.framework)
+    algorithm = algorithm_from_name(args.algorithm)
+    app = CompressionMiddleware(
+        app=app,
+        algorithms=[algorithm] if algorithm is not None else [],
+    )
+    wrapped = LoadTestApp(app)
+
+    if args.server == "uvicorn":
+        import uvicorn
+
+        uvicorn.run(
+            wrapped,
+            host="127.0.0.1",
+            port=args.port,
+            log_level="warning",
+            lifespan="off",
+        )
+    elif args.server == "hypercorn":
+        from hypercorn.asyncio import (  # type: ignore
+            serve as hypercorn_serve,
+        )
+        from hypercorn.config import Config  # type: ignore
+
+        config = Config()
+        config.bind = [f"127.0.0.1:{args.port}"]
+        config.loglevel = "WARNING"
+        asyncio.run(hypercorn_serve(wrapped, config, mode="asgi"))
+    else:
+        raise ValueError(f"Unknown server: {args.server}")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(base_url: str, timeout: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while True:
+            try:
+                await client.get(STATS_PATH)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def drive(
+    base_url: str,
+    paths: list[str],
+    accept_encoding: str,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+) -> dict[str, Any]:
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=concurrency,
+        max_keepalive_connections=concurrency,
+    )
+    headers = {"accept-encoding": accept_encoding}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        latencies: list[float] = []
+        errors = 0
+        bytes_received = 0
+        recording = False
+
+        async def worker(index: int, deadline: float) -> None:
+            nonlocal errors, bytes_received
+            request_index = index
+            while time.monotonic() < deadline:
+                path = paths[request_index % len(paths)]
+                request_index += 1
+                start = time.perf_counter()
+                size = 0
+                try:
+                    async with client.stream(
+                        "GET", path, headers=headers
+                    ) as response:
+                        # Read raw bytes, decoding would skew client timings.
+                        async for chunk in response.aiter_raw():
+                            size += len(chunk)
+                except httpx.HTTPError:
+                    if recording:
+                        errors += 1
+                    continue
+                if recording:
+                    latencies.append(time.perf_counter() - start)
+                    bytes_received += size
+
+        if warmup > 0:
+            deadline = time.monotonic() + warmup
+            await asyncio.gather(
+                *(worker(i, deadline) for i in range(concurrency))
+            )
+        await client.get(RESET_PATH)
+
+        recording = True
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*(worker(i, deadline) for i in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+        server_stats = (await client.get(STATS_PATH)).json()
+
+    latencies_ms = [latency * 1000 for latency in latencies] or [0.0]
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        "bytes_received": bytes_received,
+        "latency_p50_ms": percentile(latencies_ms, 0.5),
+        "latency_p90_ms": percentile(latencies_ms, 0.9),
+        "latency_p99_ms": percentile(latencies_ms, 0.99),
+        "latency_max_ms": max(latencies_ms),
+        **server_stats,
+    }
+
+
+async def run_case(
+    args: argparse.Namespace,
+    framework: str,
+    algorithm: str,
+) -> dict[str, Any]:
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.loadtest",
+            "serve",
+            "--framework",
+            framework,
+            "--algorithm",
+            algorithm,
+            "--server",
+            args.server,
+            "--port",
+            str(port),
+        ],
+        env={**os.environ, "PYTHONPATH": os.getcwd()},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_ready(base_url)
+        accept_encoding = (
+            "identity" if algorithm == "identity" else algorithm.split("-")[0]
+        )
+        result = await drive(
+            base_url=base_url,
+            paths=args.paths.split(","),
+            accept_encoding=accept_encoding,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            warmup=args.warmup,
+        )
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    return {
+        "framework": framework,
+        "algorithm": algorithm,
+        "server": args.server,
+        "concurrency": args.concurrency,
+        **result,
+    }
+
+
+async def main(args: argparse.Namespace) -> dict[str, Any]:
+    results = []
+    for framework in args.frameworks.split(","):
+        for algorithm in args.algorithms.split(","):
+            result = await run_case(args, framework, algorithm)
+            print(
+                f"{framework:<10} {algorithm:<10} "
+                f"{result['throughput_rps']:10.1f} rps "
+                f"p99 {result['latency_p99_ms']:8.2f} ms "
+                f"lag p99 {result['loop_lag_p99_ms']:8.2f} ms "
+                f"rss {result['peak_rss_bytes'] / 1024 / 1024:7.1f} MB",
+                file=sys.stderr,
+            )
+            results.append(result)
+    return {"meta": {"timestamp": time.time()}, "results": results}
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Load test CompressionMiddleware on a local ASGI server."
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help=argparse.SUPPRESS)
+    serve_parser.add_argument("--framework", required=True)
+    serve_parser.add_argument("--algorithm", required=True)
+    serve_parser.add_argument("--server", default="uvicorn")
+    serve_parser.add_argument("--port", type=int, required=True)
+
+    parser.add_argument(
+        "--frameworks",
+        default="starlette,litestar,django",
+        help="Comma-separated frameworks from tests/conftest.py",
+    )
+    parser.add_argument(
+        "--algorithms",
+        default="identity,gzip-6,br-4,zstd-3",
+        help="Comma-separated configurations, e.g. gzip-6,br-4",
+    )
+    parser.add_argument(
+        "--server", choices=("uvicorn", "hypercorn"), default="uvicorn"
+    )
+    parser.add_argument(
+        "--paths",
+        default="/,/streaming_response",
+        help="Comma-separated paths requested round-robin",
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "serve":
+        serve(args)
+    else:
+        report = asyncio.run(main(args))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
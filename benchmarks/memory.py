@@ -0,0 +1,179 @@
+"""
+Memory footprint of concurrent responses, per algorithm configuration.
+
+Runs `--concurrency` single-message and streaming responses at once through
+`CompressionMiddleware` and reports, per request, the peak memory traced by
+tracemalloc and the RSS growth seen while they were in flight. tracemalloc
+only sees allocations made through Python's allocators (zlib's included),
+brotli and zstd buffers only show in RSS.
+
+With `--max-traced` or `--max-rss`, exits with status 1 when a configuration
+exceeds the per-request bound, so it can guard against regressions in CI.
+
+Usage:
+    python -m benchmarks.memory
+    python -m benchmarks.memory --algorithms gzip-6,br-11 --concurrency 64 \\
+        --max-rss 16M --output memory.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from asgi_compression import CompressionMiddleware
+from asgi_compression.types import Message
+
+from .harness import CONTENT_TYPES, KB, get_corpus, make_app, make_scope
+from .loadtest import algorithm_from_name, current_rss
+from .run import metadata, parse_size
+
+DEFAULT_ALGORITHMS = ["gzip-6", "br-4", "br-11", "zstd-3"]
+DEFAULT_MODES = ["single", "streaming"]
+STREAMING_CHUNK_SIZE = 16 * KB
+
+
+@dataclass
+class MemoryResult:
+    algorithm: str
+    mode: str
+    size: int
+    concurrency: int
+    traced_per_request: int
+    rss_per_request: int
+
+
+class RSSSampler:
+    """ASGI `send` sampling RSS growth at every message."""
+
+    def __init__(self, baseline: int) -> None:
+        self.baseline = baseline
+        self.peak = 0
+
+    async def __call__(self, message: Message) -> None:
+        self.peak = max(self.peak, current_rss() - self.baseline)
+        # Let the other responses progress, as a socket write would.
+        await asyncio.sleep(0)
+
+
+async def receive() -> Message:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def bench_case(
+    name: str,
+    mode: str,
+    size: int,
+    concurrency: int,
+) -> MemoryResult:
+    algorithm = algorithm_from_name(name)
+    app = make_app(
+        get_corpus("json", size),
+        CONTENT_TYPES["json"],
+        STREAMING_CHUNK_SIZE if mode == "streaming" else None,
+    )
+    middleware = CompressionMiddleware(
+        app=app, algorithms=[algorithm] if algorithm else []
+    )
+    encoding = algorithm.type.value if algorithm else "identity"
+    scope = make_scope(accept_encoding=encoding)
+
+    # Warm up, one-off allocations aren't per request.
+    await middleware(dict(scope), receive, RSSSampler(current_rss()))
+    gc.collect()
+
+    sampler = RSSSampler(current_rss())
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        await asyncio.gather(
+            *(
+                middleware(dict(scope), receive, sampler)
+                for _ in range(concurrency)
+            )
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return MemoryResult(
+        algorithm=name,
+        mode=mode,
+        size=size,
+        concurrency=concurrency,
+        traced_per_request=(peak - baseline) // concurrency,
+        rss_per_request=sampler.peak // concurrency,
+    )
+
+
+async def main(args: argparse.Namespace) -> tuple[dict[str, Any], bool]:
+    """Return the report and whether all bounds were met."""
+    algorithms = (
+        args.algorithms.split(",") if args.algorithms else DEFAULT_ALGORITHMS
+    )
+    modes = args.modes.split(",") if args.modes else DEFAULT_MODES
+    max_traced = parse_size(args.max_traced) if args.max_traced else None
+    max_rss = parse_size(args.max_rss) if args.max_rss else None
+
+    print(
+        f"{'algorithm':<10} {'mode':<9} {'traced/req':>12} {'rss/req':>12}",
+        file=sys.stderr,
+    )
+    ok = True
+    results = []
+    for name in algorithms:
+        for mode in modes:
+            result = await bench_case(
+                name, mode, parse_size(args.size), args.concurrency
+            )
+            exceeded = (
+                max_traced is not None
+                and result.traced_per_request > max_traced
+            ) or (max_rss is not None and result.rss_per_request > max_rss)
+            ok = ok and not exceeded
+            print(
+                f"{name:<10} {mode:<9} "
+                f"{result.traced_per_request / KB:>9.1f} KB "
+                f"{result.rss_per_request / KB:>9.1f} KB"
+                f"{'  EXCEEDED' if exceeded else ''}",
+                file=sys.stderr,
+            )
+            results.append(asdict(result))
+
+    return {"meta": metadata(), "results": results}, ok
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Per-request memory of concurrent compressed responses."
+    )
+    parser.add_argument(
+        "--algorithms",
+        help=f"Comma-separated, default {','.join(DEFAULT_ALGORITHMS)}",
+    )
+    parser.add_argument("--modes", help="Comma-separated: single,streaming")
+    parser.add_argument("--size", default="1M")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument(
+        "--max-traced", help="Per-request bound on traced memory, e.g. 512K"
+    )
+    parser.add_argument(
+        "--max-rss", help="Per-request bound on RSS growth, e.g. 16M"
+    )
+    parser.add_argument("--output", help="Write JSON results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report, ok = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,158 @@
+"""
+Per-request overhead of the middleware on responses it doesn't compress.
+
+Runs identity, small, excluded and streaming-identity requests through
+`CompressionMiddleware` and reports the CPU time per request, the time the
+middleware adds over calling the app directly, and the number of memory
+blocks alive while the response is in flight (the responder, its headers
+and everything else the request keeps around). A compressed response is
+included for reference.
+
+Usage:
+    python -m benchmarks.overhead
+    python -m benchmarks.overhead --min-time 2 --output overhead.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from asgi_compression import CompressionMiddleware, GzipAlgorithm
+from asgi_compression.types import ASGIApp, Message, Scope
+
+from .harness import CONTENT_TYPES, KB, get_corpus, make_app, make_scope
+from .run import metadata
+
+
+@dataclass
+class Case:
+    name: str
+    accept_encoding: str
+    size: int
+    content_type: bytes = CONTENT_TYPES["json"]
+    chunk_size: Optional[int] = None
+
+
+CASES = [
+    Case("identity", "identity", 4 * KB),
+    Case("identity-streaming", "identity", 4 * KB, chunk_size=400),
+    Case("small", "gzip", 100),
+    Case("excluded", "gzip", 4 * KB, content_type=b"text/event-stream"),
+    Case("gzip", "gzip", 4 * KB),
+]
+
+
+@dataclass
+class OverheadResult:
+    case: str
+    iterations: int
+    cpu_us: float
+    overhead_us: float
+    live_blocks: int
+
+
+class BlockCounter:
+    """ASGI `send` recording the most memory blocks alive at any message."""
+
+    def __init__(self, baseline: int) -> None:
+        self.baseline = baseline
+        self.peak = 0
+
+    async def __call__(self, message: Message) -> None:
+        self.peak = max(self.peak, sys.getallocatedblocks() - self.baseline)
+
+
+async def receive() -> Message:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def discard(message: Message) -> None:
+    pass
+
+
+async def cpu_per_request(
+    app: ASGIApp, scope: Scope, min_time: float
+) -> tuple[int, float]:
+    """Return iterations and CPU seconds per request."""
+    iterations = 0
+    start = time.process_time()
+    while iterations < 100 or time.process_time() - start < min_time:
+        await app(dict(scope), receive, discard)
+        iterations += 1
+    return iterations, (time.process_time() - start) / iterations
+
+
+async def live_blocks(app: ASGIApp, scope: Scope) -> int:
+    """Memory blocks alive during a request, beyond those of its scope."""
+    # Warm up caches and lazy imports so they aren't counted.
+    await app(dict(scope), receive, discard)
+    request_scope = dict(scope)
+    gc.collect()
+    gc.disable()
+    try:
+        counter = BlockCounter(sys.getallocatedblocks())
+        await app(request_scope, receive, counter)
+    finally:
+        gc.enable()
+    return counter.peak
+
+
+async def bench_case(case: Case, min_time: float) -> OverheadResult:
+    app = make_app(
+        get_corpus("json", case.size), case.content_type, case.chunk_size
+    )
+    middleware = CompressionMiddleware(app=app, algorithms=[GzipAlgorithm()])
+    scope = make_scope(accept_encoding=case.accept_encoding)
+
+    _, bare = await cpu_per_request(app, scope, min_time)
+    iterations, seconds = await cpu_per_request(middleware, scope, min_time)
+    return OverheadResult(
+        case=case.name,
+        iterations=iterations,
+        cpu_us=seconds * 1e6,
+        overhead_us=(seconds - bare) * 1e6,
+        live_blocks=await live_blocks(middleware, scope)
+        - await live_blocks(app, scope),
+    )
+
+
+async def main(args: argparse.Namespace) -> dict[str, Any]:
+    print(
+        f"{'case':<20} {'cpu us':>8} {'overhead us':>12} {'blocks':>7}",
+        file=sys.stderr,
+    )
+    results = []
+    for case in CASES:
+        result = await bench_case(case, args.min_time)
+        print(
+            f"{result.case:<20} {result.cpu_us:>8.2f} "
+            f"{result.overhead_us:>12.2f} {result.live_blocks:>7}",
+            file=sys.stderr,
+        )
+        results.append(asdict(result))
+
+    return {"meta": metadata(), "results": results}
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Per-request overhead on responses left uncompressed."
+    )
+    parser.add_argument("--min-time", type=float, default=0.5)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
@@ -0,0 +1,208 @@
+"""
+Scaling benchmark for parallel gzip and zstd thread budgets.
+
+Compresses large bodies through `CompressionMiddleware` with 1, 2, 4, ...
+threads up to the number of cores, reports throughput, speedup over the
+serial compressor and the size overhead of block-wise compression, and
+checks that every response decodes with the standard library's gzip.
+
+Usage:
+    python -m benchmarks.parallel_gzip
+    python -m benchmarks.parallel_gzip --sizes 4M,32M --threads 1,2,4,8 \\
+        --levels 6 --output parallel.json
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from asgi_compression import (
+    CompressionAlgorithm,
+    CompressionMiddleware,
+    GzipAlgorithm,
+    ZstdAlgorithm,
+)
+from asgi_compression.pool import ThreadBudget
+
+from .harness import CONTENT_TYPES, MB, get_corpus, make_app, make_scope
+from .harness import run_request as run_single_request
+from .run import metadata, parse_size
+
+DEFAULT_SIZES = [4 * MB, 32 * MB]
+DEFAULT_LEVELS = [1, 6]
+
+
+@dataclass
+class ScalingResult:
+    encoding: str
+    level: int
+    corpus: str
+    size: int
+    threads: int
+    iterations: int
+    mb_per_s: float
+    speedup: float
+    compressed_size: int
+    size_overhead: float
+
+
+def default_threads() -> list[int]:
+    cores = os.cpu_count() or 1
+    threads = [1]
+    while threads[-1] * 2 <= cores:
+        threads.append(threads[-1] * 2)
+    if threads[-1] != cores:
+        threads.append(cores)
+    return threads
+
+
+def build_algorithm(
+    encoding: str,
+    level: int,
+    threads: int,
+    budget: ThreadBudget,
+) -> CompressionAlgorithm:
+    if encoding == "gzip":
+        return GzipAlgorithm(
+            compresslevel=level,
+            # One thread means the plain serial compressor, the baseline.
+            parallel_threshold=None if threads == 1 else 0,
+            parallel_threads=threads,
+            thread_budget=budget,
+        )
+    return ZstdAlgorithm(
+        level=level,
+        threads=0 if threads == 1 else threads,
+        thread_budget=budget,
+    )
+
+
+async def bench_case(
+    encoding: str,
+    level: int,
+    corpus: str,
+    size: int,
+    threads: int,
+    min_time: float,
+) -> tuple[int, float, bytes]:
+    """Return iterations, seconds per request and one compressed body."""
+    body = get_corpus(corpus, size)
+    budget = ThreadBudget(max_threads=threads)
+    middleware = CompressionMiddleware(
+        app=make_app(body, CONTENT_TYPES[corpus]),
+        algorithms=[build_algorithm(encoding, level, threads, budget)],
+    )
+    scope = make_scope(accept_encoding=encoding)
+
+    collector, _ = await run_single_request(middleware, scope, keep_body=True)
+    compressed = collector.body
+    if encoding == "gzip":
+        assert gzip.decompress(compressed) == body, "invalid gzip output"
+
+    iterations = 0
+    start = time.perf_counter()
+    while iterations < 3 or time.perf_counter() - start < min_time:
+        await run_single_request(middleware, scope)
+        iterations += 1
+    elapsed = time.perf_counter() - start
+    budget.shutdown()
+    return iterations, elapsed / iterations, compressed
+
+
+async def main(args: argparse.Namespace) -> dict[str, Any]:
+    encodings = args.encodings.split(",")
+    sizes = (
+        [parse_size(size) for size in args.sizes.split(",")]
+        if args.sizes
+        else DEFAULT_SIZES
+    )
+    levels = (
+        [int(level) for level in args.levels.split(",")]
+        if args.levels
+        else DEFAULT_LEVELS
+    )
+    thread_counts = (
+        [int(threads) for threads in args.threads.split(",")]
+        if args.threads
+        else default_threads()
+    )
+
+    print(
+        f"{'encoding':<8} {'level':>5} {'size':>6} {'threads':>7} "
+        f"{'MB/s':>10} {'speedup':>8} {'overhead':>9}",
+        file=sys.stderr,
+    )
+    results = []
+    for encoding in encodings:
+        for level in levels:
+            for size in sizes:
+                baseline: Optional[tuple[float, int]] = None
+                for threads in thread_counts:
+                    iterations, seconds, compressed = await bench_case(
+                        encoding=encoding,
+                        level=level,
+                        corpus=args.corpus,
+                        size=size,
+                        threads=threads,
+                        min_time=args.min_time,
+                    )
+                    if baseline is None:
+                        baseline = (seconds, len(compressed))
+                    result = ScalingResult(
+                        encoding=encoding,
+                        level=level,
+                        corpus=args.corpus,
+                        size=size,
+                        threads=threads,
+                        iterations=iterations,
+                        mb_per_s=size / MB / seconds,
+                        speedup=baseline[0] / seconds,
+                        compressed_size=len(compressed),
+                        size_overhead=len(compressed) / baseline[1] - 1,
+                    )
+                    print(
+                        f"{encoding:<8} {level:>5} {size // MB:>5}M "
+                        f"{threads:>7} {result.mb_per_s:>10.1f} "
+                        f"{result.speedup:>7.2f}x "
+                        f"{result.size_overhead:>8.2%}",
+                        file=sys.stderr,
+                    )
+                    results.append(asdict(result))
+
+    return {"meta": metadata(), "results": results}
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Thread scaling benchmark for parallel compression."
+    )
+    parser.add_argument(
+        "--encodings", default="gzip,zstd", help="Comma-separated: gzip,zstd"
+    )
+    parser.add_argument("--sizes", help="Comma-separated sizes, e.g. 4M,32M")
+    parser.add_argument("--levels", help="Comma-separated levels, e.g. 1,6")
+    parser.add_argument(
+        "--threads", help="Comma-separated thread counts, e.g. 1,2,4,8"
+    )
+    parser.add_argument(
+        "--corpus", default="json", help=f"One of {','.join(CONTENT_TYPES)}"
+    )
+    parser.add_argument("--min-time", type=float, default=1.0)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
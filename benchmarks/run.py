@@ -0,0 +1,340 @@
+"""
+Benchmark suite for `CompressionMiddleware`.
+
+Drives the middleware with an in-process ASGI harness for every configured
+algorithm/level, body size, corpus and response mode, and reports throughput,
+per-request latency percentiles, bytes saved, peak traced memory and blocks
+retained after the request. Starlette's `GZipMiddleware` is included as a
+baseline when Starlette is installed.
+
+Usage:
+    python -m benchmarks.run                       # full matrix
+    python -m benchmarks.run --quick               # small smoke matrix
+    python -m benchmarks.run --algorithms gzip-6,br-4 --sizes 1K,1M \\
+        --output results.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Optional
+
+from asgi_compression import (
+    BrotliAlgorithm,
+    CompressionAlgorithm,
+    CompressionMiddleware,
+    GzipAlgorithm,
+    ZstdAlgorithm,
+)
+from asgi_compression.types import ASGIApp
+
+from .harness import (
+    CONTENT_TYPES,
+    KB,
+    MB,
+    get_corpus,
+    make_app,
+    make_scope,
+    percentile,
+    run_request,
+)
+
+DEFAULT_SIZES = [100, KB, 10 * KB, 100 * KB, MB, 10 * MB, 50 * MB]
+QUICK_SIZES = [100, 10 * KB, MB]
+DEFAULT_MODES = ["single", "streaming"]
+DEFAULT_CHUNK_SIZE = 64 * KB
+
+GZIP_LEVELS = [1, 6, 9]
+BROTLI_QUALITIES = [1, 4, 6, 9, 11]
+ZSTD_LEVELS = [1, 3, 9, 19]
+
+
+@dataclass
+class Config:
+    name: str
+    encoding: str
+    wrap: Callable[[ASGIApp], ASGIApp]
+
+
+@dataclass
+class Result:
+    config: str
+    encoding: str
+    corpus: str
+    size: int
+    mode: str
+    iterations: int
+    throughput_mb_s: float
+    p50_ms: float
+    p99_ms: float
+    bytes_out: int
+    bytes_saved: int
+    ratio: float
+    peak_memory_bytes: Optional[int]
+    retained_blocks: Optional[int]
+
+
+def _middleware(
+    algorithm: CompressionAlgorithm,
+) -> Callable[[ASGIApp], ASGIApp]:
+    def wrap(app: ASGIApp) -> ASGIApp:
+        return CompressionMiddleware(app=app, algorithms=[algorithm])
+
+    return wrap
+
+
+def _starlette_gzip(level: int) -> Callable[[ASGIApp], ASGIApp]:
+    from starlette.middleware.gzip import GZipMiddleware
+
+    def wrap(app: ASGIApp) -> ASGIApp:
+        return GZipMiddleware(app, compresslevel=level)  # type: ignore
+
+    return wrap
+
+
+def build_configs(baseline: bool) -> list[Config]:
+    configs = [
+        Config("identity", "identity", _middleware(GzipAlgorithm())),
+    ]
+    configs += [
+        Config(
+            f"gzip-{level}",
+            "gzip",
+            _middleware(GzipAlgorithm(compresslevel=level)),
+        )
+        for level in GZIP_LEVELS
+    ]
+    configs += [
+        Config(
+            f"br-{quality}", "br", _middleware(BrotliAlgorithm(quality=quality))
+        )
+        for quality in BROTLI_QUALITIES
+    ]
+    configs += [
+        Config(f"zstd-{level}", "zstd", _middleware(ZstdAlgorithm(level=level)))
+        for level in ZSTD_LEVELS
+    ]
+    if baseline:
+        try:
+            configs += [
+                Config(
+                    f"starlette-gzip-{level}", "gzip", _starlette_gzip(level)
+                )
+                for level in GZIP_LEVELS
+            ]
+        except ImportError:
+            print(
+                "starlette is not installed, skipping baseline", file=sys.stderr
+            )
+    return configs
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().upper().rstrip("B")
+    for suffix, multiplier in (("K", KB), ("M", MB)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * multiplier)
+    return int(value)
+
+
+def format_size(size: int) -> str:
+    if size >= MB:
+        return f"{size // MB}MB"
+    if size >= KB:
+        return f"{size // KB}KB"
+    return f"{size}B"
+
+
+async def bench_case(
+    config: Config,
+    corpus: str,
+    size: int,
+    mode: str,
+    chunk_size: int,
+    min_time: float,
+    min_iterations: int,
+    max_iterations: int,
+    measure_memory: bool,
+) -> Result:
+    body = get_corpus(corpus, size)
+    app = config.wrap(
+        make_app(
+            body,
+            CONTENT_TYPES[corpus],
+            chunk_size=chunk_size if mode == "streaming" else None,
+        )
+    )
+    scope = make_scope(accept_encoding=config.encoding)
+
+    # Warm-up, also used to record the output size.
+    collector, _ = await run_request(app, scope)
+    bytes_out = collector.body_size
+
+    timings: list[int] = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < max_iterations and (
+        len(timings) < min_iterations or time.perf_counter() < deadline
+    ):
+        _, elapsed = await run_request(app, scope)
+        timings.append(elapsed)
+
+    peak_memory = retained_blocks = None
+    if measure_memory:
+        gc.collect()
+        blocks_before = sys.getallocatedblocks()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        await run_request(app, scope)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        gc.collect()
+        peak_memory = peak - baseline
+        retained_blocks = sys.getallocatedblocks() - blocks_before
+
+    total_seconds = sum(timings) / 1e9
+    return Result(
+        config=config.name,
+        encoding=config.encoding,
+        corpus=corpus,
+        size=size,
+        mode=mode,
+        iterations=len(timings),
+        throughput_mb_s=(size * len(timings) / MB) / total_seconds,
+        p50_ms=percentile(timings, 0.5) / 1e6,
+        p99_ms=percentile(timings, 0.99) / 1e6,
+        bytes_out=bytes_out,
+        bytes_saved=size - bytes_out,
+        ratio=size / bytes_out if bytes_out else 0.0,
+        peak_memory_bytes=peak_memory,
+        retained_blocks=retained_blocks,
+    )
+
+
+def print_result(result: Result) -> None:
+    peak = (
+        f"{result.peak_memory_bytes / KB:10.1f}"
+        if result.peak_memory_bytes is not None
+        else f"{'-':>10}"
+    )
+    print(
+        f"{result.config:<18} {result.corpus:<10} {format_size(result.size):>6} "
+        f"{result.mode:<9} {result.throughput_mb_s:10.1f} "
+        f"{result.p50_ms:10.3f} {result.p99_ms:10.3f} "
+        f"{result.ratio:7.2f} {peak}",
+        file=sys.stderr,
+    )
+
+
+def metadata() -> dict[str, Any]:
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        package_version = version("asgi-compression")
+    except PackageNotFoundError:
+        package_version = None
+
+    return {
+        "timestamp": time.time(),
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        # False on free-threaded builds, unless re-enabled with PYTHON_GIL=1.
+        "gil_enabled": getattr(sys, "_is_gil_enabled", lambda: True)(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "asgi_compression": package_version,
+    }
+
+
+async def main(args: argparse.Namespace) -> dict[str, Any]:
+    configs = build_configs(baseline=not args.no_baseline)
+    if args.algorithms:
+        selected = set(args.algorithms.split(","))
+        configs = [
+            config
+            for config in configs
+            if config.name in selected or config.encoding in selected
+        ]
+
+    sizes = (
+        [parse_size(size) for size in args.sizes.split(",")]
+        if args.sizes
+        else (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    )
+    corpora = args.corpora.split(",") if args.corpora else list(CONTENT_TYPES)
+    modes = args.modes.split(",") if args.modes else DEFAULT_MODES
+
+    print(
+        f"{'config':<18} {'corpus':<10} {'size':>6} {'mode':<9} "
+        f"{'MB/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'ratio':>7} "
+        f"{'peak KB':>10}",
+        file=sys.stderr,
+    )
+    results = []
+    for corpus in corpora:
+        for size in sizes:
+            for mode in modes:
+                for config in configs:
+                    result = await bench_case(
+                        config=config,
+                        corpus=corpus,
+                        size=size,
+                        mode=mode,
+                        chunk_size=args.chunk_size,
+                        min_time=args.min_time,
+                        min_iterations=args.min_iterations,
+                        max_iterations=args.max_iterations,
+                        measure_memory=not args.no_memory,
+                    )
+                    print_result(result)
+                    results.append(asdict(result))
+
+    return {"meta": metadata(), "results": results}
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark suite for CompressionMiddleware."
+    )
+    parser.add_argument(
+        "--algorithms",
+        help="Comma-separated config names or families, e.g. gzip-6,br,zstd",
+    )
+    parser.add_argument("--sizes", help="Comma-separated sizes, e.g. 100,1K,1M")
+    parser.add_argument(
+        "--corpora", help=f"Comma-separated corpora: {','.join(CONTENT_TYPES)}"
+    )
+    parser.add_argument("--modes", help="Comma-separated: single,streaming")
+    parser.add_argument(
+        "--chunk-size", type=parse_size, default=DEFAULT_CHUNK_SIZE
+    )
+    parser.add_argument("--min-time", type=float, default=0.5)
+    parser.add_argument("--min-iterations", type=int, default=3)
+    parser.add_argument("--max-iterations", type=int, default=1000)
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument(
+        "--no-baseline",
+        action="store_true",
+        help="Skip Starlette's GZipMiddleware baseline",
+    )
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.min_time = min(args.min_time, 0.1)
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
@@ -0,0 +1,164 @@
+import asyncio
+import gzip
+import random
+
+import pytest
+
+from asgi_compression.adaptive import AdaptiveEffort, EffortController
+from asgi_compression.base import CompressionAlgorithm
+from asgi_compression.gzip import GzipAlgorithm, GzipResponder
+from asgi_compression.types import Message, Receive, Scope, Send
+from asgi_compression.zstd import ZstdAlgorithm
+
+from .utils import decompress_zstd
+
+# Hex digits, compressible enough to matter but not so much that the
+# compressors hold back most chunks.
+BODY = random.Random(0).randbytes(400_000).hex().encode()
+CHUNK_SIZE = 16 * 1024
+
+
+def test_effort_controller_raises_level_for_slow_clients() -> None:
+    effort = AdaptiveEffort(min_level=1, max_level=3, interval=2)
+    controller = EffortController(effort, level=1)
+
+    # 16 KiB in 100ms is ~160 KB/s, below the default 1 MB/s.
+    levels = [controller.record(CHUNK_SIZE, 0.1) for _ in range(8)]
+    assert levels == [None, 2, None, 3, None, None, None, None]
+    # Empty chunks aren't measured.
+    assert controller.record(0, 1) is None
+
+
+def test_effort_controller_lowers_level_for_fast_clients() -> None:
+    effort = AdaptiveEffort(min_level=4, max_level=9, interval=1)
+    controller = EffortController(effort, level=6)
+
+    levels = [controller.record(CHUNK_SIZE, 0) for _ in range(3)]
+    assert levels == [5, 4, None]
+
+
+def test_effort_controller_smoothing() -> None:
+    effort = AdaptiveEffort(min_level=1, max_level=9, interval=1)
+    controller = EffortController(effort, level=5)
+
+    # A single fast send after slow ones isn't enough to lower the level.
+    controller.record(CHUNK_SIZE, 1)
+    assert controller.record(CHUNK_SIZE, 0.0001) is None
+    assert controller.throughput is not None
+    assert controller.throughput < effort.fast_throughput
+
+
+def test_adaptive_effort_validation() -> None:
+    with pytest.raises(ValueError):
+        AdaptiveEffort(min_level=5, max_level=1)
+    with pytest.raises(ValueError):
+        AdaptiveEffort(
+            min_level=1, max_level=5, slow_throughput=10, fast_throughput=1
+        )
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain")],
+        }
+    )
+    for offset in range(0, len(BODY), CHUNK_SIZE):
+        await send(
+            {
+                "type": "http.response.body",
+                "body": BODY[offset : offset + CHUNK_SIZE],
+                "more_body": True,
+            }
+        )
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def stream(
+    algorithm: CompressionAlgorithm, send_seconds: float
+) -> tuple[int, bytes]:
+    """Return the level the response ended at and its body."""
+    responder = algorithm.create_responder(app)
+    chunks: list[bytes] = []
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        if message["type"] == "http.response.body":
+            chunks.append(message["body"])
+            await asyncio.sleep(send_seconds)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", algorithm.type.value.encode())],
+    }
+    await responder(scope, receive, send)
+    assert responder._effort is not None
+    return responder._effort.level, b"".join(chunks)
+
+
+@pytest.mark.parametrize(
+    "algorithm, decompress",
+    [
+        (GzipAlgorithm, gzip.decompress),
+        (ZstdAlgorithm, decompress_zstd),
+    ],
+)
+@pytest.mark.parametrize(
+    "level, send_seconds, expected_level",
+    [
+        (1, 0.005, 4),  # slow client, the level is raised
+        (6, 0, 2),  # fast client, the level is lowered
+    ],
+)
+async def test_streaming_level_adapts(
+    algorithm: type[CompressionAlgorithm],
+    decompress: object,
+    level: int,
+    send_seconds: float,
+    expected_level: int,
+) -> None:
+    effort = AdaptiveEffort(
+        min_level=2,
+        max_level=4,
+        slow_throughput=100_000_000 if send_seconds else 100_000,
+        fast_throughput=1_000_000_000 if send_seconds else 1_000_000,
+        interval=2,
+    )
+    if algorithm is GzipAlgorithm:
+        configured = GzipAlgorithm(compresslevel=level, adaptive_effort=effort)
+    else:
+        configured = ZstdAlgorithm(level=level, adaptive_effort=effort)
+
+    final_level, body = await stream(configured, send_seconds)
+    assert final_level == expected_level
+    assert callable(decompress)
+    assert decompress(body) == BODY
+
+
+async def test_gzip_level_changes_keep_the_window() -> None:
+    effort = AdaptiveEffort(
+        min_level=1,
+        max_level=9,
+        slow_throughput=100_000,
+        fast_throughput=1_000_000,
+        interval=1,
+    )
+    _, adaptive = await stream(
+        GzipAlgorithm(compresslevel=9, adaptive_effort=effort), 0
+    )
+    # Priming each continuation with the previous 32 KiB keeps the output
+    # close to that of a single compressor.
+    serial = gzip.compress(BODY, compresslevel=1)
+    assert len(adaptive) < len(serial) * 1.1
+
+
+def test_responders_without_adaptive_effort() -> None:
+    responder = GzipAlgorithm().create_responder(app)
+    assert isinstance(responder, GzipResponder)
+    assert responder._effort is None
@@ -0,0 +1,149 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+
+from asgi_compression.gzip import GzipAlgorithm
+from asgi_compression.middleware import CompressionMiddleware
+from asgi_compression.rules import compile_path_rules
+
+from .utils import RecordingHooks, get_test_client
+
+
+def get_app() -> Starlette:
+    async def homepage(request):
+        return PlainTextResponse("x" * 4000)
+
+    async def no_content(request):
+        return Response(status_code=204)
+
+    async def not_modified(request):
+        return Response(status_code=304, headers={"ETag": '"abc"'})
+
+    return Starlette(
+        routes=[
+            Route("/", endpoint=homepage, methods=["GET", "POST", "HEAD"]),
+            Route("/status/204", endpoint=no_content),
+            Route("/status/304", endpoint=not_modified),
+            Route("/{path:path}", endpoint=homepage),
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "exclude, include, path, bypassed",
+    [
+        (["/metrics"], None, "/metrics", True),
+        (["/metrics"], None, "/metrics/cpu", True),
+        (["/metrics"], None, "/api/metrics", False),
+        (["/downloads/*.zip"], None, "/downloads/a/b.zip", True),
+        (["/downloads/*.zip"], None, "/downloads/a.zip.txt", False),
+        (["/file?.txt"], None, "/file1.txt", True),
+        (["/v[12]/raw"], None, "/v2/raw", True),
+        (["/v[12]/raw"], None, "/v3/raw", False),
+        (None, ["/api"], "/api/users", False),
+        (None, ["/api"], "/health", True),
+        (["/api/stream"], ["/api"], "/api/stream", True),
+        (["/api/stream"], ["/api"], "/api/users", False),
+        (["/a.b"], None, "/aXb", False),
+    ],
+)
+def test_compile_path_rules(
+    exclude: list[str],
+    include: list[str],
+    path: str,
+    bypassed: bool,
+) -> None:
+    pattern = compile_path_rules(exclude, include)
+    assert pattern is not None
+    assert bool(pattern.match(path)) is bypassed
+
+
+def test_compile_path_rules_without_rules() -> None:
+    assert compile_path_rules() is None
+    assert compile_path_rules([], []) is None
+
+
+async def test_excluded_paths_are_bypassed() -> None:
+    hooks = RecordingHooks()
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[GzipAlgorithm()],
+        hooks=hooks,
+        exclude_paths=["/metrics", "/downloads/*"],
+    )
+
+    async with get_test_client(middleware) as client:
+        for path in ("/metrics", "/downloads/export.csv"):
+            response = await client.get(
+                path, headers={"accept-encoding": "gzip"}
+            )
+            assert response.text == "x" * 4000
+            assert "Content-Encoding" not in response.headers
+            assert "Vary" not in response.headers
+
+        response = await client.get("/", headers={"accept-encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+
+    # Bypassed requests never reached a responder.
+    assert len(hooks.started) == 1
+
+
+async def test_included_paths() -> None:
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[GzipAlgorithm()],
+        include_paths=["/api/*"],
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            "/api/users", headers={"accept-encoding": "gzip"}
+        )
+        assert response.headers["Content-Encoding"] == "gzip"
+
+        response = await client.get("/", headers={"accept-encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+
+
+async def test_excluded_methods() -> None:
+    hooks = RecordingHooks()
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[GzipAlgorithm()],
+        hooks=hooks,
+        exclude_methods=["post"],
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.post("/", headers={"accept-encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+
+        response = await client.head("/", headers={"accept-encoding": "gzip"})
+        assert response.status_code == 200
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Content-Length"] == "4000"
+
+    assert hooks.started == []
+
+
+@pytest.mark.parametrize("status_code", [204, 304])
+async def test_no_body_statuses_skip_the_compressor(status_code: int) -> None:
+    hooks = RecordingHooks()
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[GzipAlgorithm()],
+        hooks=hooks,
+        early_headers=True,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            f"/status/{status_code}", headers={"accept-encoding": "gzip"}
+        )
+        assert response.status_code == status_code
+        assert response.content == b""
+        assert "Content-Encoding" not in response.headers
+        assert "Vary" not in response.headers
+
+    assert hooks.summaries[0].chunks == 0
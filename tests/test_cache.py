@@ -0,0 +1,234 @@
+import gzip
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import brotli
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from asgi_compression.background import BackgroundRecompressor
+from asgi_compression.brotli import BrotliAlgorithm
+from asgi_compression.cache import (
+    CachedVariant,
+    MemoryVariantCache,
+    VariantKey,
+    file_variant_key,
+    variant_key,
+    variant_params,
+)
+from asgi_compression.gzip import GzipAlgorithm
+from asgi_compression.middleware import CompressionMiddleware
+
+from .utils import RecordingHooks, get_test_client
+
+BODY = " ".join(f"item-{i}" for i in range(2000))
+
+
+def get_app() -> Starlette:
+    async def homepage(request):
+        return PlainTextResponse(BODY)
+
+    async def no_store(request):
+        return PlainTextResponse(BODY, headers={"Cache-Control": "no-store"})
+
+    return Starlette(
+        routes=[
+            Route("/", endpoint=homepage),
+            Route("/no_store", endpoint=no_store),
+        ]
+    )
+
+
+def test_memory_cache_eviction() -> None:
+    cache = MemoryVariantCache(max_size=10, max_entry_size=6)
+    cache.set(("gzip", b"a"), CachedVariant(body=b"aaaa"))
+    cache.set(("gzip", b"b"), CachedVariant(body=b"bbbb"))
+    assert cache.get(("gzip", b"a")) is not None  # now most recently used
+
+    cache.set(("gzip", b"c"), CachedVariant(body=b"cccc"))
+    assert cache.get(("gzip", b"b")) is None
+    assert cache.get(("gzip", b"a")) is not None
+    assert cache.size == 8
+
+    cache.set(("gzip", b"d"), CachedVariant(body=b"d" * 7))
+    assert cache.get(("gzip", b"d")) is None
+
+
+async def test_cached_variant_is_reused() -> None:
+    cache = MemoryVariantCache()
+    hooks = RecordingHooks()
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[GzipAlgorithm()],
+        cache=cache,
+        hooks=hooks,
+    )
+
+    async with get_test_client(middleware) as client:
+        for _ in range(3):
+            response = await client.get(
+                "/", headers={"accept-encoding": "gzip"}
+            )
+            assert response.text == BODY
+            assert response.headers["Content-Encoding"] == "gzip"
+
+    assert len(cache) == 1
+    assert (
+        cache.get(
+            variant_key("gzip", BODY.encode(), variant_params(GzipAlgorithm()))
+        )
+        is not None
+    )
+    # Only the first response went through the compressor.
+    assert [summary.chunks for summary in hooks.summaries] == [1, 0, 0]
+
+
+async def test_variants_keyed_by_algorithm_parameters() -> None:
+    cache = MemoryVariantCache()
+    for compresslevel in (1, 9, 1):
+        middleware = CompressionMiddleware(
+            app=get_app(),
+            algorithms=[GzipAlgorithm(compresslevel=compresslevel)],
+            cache=cache,
+        )
+        async with get_test_client(middleware) as client:
+            response = await client.get(
+                "/", headers={"accept-encoding": "gzip"}
+            )
+            assert response.text == BODY
+
+    # Each level got its own variant, the second level 1 reused the first.
+    assert len(cache) == 2
+    fast, best = (
+        cache.get(
+            variant_key(
+                "gzip",
+                BODY.encode(),
+                variant_params(GzipAlgorithm(compresslevel=compresslevel)),
+            )
+        )
+        for compresslevel in (1, 9)
+    )
+    assert fast is not None and best is not None
+    assert gzip.decompress(fast.body) == gzip.decompress(best.body)
+    assert len(fast.body) > len(best.body)
+
+
+def test_file_variants_keyed_by_algorithm_parameters(tmp_path) -> None:
+    path = tmp_path / "body.txt"
+    path.write_text(BODY)
+    with open(path, "rb") as file:
+        keys = {
+            file_variant_key(
+                "gzip",
+                file.fileno(),
+                0,
+                len(BODY),
+                variant_params(GzipAlgorithm(compresslevel=compresslevel)),
+            )
+            for compresslevel in (1, 9, 9)
+        }
+    assert len(keys) == 2
+
+
+async def test_no_store_responses_are_not_cached() -> None:
+    cache = MemoryVariantCache()
+    middleware = CompressionMiddleware(
+        app=get_app(), algorithms=[GzipAlgorithm()], cache=cache
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            "/no_store", headers={"accept-encoding": "gzip"}
+        )
+        assert response.headers["Content-Encoding"] == "gzip"
+
+    assert len(cache) == 0
+
+
+async def test_background_recompression() -> None:
+    cache = MemoryVariantCache()
+    recompressor = BackgroundRecompressor(
+        hot_threshold=2,
+        executor=ThreadPoolExecutor(max_workers=1),
+    )
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[BrotliAlgorithm(quality=1, background_quality=11)],
+        cache=cache,
+        recompressor=recompressor,
+    )
+    key = variant_key(
+        "br",
+        BODY.encode(),
+        variant_params(BrotliAlgorithm(quality=1, background_quality=11)),
+    )
+
+    async with get_test_client(middleware) as client:
+        for _ in range(3):
+            response = await client.get("/", headers={"accept-encoding": "br"})
+            assert response.text == BODY
+
+        fast = cache.get(key)
+        assert fast is not None and not fast.upgraded
+        await recompressor.drain()
+
+        upgraded = cache.get(key)
+        assert upgraded is not None and upgraded.upgraded
+        assert len(upgraded.body) < len(fast.body)
+        assert brotli.decompress(upgraded.body) == BODY.encode()
+
+        response = await client.get("/", headers={"accept-encoding": "br"})
+        assert response.text == BODY
+        assert int(response.headers["Content-Length"]) == len(upgraded.body)
+
+    recompressor.shutdown()
+
+
+class ThreadRecordingCache(MemoryVariantCache):
+    def __init__(self) -> None:
+        super().__init__()
+        self.set_threads: list[int] = []
+
+    def set(self, key: VariantKey, variant: CachedVariant) -> None:
+        self.set_threads.append(threading.get_ident())
+        super().set(key, variant)
+
+
+async def test_recompressed_variant_stored_off_the_event_loop() -> None:
+    cache = ThreadRecordingCache()
+    recompressor = BackgroundRecompressor(
+        hot_threshold=1,
+        executor=ThreadPoolExecutor(max_workers=1),
+    )
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[BrotliAlgorithm(quality=1, background_quality=11)],
+        cache=cache,
+        recompressor=recompressor,
+    )
+
+    async with get_test_client(middleware) as client:
+        for _ in range(2):
+            await client.get("/", headers={"accept-encoding": "br"})
+        await recompressor.drain()
+
+    # Stored once when first compressed, then once recompressed, which may
+    # be a file write with a disk cache.
+    loop_thread = threading.get_ident()
+    assert len(cache.set_threads) == 2
+    assert cache.set_threads[0] == loop_thread
+    assert cache.set_threads[1] != loop_thread
+    assert not recompressor.pending
+    recompressor.shutdown()
+
+
+def test_recompressor_requires_cache() -> None:
+    with pytest.raises(ValueError):
+        CompressionMiddleware(
+            app=get_app(),
+            algorithms=[GzipAlgorithm()],
+            recompressor=BackgroundRecompressor(),
+        )
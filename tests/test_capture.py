@@ -0,0 +1,282 @@
+import asyncio
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from asgi_compression import (
+    PRE_ENCODED_KEY,
+    CompressionMiddleware,
+    GzipAlgorithm,
+    TrafficCapture,
+)
+from asgi_compression.__main__ import main
+from asgi_compression.capture import CapturedResponse, load_captures
+from asgi_compression.simulate import (
+    CandidateResult,
+    pareto_front,
+    recommend,
+    simulate,
+)
+from asgi_compression.types import ASGIApp, Message, Receive, Scope, Send
+
+HTML = b"<p>" + b"lorem ipsum dolor sit amet " * 400 + b"</p>"
+JSON = b"[" + b", ".join(b'{"id": %d, "name": "item"}' % i for i in range(400))
+JSON += b"]"
+
+
+def get_app(
+    body: bytes,
+    content_type: bytes,
+    chunk_size: Optional[int] = None,
+    content_encoding: Optional[bytes] = None,
+    pre_encoded: Optional[str] = None,
+) -> ASGIApp:
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        headers = [(b"content-type", content_type)]
+        if content_encoding is not None:
+            headers.append((b"content-encoding", content_encoding))
+        start: Message = {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": headers,
+        }
+        if pre_encoded is not None:
+            start[PRE_ENCODED_KEY] = pre_encoded
+        await send(start)
+        if chunk_size is None:
+            await send({"type": "http.response.body", "body": body})
+            return
+        for offset in range(0, len(body), chunk_size):
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": body[offset : offset + chunk_size],
+                    "more_body": True,
+                }
+            )
+        await send({"type": "http.response.body", "body": b""})
+
+    return app
+
+
+async def request(
+    app: ASGIApp, accept_encoding: str = "gzip, br", path: str = "/"
+) -> None:
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        pass
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    await app(scope, receive, send)
+
+
+async def test_capture_records_responses(tmp_path: Path) -> None:
+    capture = TrafficCapture(str(tmp_path), sample_rate=1)
+    html = CompressionMiddleware(
+        app=get_app(HTML, b"text/html; charset=utf-8"),
+        algorithms=[GzipAlgorithm()],
+        capture=capture,
+    )
+    stream = CompressionMiddleware(
+        app=get_app(JSON, b"application/json", chunk_size=4096),
+        algorithms=[GzipAlgorithm()],
+        capture=capture,
+    )
+    await request(html, accept_encoding="gzip")
+    await request(stream, accept_encoding="identity")
+    await capture.drain()
+
+    captures = sorted(
+        load_captures(str(tmp_path)), key=lambda captured: captured.streaming
+    )
+    assert captures[0] == CapturedResponse(
+        content_type="text/html; charset=utf-8",
+        accept_encoding="gzip",
+        chunks=[HTML],
+    )
+    assert captures[1].content_type == "application/json"
+    assert captures[1].accept_encoding == "identity"
+    assert captures[1].body == JSON
+    assert [len(chunk) for chunk in captures[1].chunks] == [
+        *(4096 for _ in range(len(JSON) // 4096)),
+        len(JSON) % 4096,
+        0,
+    ]
+    assert capture.size == sum(
+        os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)
+    )
+
+
+async def test_capture_written_off_the_request_path(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    capture = TrafficCapture(str(tmp_path), sample_rate=1)
+    middleware = CompressionMiddleware(
+        app=get_app(HTML, b"text/html"),
+        algorithms=[GzipAlgorithm()],
+        capture=capture,
+    )
+    written = threading.Event()
+    save = capture.save
+
+    def slow_save(response: CapturedResponse) -> None:
+        # The response is complete before the capture is written.
+        written.wait(5)
+        save(response)
+
+    monkeypatch.setattr(capture, "save", slow_save)
+    await request(middleware)
+    assert len(capture.pending) == 1
+    assert list(load_captures(str(tmp_path))) == []
+
+    written.set()
+    await capture.drain()
+    assert not capture.pending
+    assert [captured.body for captured in load_captures(str(tmp_path))] == [
+        HTML
+    ]
+
+
+@pytest.mark.parametrize(
+    "options, app_options",
+    [
+        ({"sample_rate": 0}, {}),
+        ({"sample_rate": 1, "max_body_size": 100}, {}),
+        ({"sample_rate": 1, "max_size": 0}, {}),
+        ({"sample_rate": 1}, {"content_encoding": b"br"}),
+        ({"sample_rate": 1}, {"pre_encoded": "gzip"}),
+    ],
+    ids=["unsampled", "large", "full", "encoded", "pre-encoded"],
+)
+async def test_capture_skips(
+    tmp_path: Path, options: dict, app_options: dict
+) -> None:
+    capture = TrafficCapture(str(tmp_path), **options)
+    middleware = CompressionMiddleware(
+        app=get_app(HTML, b"text/html", **app_options),
+        algorithms=[GzipAlgorithm()],
+        capture=capture,
+        pre_encoded=True,
+    )
+    await request(middleware)
+    await capture.drain()
+    assert list(load_captures(str(tmp_path))) == []
+
+
+async def test_capture_skips_bypassed_requests(tmp_path: Path) -> None:
+    capture = TrafficCapture(str(tmp_path), sample_rate=1)
+    middleware = CompressionMiddleware(
+        app=get_app(HTML, b"text/html"),
+        algorithms=[GzipAlgorithm()],
+        capture=capture,
+        exclude_paths=["/health"],
+    )
+    await request(middleware, path="/health")
+    await capture.drain()
+    assert list(load_captures(str(tmp_path))) == []
+
+
+def test_pareto_front() -> None:
+    results = [
+        CandidateResult("gzip-6", bytes_out=100, cpu_ns=10),
+        CandidateResult("gzip-9", bytes_out=100, cpu_ns=20),
+        CandidateResult("br-4", bytes_out=90, cpu_ns=15),
+        CandidateResult("br-11", bytes_out=50, cpu_ns=500),
+        CandidateResult("zstd-19", bytes_out=60, cpu_ns=600),
+    ]
+    pareto_front(results)
+    assert [result.candidate for result in results if result.pareto] == [
+        "gzip-6",
+        "br-4",
+        "br-11",
+    ]
+
+
+def test_recommend() -> None:
+    totals = [
+        CandidateResult("gzip-6", bytes_out=1000, cpu_ns=1_000_000),
+        CandidateResult("gzip-9", bytes_out=990, cpu_ns=5_000_000),
+        CandidateResult("br-4", bytes_out=900, cpu_ns=1_000_000),
+        CandidateResult("zstd-3", bytes_out=800, cpu_ns=0),
+    ]
+    # A CPU millisecond is worth 10 bytes: gzip-9 saves 10 bytes for 4ms.
+    assert recommend(totals, {"gzip", "br"}, 10) == ["br-4", "gzip-6"]
+    # Bandwidth is all that matters.
+    assert recommend(totals, {"gzip", "br", "zstd"}, 0) == [
+        "zstd-3",
+        "br-4",
+        "gzip-9",
+    ]
+
+
+async def test_simulate() -> None:
+    captures = [
+        CapturedResponse("text/html", "gzip, br", [HTML]),
+        CapturedResponse("text/html; charset=utf-8", "gzip", [HTML[:5000]]),
+        CapturedResponse(
+            "application/json", "gzip", [JSON[:4096], JSON[4096:]]
+        ),
+        # Excluded types are replayed like the middleware would, untouched.
+        CapturedResponse("text/event-stream", "gzip", [b"data: 1\n\n" * 500]),
+    ]
+    report = await simulate(captures, ["gzip-1", "gzip-9", "br-4"])
+
+    assert list(report.content_types) == [
+        "text/html",
+        "application/json",
+        "text/event-stream",
+    ]
+    html = report.content_types["text/html"]
+    assert html["gzip-1"].responses == 2
+    assert html["gzip-1"].bytes_in == len(HTML) + 5000
+    assert 0 < html["br-4"].bytes_out < html["gzip-1"].bytes_out
+    assert any(result.pareto for result in html.values())
+    events = report.content_types["text/event-stream"]
+    assert all(result.bytes_saved == 0 for result in events.values())
+    # No client accepts zstd, and only families that are accepted appear.
+    assert {candidate.split("-")[0] for candidate in report.recommended} == {
+        "gzip",
+        "br",
+    }
+    assert "BrotliAlgorithm(quality=4)" in report.config
+
+
+def test_simulate_cli(tmp_path: Path, capsys: pytest.CaptureFixture[str]):
+    capture = TrafficCapture(str(tmp_path), sample_rate=1)
+    middleware = CompressionMiddleware(
+        app=get_app(HTML, b"text/html"),
+        algorithms=[GzipAlgorithm()],
+        capture=capture,
+    )
+
+    async def record() -> None:
+        await request(middleware)
+        await capture.drain()
+
+    asyncio.run(record())
+
+    main(["simulate", str(tmp_path), "--candidates", "gzip-6,br-4", "--json"])
+    output = json.loads(capsys.readouterr().out)
+    assert [
+        result["candidate"] for result in output["content_types"]["text/html"]
+    ] == ["gzip-6", "br-4"]
+    assert output["recommended"]
+
+    main(["simulate", str(tmp_path), "--candidates", "gzip-6,br-4"])
+    output = capsys.readouterr().out
+    assert "text/html (1 responses" in output
+    assert "CompressionMiddleware(\n    app=app,\n    algorithms=[\n" in output
+
+    with pytest.raises(ValueError):
+        main(["simulate", str(tmp_path), "--candidates", "lz4-1"])
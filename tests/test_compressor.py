@@ -0,0 +1,280 @@
+import asyncio
+import zlib
+from dataclasses import dataclass, field
+from importlib.metadata import EntryPoint
+from typing import Any, Iterator
+
+import pytest
+
+from asgi_compression import (
+    AsyncCompressionAlgorithm,
+    AsyncCompressor,
+    CompressionMiddleware,
+    ContentEncoding,
+    GzipAlgorithm,
+    available_encodings,
+    create_algorithm,
+    register_algorithm,
+    registry,
+)
+from asgi_compression.types import ASGIApp, Message, Receive, Scope, Send
+
+CHUNKS = [b"chunk %d " % i * 500 for i in range(4)]
+
+DEFLATE = ContentEncoding.register("deflate")
+
+
+class DeflateCompressor(AsyncCompressor):
+    """Compresses on a worker thread, standing in for another process."""
+
+    def __init__(self, events: list[str]) -> None:
+        self.compressor = zlib.compressobj()
+        self.events = events
+        self.chunks = 0
+
+    async def compress_chunk(self, data: bytes) -> bytes:
+        self.chunks += 1
+        self.events.append(f"compress {self.chunks}")
+        output = await asyncio.to_thread(self.compressor.compress, data)
+        await asyncio.sleep(0.01)
+        self.events.append(f"compressed {self.chunks}")
+        return output + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    async def finish(self) -> bytes:
+        self.events.append("finish")
+        return self.compressor.flush()
+
+    async def aclose(self) -> None:
+        self.events.append("aclose")
+
+
+@dataclass
+class DeflateAlgorithm(AsyncCompressionAlgorithm):
+    type: ContentEncoding = DEFLATE
+    events: list[str] = field(default_factory=list)
+
+    def create_compressor(self) -> DeflateCompressor:
+        return DeflateCompressor(self.events)
+
+
+def get_app(fail: bool = False) -> ASGIApp:
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        for chunk in CHUNKS:
+            await send(
+                {"type": "http.response.body", "body": chunk, "more_body": True}
+            )
+        if fail:
+            raise RuntimeError("app failed")
+        await send({"type": "http.response.body", "body": b""})
+
+    return app
+
+
+async def request(
+    app: ASGIApp,
+    events: list[str],
+    encoding: str = "deflate",
+    headers: tuple[tuple[bytes, bytes], ...] = (),
+) -> tuple[Message, bytes]:
+    start: Message = {}
+    body = b""
+    sent = 0
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal start, body, sent
+        if message["type"] == "http.response.start":
+            start = message
+            return
+        sent += 1
+        events.append(f"send {sent}")
+        # A slow client.
+        await asyncio.sleep(0.02)
+        events.append(f"sent {sent}")
+        body += message["body"]
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", encoding.encode()), *headers],
+    }
+    await app(scope, receive, send)
+    return start, body
+
+
+async def test_async_compressor() -> None:
+    algorithm = DeflateAlgorithm()
+    middleware = CompressionMiddleware(app=get_app(), algorithms=[algorithm])
+    start, body = await request(middleware, [])
+
+    assert (b"Content-Encoding", b"deflate") in start["headers"]
+    assert zlib.decompress(body) == b"".join(CHUNKS)
+    assert algorithm.events[-1] == "finish"
+
+
+@pytest.mark.parametrize("overlap_sends", [False, True])
+async def test_overlap_sends(overlap_sends: bool) -> None:
+    events: list[str] = []
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[DeflateAlgorithm(events=events)],
+        overlap_sends=overlap_sends,
+    )
+    _, body = await request(middleware, events)
+    assert zlib.decompress(body) == b"".join(CHUNKS)
+
+    # Chunks are sent one at a time, in order, whether or not overlapped.
+    sends = [event for event in events if event.startswith("sen")]
+    assert sends == [
+        f"{event} {i}" for i in range(1, 6) for event in ("send", "sent")
+    ]
+    # Chunk 2 is compressed while chunk 1 is being sent.
+    overlapped = events.index("compress 2") < events.index("sent 1")
+    assert overlapped is overlap_sends
+
+
+async def test_overlap_sends_gzip() -> None:
+    events: list[str] = []
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[GzipAlgorithm()],
+        overlap_sends=True,
+    )
+    _, body = await request(middleware, events, encoding="gzip")
+    assert zlib.decompress(body, wbits=31) == b"".join(CHUNKS)
+
+
+async def test_abandoned_compressor_closed() -> None:
+    events: list[str] = []
+    middleware = CompressionMiddleware(
+        app=get_app(fail=True),
+        algorithms=[DeflateAlgorithm(events=events)],
+        overlap_sends=True,
+    )
+    with pytest.raises(RuntimeError, match="app failed"):
+        await request(middleware, events)
+    assert events[-1] == "aclose"
+    # The last chunk was still sent.
+    assert events.count("sent 4") == 1
+
+
+async def test_app_exception_wins_over_pending_send() -> None:
+    middleware = CompressionMiddleware(
+        app=get_app(fail=True),
+        algorithms=[DeflateAlgorithm()],
+        overlap_sends=True,
+    )
+    sent = 0
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            sent += 1
+            if sent == len(CHUNKS):
+                # The client went away while the last chunk was sent.
+                await asyncio.sleep(0.01)
+                raise OSError("connection lost")
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", b"deflate")],
+    }
+    with pytest.raises(RuntimeError, match="app failed"):
+        await middleware(scope, receive, send)
+    assert sent == len(CHUNKS)
+
+
+async def test_async_algorithm_not_a_decoder() -> None:
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[DeflateAlgorithm()],
+        decompress_requests=True,
+    )
+    start, _ = await request(
+        middleware, [], headers=((b"content-encoding", b"deflate"),)
+    )
+    assert start["status"] == 415
+
+
+def test_async_responder_defaults() -> None:
+    responder = DeflateAlgorithm().create_responder(get_app())
+    # Responders without levels ignore them.
+    responder.set_level(9)
+    with pytest.raises(NotImplementedError, match="apply_compression"):
+        responder.apply_compression(b"body", more_body=False)
+
+
+def test_register_encoding() -> None:
+    assert ContentEncoding.register("gzip") is ContentEncoding.GZIP
+    assert ContentEncoding("deflate") is DEFLATE
+    assert DEFLATE.value == "deflate"
+    assert DEFLATE not in list(ContentEncoding)
+    with pytest.raises(ValueError):
+        ContentEncoding.register("de flate")
+
+
+@pytest.fixture
+def entry_points(monkeypatch: pytest.MonkeyPatch) -> Iterator[list[Any]]:
+    declared: list[Any] = []
+    monkeypatch.setattr(registry, "find_entry_points", lambda: declared)
+    monkeypatch.setattr(registry, "_loaded", False)
+    monkeypatch.setattr(registry, "_factories", dict(registry._factories))
+    monkeypatch.setattr(registry, "_entry_points", {})
+    yield declared
+
+
+def test_create_algorithm(entry_points: list[Any]) -> None:
+    assert create_algorithm("gzip", compresslevel=5) == GzipAlgorithm(
+        compresslevel=5
+    )
+    with pytest.raises(ValueError, match="Unknown content encoding"):
+        create_algorithm("deflate")
+
+    register_algorithm("deflate", DeflateAlgorithm)
+    assert isinstance(create_algorithm("deflate"), DeflateAlgorithm)
+
+
+def test_entry_points(entry_points: list[Any]) -> None:
+    entry_points.append(
+        EntryPoint(
+            name="x-deflate",
+            value=f"{__name__}:DeflateAlgorithm",
+            group=registry.ENTRY_POINT_GROUP,
+        )
+    )
+    assert "x-deflate" in available_encodings()
+    assert ContentEncoding("x-deflate").value == "x-deflate"
+    algorithm = create_algorithm("x-deflate", events=["created"])
+    assert isinstance(algorithm, DeflateAlgorithm)
+    assert algorithm.events == ["created"]
+
+
+def test_invalid_entry_point_skipped(entry_points: list[Any]) -> None:
+    for name in ("x deflate", "x-deflate"):
+        entry_points.append(
+            EntryPoint(
+                name=name,
+                value=f"{__name__}:DeflateAlgorithm",
+                group=registry.ENTRY_POINT_GROUP,
+            )
+        )
+    with pytest.warns(RuntimeWarning, match="'x deflate'"):
+        assert "x-deflate" in available_encodings()
+    assert "x deflate" not in available_encodings()
+    assert create_algorithm("gzip") == GzipAlgorithm()
+    assert isinstance(create_algorithm("x-deflate"), DeflateAlgorithm)
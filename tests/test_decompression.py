@@ -0,0 +1,215 @@
+import gzip
+import hashlib
+import tracemalloc
+
+import brotli
+import pytest
+import zstandard
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from asgi_compression.brotli import BrotliAlgorithm
+from asgi_compression.decompression import DECOMPRESSED_CHUNK_SIZE
+from asgi_compression.gzip import GzipAlgorithm
+from asgi_compression.middleware import CompressionMiddleware
+from asgi_compression.zstd import ZstdAlgorithm
+
+from .utils import get_test_client
+
+PAYLOAD = b'{"items": [' + b", ".join(b"%d" % i for i in range(50_000)) + b"]}"
+
+
+def get_echo_app() -> Starlette:
+    async def echo(request: Request) -> JSONResponse:
+        chunks = 0
+        digest = hashlib.sha256()
+        size = 0
+        async for chunk in request.stream():
+            if chunk:
+                chunks += 1
+                size += len(chunk)
+                digest.update(chunk)
+        return JSONResponse(
+            {
+                "size": size,
+                "chunks": chunks,
+                "sha256": digest.hexdigest(),
+                "content_encoding": request.headers.get("content-encoding"),
+            }
+        )
+
+    return Starlette(routes=[Route("/", endpoint=echo, methods=["POST"])])
+
+
+def get_middleware(**kwargs) -> CompressionMiddleware:
+    return CompressionMiddleware(
+        app=get_echo_app(),
+        algorithms=[BrotliAlgorithm(), ZstdAlgorithm(), GzipAlgorithm()],
+        decompress_requests=True,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize(
+    "encoding,compress",
+    [
+        ("gzip", gzip.compress),
+        ("br", brotli.compress),
+        ("zstd", zstandard.ZstdCompressor().compress),
+    ],
+)
+async def test_request_body_is_decompressed(encoding, compress) -> None:
+    async with get_test_client(get_middleware()) as client:
+        response = await client.post(
+            "/",
+            content=compress(PAYLOAD),
+            headers={"content-encoding": encoding},
+        )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["size"] == len(PAYLOAD)
+    assert data["sha256"] == hashlib.sha256(PAYLOAD).hexdigest()
+    assert data["content_encoding"] is None
+    # Output is handed to the app incrementally, not as a single buffer.
+    assert data["chunks"] > 1
+
+
+async def test_multi_member_gzip_request_body() -> None:
+    body = gzip.compress(PAYLOAD[:1000]) + gzip.compress(PAYLOAD[1000:])
+    async with get_test_client(get_middleware()) as client:
+        response = await client.post(
+            "/", content=body, headers={"content-encoding": "gzip"}
+        )
+
+    assert response.status_code == 200
+    assert response.json()["sha256"] == hashlib.sha256(PAYLOAD).hexdigest()
+
+
+async def test_decompression_disabled_by_default() -> None:
+    middleware = CompressionMiddleware(
+        app=get_echo_app(), algorithms=[GzipAlgorithm()]
+    )
+    compressed = gzip.compress(PAYLOAD)
+    async with get_test_client(middleware) as client:
+        response = await client.post(
+            "/", content=compressed, headers={"content-encoding": "gzip"}
+        )
+
+    assert response.status_code == 200
+    assert response.json()["size"] == len(compressed)
+    assert response.json()["content_encoding"] == "gzip"
+
+
+async def test_unsupported_request_encoding() -> None:
+    async with get_test_client(get_middleware()) as client:
+        response = await client.post(
+            "/", content=b"data", headers={"content-encoding": "compress"}
+        )
+
+    assert response.status_code == 415
+    assert response.headers["Accept-Encoding"] == "br, zstd, gzip"
+
+
+async def test_decompressed_size_limit() -> None:
+    middleware = get_middleware(max_decompressed_size=10_000)
+    async with get_test_client(middleware) as client:
+        response = await client.post(
+            "/",
+            content=gzip.compress(b"\0" * 1_000_000),
+            headers={"content-encoding": "gzip"},
+        )
+
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize(
+    "body",
+    [b"not gzip at all", gzip.compress(PAYLOAD)[:-20]],
+    ids=["invalid", "truncated"],
+)
+async def test_invalid_request_body(body: bytes) -> None:
+    async with get_test_client(get_middleware()) as client:
+        response = await client.post(
+            "/", content=body, headers={"content-encoding": "gzip"}
+        )
+
+    assert response.status_code == 400
+
+
+def zstd_bomb(blocks: int) -> bytes:
+    """A zstd frame of RLE blocks, 4 bytes decompressing to 128 KiB each."""
+    # No content size, 128 KiB window.
+    header = b"\x28\xb5\x2f\xfd\x00\x38"
+    block = ((128 * 1024) << 3 | 1 << 1).to_bytes(3, "little") + b"\0"
+    last = ((128 * 1024) << 3 | 1 << 1 | 1).to_bytes(3, "little") + b"\0"
+    return header + block * (blocks - 1) + last
+
+
+def test_zstd_decompression_is_bounded() -> None:
+    decompressor = ZstdAlgorithm().create_decompressor()
+    bomb = zstd_bomb(2048)
+    tracemalloc.start()
+    try:
+        size = 0
+        for chunk in decompressor.decompress(bomb):
+            assert len(chunk) <= DECOMPRESSED_CHUNK_SIZE
+            size += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    decompressor.finish()
+
+    assert size == 2048 * 128 * 1024
+    # 256 MiB of output, never more than a block at once.
+    assert peak < 2 * 1024 * 1024
+
+
+async def test_zstd_bomb_rejected() -> None:
+    middleware = get_middleware(max_decompressed_size=1_000_000)
+    tracemalloc.start()
+    try:
+        async with get_test_client(middleware) as client:
+            response = await client.post(
+                "/",
+                content=zstd_bomb(2048),
+                headers={"content-encoding": "zstd"},
+            )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert response.status_code == 413
+    assert peak < 8 * 1024 * 1024
+
+
+def test_zstd_skippable_frames() -> None:
+    skippable = b"\x5a\x2a\x4d\x18" + (3).to_bytes(4, "little") + b"abc"
+    frame = zstandard.ZstdCompressor(write_checksum=True).compress(PAYLOAD)
+    body = skippable + frame + skippable + frame
+    decompressor = ZstdAlgorithm().create_decompressor()
+    output = b"".join(
+        chunk
+        for offset in range(0, len(body), 5)
+        for chunk in decompressor.decompress(body[offset : offset + 5])
+    )
+    decompressor.finish()
+    assert output == PAYLOAD * 2
+
+
+async def test_brotli_requires_output_limit(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # brotli < 1.2 can't bound the output of a decompression call.
+    monkeypatch.delattr(brotli.Decompressor, "can_accept_more_data")
+    async with get_test_client(get_middleware()) as client:
+        response = await client.post(
+            "/",
+            content=brotli.compress(PAYLOAD),
+            headers={"content-encoding": "br"},
+        )
+
+    assert response.status_code == 415
+    assert response.headers["Accept-Encoding"] == "zstd, gzip"
@@ -0,0 +1,237 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+from typing import Optional
+
+import pytest
+
+from asgi_compression import (
+    AdaptiveEffort,
+    CompressionMiddleware,
+    GzipAlgorithm,
+    MemoryVariantCache,
+    ThreadBudget,
+    ZstdAlgorithm,
+)
+from asgi_compression.base import CompressionAlgorithm
+from asgi_compression.types import (
+    ASGIApp,
+    Receive,
+    Scope,
+    Send,
+)
+
+from .utils import decompress_zstd, request
+
+BODY = b"".join(
+    b'{"id": %d, "name": "item %d", "tags": ["a", "b"]}\n' % (i, i % 13)
+    for i in range(20000)
+)
+CHUNK_SIZE = 64 * 1024
+
+
+def get_app(
+    streaming: bool = False,
+    headers: Optional[list[tuple[bytes, bytes]]] = None,
+) -> ASGIApp:
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/json")]
+                + (headers or []),
+            }
+        )
+        if not streaming:
+            await send({"type": "http.response.body", "body": BODY})
+            return
+        for offset in range(0, len(BODY), CHUNK_SIZE):
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": BODY[offset : offset + CHUNK_SIZE],
+                    "more_body": True,
+                }
+            )
+        await send({"type": "http.response.body", "body": b""})
+
+    return app
+
+
+def sha256_digest(body: bytes) -> str:
+    return (
+        f"sha-256=:{base64.b64encode(hashlib.sha256(body).digest()).decode()}:"
+    )
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+async def test_gzip_header_has_no_mtime(
+    monkeypatch: pytest.MonkeyPatch, streaming: bool
+) -> None:
+    async def compress(deterministic: bool, now: float) -> bytes:
+        monkeypatch.setattr("asgi_compression.gzip.time.time", lambda: now)
+        middleware = CompressionMiddleware(
+            app=get_app(streaming),
+            algorithms=[GzipAlgorithm()],
+            deterministic=deterministic,
+        )
+        return (await request(middleware)).body
+
+    assert await compress(False, 1000) != await compress(False, 2000)
+    body = await compress(True, 1000)
+    assert body == await compress(True, 2000)
+    assert body[4:8] == b"\0\0\0\0"
+    assert gzip.decompress(body) == BODY
+
+
+async def exhausted(budget: ThreadBudget, app: ASGIApp, encoding: str) -> bytes:
+    """Body compressed while the budget has no thread to spare."""
+    budget.acquire(budget.max_threads)
+    try:
+        return (await request(app, accept_encoding=encoding)).body
+    finally:
+        budget.release(budget.max_threads)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+async def test_output_independent_of_threads(
+    encoding: str, streaming: bool
+) -> None:
+    budget = ThreadBudget(max_threads=4)
+
+    def middleware(deterministic: bool) -> CompressionMiddleware:
+        algorithm: CompressionAlgorithm
+        if encoding == "gzip":
+            algorithm = GzipAlgorithm(
+                parallel_threshold=0,
+                parallel_block_size=32 * 1024,
+                thread_budget=budget,
+            )
+        else:
+            algorithm = ZstdAlgorithm(threads=2, thread_budget=budget)
+        return CompressionMiddleware(
+            app=get_app(streaming),
+            algorithms=[algorithm],
+            deterministic=deterministic,
+        )
+
+    app = middleware(deterministic=True)
+    body = (await request(app, accept_encoding=encoding)).body
+    assert await exhausted(budget, app, encoding) == body
+    if encoding == "gzip":
+        assert gzip.decompress(body) == BODY
+    else:
+        assert decompress_zstd(body) == BODY
+
+    if encoding == "gzip":
+        # Otherwise bodies no thread is granted for are compressed serially.
+        app = middleware(deterministic=False)
+        body = (await request(app, accept_encoding=encoding)).body
+        assert await exhausted(budget, app, encoding) != body
+    assert budget.in_use == 0
+    budget.shutdown()
+
+
+async def test_adaptive_effort_disabled() -> None:
+    effort = AdaptiveEffort(
+        min_level=1,
+        max_level=9,
+        slow_throughput=100_000,
+        fast_throughput=1_000_000,
+        interval=1,
+    )
+
+    def middleware(deterministic: bool) -> CompressionMiddleware:
+        return CompressionMiddleware(
+            app=get_app(streaming=True),
+            algorithms=[GzipAlgorithm(compresslevel=9, adaptive_effort=effort)],
+            deterministic=deterministic,
+        )
+
+    # Instant sends make the client look fast, lowering the level.
+    adapted = (await request(middleware(False))).body
+    body = (await request(middleware(True))).body
+    assert len(body) < len(adapted)
+    assert gzip.decompress(body) == BODY
+
+
+async def test_content_digest_single() -> None:
+    middleware = CompressionMiddleware(
+        app=get_app(headers=[(b"content-digest", b"sha-256=:identity:")]),
+        algorithms=[GzipAlgorithm()],
+        content_digest=True,
+    )
+    response = await request(middleware)
+    assert response.headers["content-digest"] == sha256_digest(response.body)
+    assert response.trailers is None
+
+
+async def test_content_digest_cached() -> None:
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[GzipAlgorithm()],
+        content_digest=True,
+        cache=MemoryVariantCache(),
+    )
+    first = await request(middleware)
+    second = await request(middleware)
+    assert first.body == second.body
+    assert second.headers["content-digest"] == sha256_digest(second.body)
+
+
+async def test_content_digest_trailer() -> None:
+    middleware = CompressionMiddleware(
+        app=get_app(streaming=True),
+        algorithms=[ZstdAlgorithm()],
+        content_digest=True,
+    )
+    response = await request(middleware, accept_encoding="zstd", trailers=True)
+    assert response.start["trailers"] is True
+    assert response.headers["trailer"] == "Content-Digest"
+    assert "content-digest" not in response.headers
+    assert response.trailers == {
+        "type": "http.response.trailers",
+        "headers": [(b"content-digest", sha256_digest(response.body).encode())],
+        "more_trailers": False,
+    }
+    assert decompress_zstd(response.body) == BODY
+
+
+async def test_content_digest_without_trailers() -> None:
+    middleware = CompressionMiddleware(
+        app=get_app(
+            streaming=True,
+            headers=[(b"content-digest", b"sha-256=:identity:")],
+        ),
+        algorithms=[GzipAlgorithm()],
+        content_digest=True,
+    )
+    response = await request(middleware)
+    # The app's digest is that of the uncompressed body.
+    assert "content-digest" not in response.headers
+    assert "trailer" not in response.headers
+    assert not response.start.get("trailers")
+    assert response.trailers is None
+
+
+async def test_content_digest_left_on_unencoded_responses() -> None:
+    middleware = CompressionMiddleware(
+        app=get_app(headers=[(b"content-digest", b"sha-256=:identity:")]),
+        algorithms=[GzipAlgorithm()],
+        content_digest=True,
+    )
+    response = await request(middleware, accept_encoding="identity")
+    assert response.body == BODY
+    assert response.headers["content-digest"] == "sha-256=:identity:"
+
+
+def test_content_digest_disabled_by_default() -> None:
+    response = asyncio.run(
+        request(
+            CompressionMiddleware(app=get_app(), algorithms=[GzipAlgorithm()])
+        )
+    )
+    assert "content-digest" not in response.headers
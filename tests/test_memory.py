@@ -0,0 +1,226 @@
+import asyncio
+import gc
+import os
+import tracemalloc
+from typing import Optional
+
+import pytest
+
+from asgi_compression.base import CompressionAlgorithm, CompressionResponder
+from asgi_compression.brotli import BrotliAlgorithm
+from asgi_compression.gzip import GzipAlgorithm
+from asgi_compression.middleware import CompressionMiddleware
+from asgi_compression.pool import ThreadBudget
+from asgi_compression.types import ASGIApp, Message, Receive, Scope, Send
+from asgi_compression.zstd import ZstdAlgorithm
+
+KB = 1024
+MB = 1024 * KB
+BODY = b"".join(
+    b"%08d lorem ipsum dolor sit amet %d\n" % (i, i * 7 % 13)
+    for i in range(8000)
+)
+CHUNK_SIZE = 16 * KB
+CONCURRENCY = 8
+
+# Per-request bounds on traced memory and RSS growth while CONCURRENCY
+# responses are in flight. tracemalloc sees zlib's state but not brotli's or
+# zstd's, whose allocations only show in RSS. Scale them all with the
+# MEMORY_BOUND_SCALE environment variable.
+SCALE = float(os.environ.get("MEMORY_BOUND_SCALE", "1"))
+TRACED_BOUNDS = {"gzip": 512 * KB, "br": 64 * KB, "zstd": 256 * KB}
+RSS_BOUNDS = {"gzip": 2 * MB, "br": 8 * MB, "zstd": 8 * MB}
+
+ALGORITHMS = [
+    pytest.param(GzipAlgorithm(), id="gzip"),
+    pytest.param(BrotliAlgorithm(), id="br"),
+    pytest.param(ZstdAlgorithm(), id="zstd"),
+]
+
+
+def current_rss() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * KB
+    except OSError:  # pragma: no cover
+        pass
+    return None  # pragma: no cover
+
+
+def get_app(streaming: bool, fail_after: Optional[int] = None) -> ASGIApp:
+    """
+    App sending BODY in one message or in chunks, or raising after
+    `fail_after` chunks.
+    """
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        if not streaming:
+            await send({"type": "http.response.body", "body": BODY})
+            return
+
+        for index, offset in enumerate(range(0, len(BODY), CHUNK_SIZE)):
+            if index == fail_after:
+                raise RuntimeError("app failed mid-stream")
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": BODY[offset : offset + CHUNK_SIZE],
+                    "more_body": True,
+                }
+            )
+            # Let the other responses interleave.
+            await asyncio.sleep(0)
+        await send({"type": "http.response.body", "body": b""})
+
+    return app
+
+
+async def receive() -> Message:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+def get_scope(encoding: str) -> Scope:
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", encoding.encode())],
+    }
+
+
+class PeakRSS:
+    """ASGI `send` tracking the RSS growth seen while sending."""
+
+    def __init__(self, disconnect_after: Optional[int] = None) -> None:
+        self.baseline = current_rss()
+        self.peak = 0
+        self.messages = 0
+        self.disconnect_after = disconnect_after
+
+    async def __call__(self, message: Message) -> None:
+        rss = current_rss()
+        if rss is not None and self.baseline is not None:
+            self.peak = max(self.peak, rss - self.baseline)
+        self.messages += 1
+        if self.messages == self.disconnect_after:
+            raise OSError("client disconnected")
+
+
+def live_responders() -> int:
+    gc.collect()
+    # Not isinstance, which lazy proxies such as Django's settings forward.
+    return sum(
+        issubclass(type(obj), CompressionResponder) for obj in gc.get_objects()
+    )
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+async def test_memory_per_request(
+    algorithm: CompressionAlgorithm, streaming: bool
+) -> None:
+    encoding = algorithm.type.value
+    middleware = CompressionMiddleware(
+        app=get_app(streaming), algorithms=[algorithm]
+    )
+    # Warm up, lazy imports and one-off allocations aren't per request.
+    await middleware(get_scope(encoding), receive, PeakRSS())
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        sends = [PeakRSS() for _ in range(CONCURRENCY)]
+        await asyncio.gather(
+            *(middleware(get_scope(encoding), receive, send) for send in sends)
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert (peak - baseline) / CONCURRENCY < TRACED_BOUNDS[encoding] * SCALE
+    rss_growth = max(send.peak for send in sends)
+    assert rss_growth / CONCURRENCY < RSS_BOUNDS[encoding] * SCALE
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+async def test_state_released_after_last_chunk(
+    algorithm: CompressionAlgorithm,
+) -> None:
+    """Compressor state doesn't outlive the body, e.g. in background tasks."""
+    responders: list[CompressionResponder] = []
+    states: list[object] = []
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await get_app(streaming=True)(scope, receive, send)
+        (responder,) = responders
+        states.extend(
+            getattr(responder, name, None)
+            for name in ("compressor", "compression_stream", "zstd_buffer")
+        )
+
+    responder = algorithm.create_responder(app)
+    responders.append(responder)
+    await responder(get_scope(algorithm.type.value), receive, PeakRSS())
+    assert states == [None, None, None]
+
+
+@pytest.mark.parametrize(
+    "fail_after, disconnect_after",
+    [
+        (3, None),  # app exception mid-stream
+        (0, None),  # app exception before the first body
+        (None, 4),  # client disconnect mid-stream
+    ],
+)
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+async def test_abandoned_responses_dont_leak(
+    algorithm: CompressionAlgorithm,
+    fail_after: Optional[int],
+    disconnect_after: Optional[int],
+) -> None:
+    encoding = algorithm.type.value
+    budget = ThreadBudget(max_threads=4)
+    if isinstance(algorithm, ZstdAlgorithm):
+        algorithm = ZstdAlgorithm(threads=2, thread_budget=budget)
+    middleware = CompressionMiddleware(
+        app=get_app(streaming=True, fail_after=fail_after),
+        algorithms=[algorithm],
+        max_header_hold=10,
+    )
+
+    async def abandoned() -> None:
+        with pytest.raises((RuntimeError, OSError)):
+            await middleware(
+                get_scope(encoding), receive, PeakRSS(disconnect_after)
+            )
+
+    await abandoned()
+    # Let cancelled hold timers finish.
+    await asyncio.sleep(0)
+    responders = live_responders()
+    tasks = len(asyncio.all_tasks())
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        await asyncio.gather(*(abandoned() for _ in range(CONCURRENCY * 4)))
+        await asyncio.sleep(0)
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert current - baseline < 64 * KB
+    assert live_responders() == responders
+    assert len(asyncio.all_tasks()) == tasks
+    assert budget.in_use == 0
+    budget.shutdown()
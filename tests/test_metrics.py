@@ -0,0 +1,111 @@
+import json
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from asgi_compression.__main__ import main
+from asgi_compression.base import ContentEncoding
+from asgi_compression.gzip import GzipAlgorithm
+from asgi_compression.hooks import CompressionSummary
+from asgi_compression.metrics import SharedMetrics, read_shared_metrics
+from asgi_compression.middleware import CompressionMiddleware
+
+from .utils import get_streaming_app, get_test_client
+
+SUMMARY = CompressionSummary(
+    encoding=ContentEncoding.GZIP,
+    bytes_in=1000,
+    bytes_out=100,
+    duration_ns=5000,
+    chunks=1,
+)
+
+
+def record(path: str, responses: int) -> None:
+    """Worker process recording `responses` compressed responses."""
+    metrics = SharedMetrics(path, slots=4)
+    for _ in range(responses):
+        metrics.on_finish(SUMMARY)
+    metrics.close()
+
+
+def run_worker(path: str, responses: int) -> None:
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(target=record, args=(path, responses))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+
+async def test_shared_metrics(tmp_path: Path) -> None:
+    metrics = SharedMetrics(str(tmp_path / "metrics"))
+    middleware = CompressionMiddleware(
+        app=get_streaming_app(),
+        algorithms=[GzipAlgorithm()],
+        hooks=metrics,
+    )
+
+    async with get_test_client(middleware) as client:
+        await client.get("/", headers={"accept-encoding": "gzip"})
+        await client.get("/", headers={"accept-encoding": "identity"})
+
+    totals = metrics.aggregate()
+    assert totals["workers"] == 1
+    assert totals["responses"] == 2
+    assert totals["compressed_responses"] == 1
+    assert totals["bypassed_responses"] == 1
+    assert totals["bytes_in"] == 8000
+    assert totals["bytes_out"] == metrics.bytes_out
+    metrics.close()
+
+
+def test_shared_metrics_across_processes(tmp_path: Path) -> None:
+    path = str(tmp_path / "metrics")
+    run_worker(path, 3)
+    run_worker(path, 2)
+
+    metrics = read_shared_metrics(path)
+    # The second worker reused the slot of the first one, which had exited,
+    # along with its counters.
+    assert len(metrics["workers"]) == 1
+    assert not metrics["workers"][0]["alive"]
+    assert metrics["totals"]["responses"] == 5
+    assert metrics["totals"]["bytes_in"] == 5000
+    assert metrics["totals"]["duration_ns"] == 25000
+
+    metrics = SharedMetrics(path)
+    # The file's slot count wins over the one given.
+    assert metrics.slots == 4
+    metrics.on_finish(SUMMARY)
+    assert metrics.responses == 6
+    assert metrics.aggregate()["responses"] == 6
+    metrics.close()
+
+
+def test_shared_metrics_invalid_file(tmp_path: Path) -> None:
+    path = tmp_path / "metrics"
+    path.write_bytes(b"x" * 100)
+    with pytest.raises(ValueError):
+        SharedMetrics(str(path))
+
+
+def test_stats_command(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    path = str(tmp_path / "metrics")
+    metrics = SharedMetrics(path)
+    metrics.on_finish(SUMMARY)
+    metrics.on_finish(CompressionSummary(encoding=ContentEncoding.IDENTITY))
+
+    main(["stats", path, "--json"])
+    output = json.loads(capsys.readouterr().out)
+    assert output["totals"]["responses"] == 2
+    assert output["totals"]["bypassed_responses"] == 1
+    assert output["workers"][0]["alive"]
+
+    main(["stats", path])
+    output = capsys.readouterr().out
+    assert "responses            2" in output
+    assert "bytes out            100 (10.0%)" in output
+    metrics.close()
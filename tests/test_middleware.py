@@ -1,20 +1,53 @@
-from typing import Any
+import asyncio
+import gzip
+from typing import Any, AsyncGenerator, Optional
 
 import pytest
+from brotli import compress as brotli_compress
 from httpx import AsyncClient
 from starlette.applications import Starlette
-from starlette.responses import PlainTextResponse
+from starlette.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from starlette.routing import Route
 from typing_extensions import assert_never
 
 from asgi_compression import brotli, zstd
+from asgi_compression.base import (
+    ENCODING_EXTENSION,
+    PRE_ENCODED_KEY,
+    ContentEncoding,
+)
 from asgi_compression.brotli import BrotliAlgorithm
+from asgi_compression.etag import ETagMode, encode_etag, etag_matches
 from asgi_compression.gzip import GzipAlgorithm
+from asgi_compression.identity import IdentityAlgorithm
+from asgi_compression.metrics import CompressionMetrics
 from asgi_compression.middleware import CompressionMiddleware
+from asgi_compression.profiles import (
+    MAX_NEGOTIATION_CACHE_SIZE,
+    CompressionProfile,
+)
+from asgi_compression.types import (
+    Headers,
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
 from asgi_compression.zstd import ZstdAlgorithm
 
+from .conftest import get_starlette_app
 from .types import Encoding
-from .utils import get_test_client, unimport_module
+from .utils import (
+    RecordingHooks,
+    get_streaming_app,
+    get_test_client,
+    unimport_module,
+)
 
 
 def determine_encoding(request: pytest.FixtureRequest) -> Encoding:
@@ -301,3 +334,622 @@ def test_zstd_not_available(monkeypatch: pytest.MonkeyPatch):
             app=app,
             algorithms=[ZstdAlgorithm()],
         )
+
+
+async def test_hooks_are_called():
+    hooks = RecordingHooks()
+    middleware = CompressionMiddleware(
+        app=get_streaming_app(),
+        algorithms=[GzipAlgorithm()],
+        hooks=hooks,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get("/", headers={"accept-encoding": "gzip"})
+        assert response.text == "x" * 4000
+
+    assert hooks.started == [ContentEncoding.GZIP]
+    assert len(hooks.chunks) == 1
+    assert hooks.chunks[0][0] == 4000
+
+    (summary,) = hooks.summaries
+    assert summary.encoding == ContentEncoding.GZIP
+    assert summary.bytes_in == 4000
+    assert summary.bytes_out == int(response.headers["Content-Length"])
+    assert summary.chunks == 1
+
+
+async def test_hooks_streaming_and_identity():
+    hooks = RecordingHooks()
+    middleware = CompressionMiddleware(
+        app=get_streaming_app(),
+        algorithms=[GzipAlgorithm()],
+        hooks=hooks,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            "/streaming", headers={"accept-encoding": "gzip"}
+        )
+        assert response.text == "x" * 4000
+        response = await client.get(
+            "/", headers={"accept-encoding": "identity"}
+        )
+        assert response.text == "x" * 4000
+
+    streaming, identity = hooks.summaries
+    assert streaming.encoding == ContentEncoding.GZIP
+    assert streaming.bytes_in == 4000
+    assert streaming.chunks == 11  # 10 chunks + final empty message
+    assert identity.encoding == ContentEncoding.IDENTITY
+
+
+async def test_metrics_aggregation():
+    metrics = CompressionMetrics()
+    middleware = CompressionMiddleware(
+        app=get_streaming_app(),
+        algorithms=[GzipAlgorithm()],
+        hooks=metrics,
+    )
+
+    async with get_test_client(middleware) as client:
+        await client.get("/", headers={"accept-encoding": "gzip"})
+        await client.get("/", headers={"accept-encoding": "identity"})
+
+    assert metrics.responses == 2
+    assert metrics.compressed_responses == 1
+    assert metrics.bypassed_responses == 1
+    assert metrics.bytes_in == 8000
+    assert metrics.bytes_out < metrics.bytes_in
+
+
+async def test_server_timing_header():
+    middleware = CompressionMiddleware(
+        app=get_streaming_app(),
+        algorithms=[GzipAlgorithm()],
+        server_timing=True,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get("/", headers={"accept-encoding": "gzip"})
+        assert response.headers["Server-Timing"].startswith("compress;dur=")
+
+        response = await client.get(
+            "/streaming", headers={"accept-encoding": "gzip"}
+        )
+        assert "Server-Timing" not in response.headers
+
+        response = await client.get(
+            "/", headers={"accept-encoding": "identity"}
+        )
+        assert "Server-Timing" not in response.headers
+
+
+def get_precompressed_app() -> Starlette:
+    async def precompressed(request):
+        return Response(
+            gzip.compress(b"x" * 4000),
+            media_type="text/plain",
+            headers={"Content-Encoding": "gzip"},
+        )
+
+    async def precompressed_streaming(request):
+        compressed = gzip.compress(b"x" * 4000)
+
+        async def generator() -> AsyncGenerator[bytes, None]:
+            for offset in range(0, len(compressed), 10):
+                yield compressed[offset : offset + 10]
+
+        return StreamingResponse(
+            generator(),
+            media_type="text/plain",
+            headers={"Content-Encoding": "gzip"},
+        )
+
+    return Starlette(
+        routes=[
+            Route("/", endpoint=precompressed),
+            Route("/streaming", endpoint=precompressed_streaming),
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,expected_encoding",
+    [
+        ("br", "br"),  # gzip isn't acceptable
+        ("gzip, br", "br"),  # gzip is acceptable, but br is preferred
+        ("gzip", "gzip"),  # already optimal, passed through
+        ("identity", None),  # decoded only
+    ],
+)
+@pytest.mark.parametrize("path", ["/", "/streaming"])
+async def test_transcoding(
+    accept_encoding: str,
+    expected_encoding: Optional[str],
+    path: str,
+) -> None:
+    middleware = CompressionMiddleware(
+        app=get_precompressed_app(),
+        algorithms=[BrotliAlgorithm(), GzipAlgorithm()],
+        transcode=True,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            path, headers={"accept-encoding": accept_encoding}
+        )
+
+    assert response.status_code == 200
+    assert response.text == "x" * 4000
+    assert response.headers.get("Content-Encoding") == expected_encoding
+    if path == "/streaming":
+        assert "Content-Length" not in response.headers
+    else:
+        content_length = int(response.headers["Content-Length"])
+        assert content_length == response.num_bytes_downloaded
+
+
+async def test_transcoding_disabled_by_default() -> None:
+    middleware = CompressionMiddleware(
+        app=get_precompressed_app(),
+        algorithms=[BrotliAlgorithm(), GzipAlgorithm()],
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get("/", headers={"accept-encoding": "br"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Vary" not in response.headers
+
+
+async def test_transcoding_unknown_encoding_passthrough() -> None:
+    middleware = CompressionMiddleware(
+        app=get_starlette_app(),
+        algorithms=[BrotliAlgorithm(), GzipAlgorithm()],
+        transcode=True,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            "/streaming_response_with_content_encoding",
+            headers={"accept-encoding": "gzip, br"},
+        )
+
+    assert response.text == "x" * 4000
+    assert response.headers["Content-Encoding"] == "text"
+    assert "Vary" not in response.headers
+
+
+def get_etag_app() -> Starlette:
+    async def homepage(request):
+        return PlainTextResponse("x" * 4000, headers={"ETag": '"abc"'})
+
+    return Starlette(routes=[Route("/", endpoint=homepage)])
+
+
+@pytest.mark.parametrize(
+    "etag,mode,expected",
+    [
+        ('"abc"', ETagMode.SUFFIX, '"abc-gzip"'),
+        ('W/"abc"', ETagMode.SUFFIX, 'W/"abc-gzip"'),
+        ('"abc"', ETagMode.WEAK, 'W/"abc"'),
+        ('W/"abc"', ETagMode.WEAK, 'W/"abc"'),
+    ],
+)
+def test_encode_etag(etag: str, mode: ETagMode, expected: str) -> None:
+    assert encode_etag(etag, "gzip", mode) == expected
+
+
+def test_encode_etag_with_params() -> None:
+    fast = encode_etag('"abc"', "gzip", ETagMode.SUFFIX, "compresslevel=1")
+    best = encode_etag('"abc"', "gzip", ETagMode.SUFFIX, "compresslevel=9")
+    assert fast.startswith('"abc-gzip-') and fast.endswith('"')
+    assert fast != best
+    assert encode_etag('"abc"', "gzip", ETagMode.WEAK, "level=1") == 'W/"abc"'
+
+
+@pytest.mark.parametrize(
+    "if_none_match,expected",
+    [
+        ('"abc-gzip"', True),
+        ('W/"abc-gzip"', True),
+        ('"xyz", "abc-gzip"', True),
+        ("*", True),
+        ('"abc"', False),
+        ('"abc-br"', False),
+    ],
+)
+def test_etag_matches(if_none_match: str, expected: bool) -> None:
+    assert etag_matches(if_none_match, '"abc-gzip"') is expected
+
+
+@pytest.mark.parametrize(
+    "mode,accept_encoding,expected",
+    [
+        (ETagMode.SUFFIX, "gzip", '"abc-gzip"'),
+        (ETagMode.SUFFIX, "br", '"abc-br"'),
+        (ETagMode.WEAK, "gzip", 'W/"abc"'),
+        (ETagMode.SUFFIX, "identity", '"abc"'),
+        (None, "gzip", '"abc"'),
+    ],
+)
+async def test_encoded_etag(
+    mode: Optional[ETagMode],
+    accept_encoding: str,
+    expected: str,
+) -> None:
+    middleware = CompressionMiddleware(
+        app=get_etag_app(),
+        algorithms=[BrotliAlgorithm(), GzipAlgorithm()],
+        etag_mode=mode,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            "/", headers={"accept-encoding": accept_encoding}
+        )
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] == expected
+
+
+async def test_conditional_request_short_circuit() -> None:
+    hooks = RecordingHooks()
+    middleware = CompressionMiddleware(
+        app=get_etag_app(),
+        algorithms=[BrotliAlgorithm(), GzipAlgorithm()],
+        etag_mode=ETagMode.SUFFIX,
+        hooks=hooks,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            "/",
+            headers={"accept-encoding": "gzip", "if-none-match": '"abc-gzip"'},
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == '"abc-gzip"'
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert "Content-Length" not in response.headers
+
+        # A different variant doesn't match.
+        response = await client.get(
+            "/",
+            headers={"accept-encoding": "br", "if-none-match": '"abc-gzip"'},
+        )
+        assert response.status_code == 200
+        assert response.text == "x" * 4000
+
+        response = await client.post(
+            "/",
+            headers={"accept-encoding": "gzip", "if-none-match": '"abc-gzip"'},
+        )
+        assert response.status_code == 405
+
+    assert hooks.summaries[0].chunks == 0
+
+
+class SlowApp:
+    """App that waits for its headers to reach the client before the body."""
+
+    def __init__(self, headers: list[tuple[bytes, bytes]]) -> None:
+        self.headers = headers
+        self.headers_sent = asyncio.Event()
+        self.waited_for_body = False
+        self.messages: list[Message] = []
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": self.headers,
+            }
+        )
+        try:
+            await asyncio.wait_for(self.headers_sent.wait(), 0.2)
+        except asyncio.TimeoutError:
+            self.waited_for_body = True
+        await send(
+            {
+                "type": "http.response.body",
+                "body": b"x" * 400,
+                "more_body": True,
+            }
+        )
+        await send({"type": "http.response.body", "body": b"x" * 400})
+
+    async def run(self, **kwargs: Any) -> Headers:
+        async def receive() -> Message:
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                self.headers_sent.set()
+            self.messages.append(message)
+
+        middleware = CompressionMiddleware(
+            app=self, algorithms=[GzipAlgorithm()], **kwargs
+        )
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "headers": [(b"accept-encoding", b"gzip")],
+        }
+        await middleware(scope, receive, send)
+        return Headers(raw=self.messages[0]["headers"])
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(message["body"] for message in self.messages[1:])
+
+
+async def test_headers_held_until_first_body():
+    app = SlowApp([(b"content-type", b"text/plain")])
+    headers = await app.run()
+    assert app.waited_for_body
+    assert headers["Content-Encoding"] == "gzip"
+
+
+async def test_early_headers():
+    app = SlowApp([(b"content-type", b"text/plain")])
+    headers = await app.run(early_headers=True)
+    assert not app.waited_for_body
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(app.body) == b"x" * 800
+
+
+async def test_early_headers_pass_through_excluded_types():
+    app = SlowApp([(b"content-type", b"text/event-stream")])
+    headers = await app.run(early_headers=True)
+    assert not app.waited_for_body
+    assert "Content-Encoding" not in headers
+    assert app.body == b"x" * 800
+
+
+async def test_early_headers_wait_for_content_length():
+    app = SlowApp(
+        [(b"content-type", b"text/plain"), (b"content-length", b"800")]
+    )
+    headers = await app.run(early_headers=True)
+    assert app.waited_for_body
+    assert headers["Content-Encoding"] == "gzip"
+
+
+@pytest.mark.parametrize(
+    "content_length, compressed", [(b"800", True), (b"100", False)]
+)
+async def test_max_header_hold(content_length: bytes, compressed: bool):
+    app = SlowApp(
+        [(b"content-type", b"text/plain"), (b"content-length", content_length)]
+    )
+    headers = await app.run(max_header_hold=0.01)
+    assert not app.waited_for_body
+    if compressed:
+        assert headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in headers
+        assert gzip.decompress(app.body) == b"x" * 800
+    else:
+        assert "Content-Encoding" not in headers
+        assert headers["Content-Length"] == "100"
+        assert app.body == b"x" * 800
+
+
+async def test_excluded_types_are_not_held():
+    app = SlowApp([(b"content-type", b"text/event-stream")])
+    headers = await app.run()
+    assert not app.waited_for_body
+    assert "Vary" not in headers
+    assert app.body == b"x" * 800
+
+
+class PreEncodedResponse(Response):
+    """Response whose body the app already encoded with `encoding`."""
+
+    def __init__(self, content: bytes, encoding: str) -> None:
+        super().__init__(content, media_type="text/plain")
+        self.encoding = encoding
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        async def marked_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message[PRE_ENCODED_KEY] = self.encoding
+            await send(message)
+
+        await super().__call__(scope, receive, marked_send)
+
+
+def get_pre_encoded_app(body: bytes) -> Starlette:
+    encoders = {"gzip": gzip.compress, "br": brotli_compress}
+
+    async def homepage(request):
+        extension = request.scope["extensions"][ENCODING_EXTENSION]
+        encoding = extension["encoding"]
+        if encoding == "identity":
+            return PlainTextResponse(body)
+        return PreEncodedResponse(encoders[encoding](body), encoding)
+
+    async def always_br(request):
+        return PreEncodedResponse(encoders["br"](body), "br")
+
+    async def extension(request):
+        return JSONResponse(request.scope["extensions"][ENCODING_EXTENSION])
+
+    return Starlette(
+        routes=[
+            Route("/", endpoint=homepage),
+            Route("/br", endpoint=always_br),
+            Route("/extension", endpoint=extension),
+        ]
+    )
+
+
+async def test_pre_encoded_extension():
+    middleware = CompressionMiddleware(
+        app=get_pre_encoded_app(b"x" * 4000),
+        algorithms=[BrotliAlgorithm(), GzipAlgorithm()],
+        pre_encoded=True,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            "/extension", headers={"accept-encoding": "gzip, br"}
+        )
+        assert response.json() == {"encoding": "br", "accepted": ["br", "gzip"]}
+
+        response = await client.get(
+            "/extension", headers={"accept-encoding": "identity"}
+        )
+        assert response.json() == {"encoding": "identity", "accepted": []}
+
+
+@pytest.mark.parametrize("accept_encoding", ["gzip", "br", "identity"])
+async def test_pre_encoded_body_is_not_recompressed(accept_encoding: str):
+    hooks = RecordingHooks()
+    middleware = CompressionMiddleware(
+        app=get_pre_encoded_app(b"x" * 4000),
+        algorithms=[BrotliAlgorithm(), GzipAlgorithm()],
+        hooks=hooks,
+        pre_encoded=True,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            "/", headers={"accept-encoding": accept_encoding}
+        )
+        assert response.status_code == 200
+        assert response.text == "x" * 4000
+        assert response.headers["Vary"] == "Accept-Encoding"
+        if accept_encoding == "identity":
+            assert "Content-Encoding" not in response.headers
+        else:
+            assert response.headers["Content-Encoding"] == accept_encoding
+            assert int(response.headers["Content-Length"]) < 100
+
+    assert hooks.summaries[0].chunks == (accept_encoding == "identity")
+
+
+@pytest.mark.parametrize("transcode", [False, True])
+async def test_pre_encoded_with_other_encoding(transcode: bool):
+    middleware = CompressionMiddleware(
+        app=get_pre_encoded_app(b"x" * 4000),
+        algorithms=[BrotliAlgorithm(), GzipAlgorithm()],
+        transcode=transcode,
+        pre_encoded=True,
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get("/br", headers={"accept-encoding": "gzip"})
+        assert response.status_code == 200
+        expected = "gzip" if transcode else "br"
+        assert response.headers["Content-Encoding"] == expected
+        assert response.text == "x" * 4000
+
+
+async def test_profiles():
+    async def homepage(request):
+        return PlainTextResponse("x" * 4000)
+
+    middleware = CompressionMiddleware(
+        app=Starlette(routes=[Route("/{path:path}", endpoint=homepage)]),
+        algorithms=[GzipAlgorithm(compresslevel=6)],
+        profiles={
+            "/static": [BrotliAlgorithm(quality=9)],
+            "/api/stream*": [ZstdAlgorithm(level=1), GzipAlgorithm()],
+        },
+    )
+
+    async with get_test_client(middleware) as client:
+        for path, expected in [
+            ("/", "gzip"),
+            ("/static/app.js", "br"),
+            ("/api/stream/events", "zstd"),
+            ("/api/users", "gzip"),
+        ]:
+            response = await client.get(
+                path, headers={"accept-encoding": "gzip, br, zstd"}
+            )
+            assert response.headers["Content-Encoding"] == expected
+
+        # Profiles still negotiate with the client.
+        response = await client.get(
+            "/api/stream/events", headers={"accept-encoding": "gzip"}
+        )
+        assert response.headers["Content-Encoding"] == "gzip"
+        response = await client.get(
+            "/static/app.js", headers={"accept-encoding": "gzip"}
+        )
+        assert "Content-Encoding" not in response.headers
+
+
+def test_profile_negotiation_cache():
+    gzip_algorithm = GzipAlgorithm()
+    profile = CompressionProfile([BrotliAlgorithm(), gzip_algorithm])
+    assert profile.negotiate("gzip, deflate") is gzip_algorithm
+    assert profile.negotiate("identity") is None
+    assert profile._negotiated == {
+        "gzip, deflate": gzip_algorithm,
+        "identity": None,
+    }
+
+    for index in range(MAX_NEGOTIATION_CACHE_SIZE):
+        profile.negotiate(f"gzip;q={index}")
+    assert len(profile._negotiated) <= MAX_NEGOTIATION_CACHE_SIZE
+
+
+@pytest.mark.parametrize(
+    "algorithm",
+    [GzipAlgorithm(), BrotliAlgorithm(), ZstdAlgorithm(), IdentityAlgorithm()],
+)
+def test_responders_use_slots(algorithm: Any) -> None:
+    responder = algorithm.create_responder(get_starlette_app())
+    assert not hasattr(responder, "__dict__")
+
+
+async def test_identity_streaming_forwards_messages() -> None:
+    chunks: list[Message] = [
+        {"type": "http.response.body", "body": b"x" * 400, "more_body": True}
+        for _ in range(3)
+    ]
+    chunks.append({"type": "http.response.body", "body": b""})
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        for chunk in chunks:
+            await send(chunk)
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    received: list[Message] = []
+
+    async def send(message: Message) -> None:
+        received.append(message)
+
+    middleware = CompressionMiddleware(app=app, algorithms=[GzipAlgorithm()])
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", b"identity")],
+    }
+    await middleware(scope, receive, send)
+
+    assert Headers(raw=received[0]["headers"])["Vary"] == "Accept-Encoding"
+    # Sent as they are, not copied or re-encoded.
+    assert len(received) == len(chunks) + 1
+    assert all(a is b for a, b in zip(received[1:], chunks))
@@ -0,0 +1,170 @@
+import gzip
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from asgi_compression.gzip import GzipAlgorithm, GzipResponder
+from asgi_compression.middleware import CompressionMiddleware
+from asgi_compression.pool import ThreadBudget
+from asgi_compression.zstd import ZstdAlgorithm
+
+from .utils import get_test_client
+
+BODY = "".join(f"row {i},{i * 7 % 13},{i % 97}\n" for i in range(40000))
+
+
+def get_app() -> Starlette:
+    async def homepage(request):
+        return PlainTextResponse(BODY)
+
+    async def streaming(request):
+        async def generator():
+            # A small chunk, then large ones, to mix serial and parallel
+            # compression in one stream.
+            yield BODY[:1000]
+            yield BODY[1000:500000]
+            yield BODY[500000:600000]
+            yield BODY[600000:]
+
+        return StreamingResponse(generator(), media_type="text/plain")
+
+    return Starlette(
+        routes=[
+            Route("/", endpoint=homepage),
+            Route("/streaming", endpoint=streaming),
+        ]
+    )
+
+
+def test_thread_budget() -> None:
+    budget = ThreadBudget(max_threads=4)
+    assert budget.acquire(3) == 3
+    assert budget.acquire(3) == 1
+    assert budget.acquire(1) == 0
+    assert budget.available == 0
+
+    budget.release(3)
+    assert budget.available == 3
+    budget.release(1)
+    assert budget.in_use == 0
+
+
+@pytest.mark.parametrize("path", ["/", "/streaming"])
+@pytest.mark.parametrize("compresslevel", [1, 6, 9])
+async def test_parallel_gzip(path: str, compresslevel: int) -> None:
+    budget = ThreadBudget(max_threads=4)
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[
+            GzipAlgorithm(
+                compresslevel=compresslevel,
+                parallel_threshold=256 * 1024,
+                parallel_block_size=64 * 1024,
+                thread_budget=budget,
+            )
+        ],
+    )
+
+    async with get_test_client(middleware) as client:
+        async with client.stream(
+            "GET", path, headers={"accept-encoding": "gzip"}
+        ) as response:
+            assert response.status_code == 200
+            assert response.headers["Content-Encoding"] == "gzip"
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+
+    # A single member, decodable by any gzip client.
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decompressor.decompress(raw) == BODY.encode()
+    assert decompressor.eof and not decompressor.unused_data
+    assert budget.in_use == 0
+
+
+async def test_parallel_gzip_size_close_to_serial() -> None:
+    budget = ThreadBudget(max_threads=4)
+    responder = GzipResponder(
+        app=get_app(),
+        minimum_size=0,
+        compresslevel=6,
+        parallel_threshold=0,
+        parallel_block_size=64 * 1024,
+        thread_budget=budget,
+    )
+    body = BODY.encode()
+    parallel = await responder.compress(body, more_body=False)
+
+    assert gzip.decompress(parallel) == body
+    serial = gzip.compress(body, compresslevel=6)
+    assert len(parallel) < len(serial) * 1.01
+
+
+async def test_parallel_gzip_without_threads_is_serial() -> None:
+    budget = ThreadBudget(max_threads=1)
+    assert budget.acquire(1) == 1
+    responder = GzipResponder(
+        app=get_app(),
+        minimum_size=0,
+        parallel_threshold=0,
+        thread_budget=budget,
+    )
+
+    compressed = await responder.compress(BODY.encode(), more_body=False)
+    assert gzip.decompress(compressed) == BODY.encode()
+    # Nothing was scheduled on the budget's pool.
+    assert budget._executor is None
+
+
+def test_serial_gzip_window_tracks_streaming_chunks() -> None:
+    responder = GzipResponder(
+        app=get_app(), minimum_size=0, parallel_threshold=1024 * 1024
+    )
+    body = BODY.encode()
+    chunks = [body[:1000], body[1000:500_000], body[500_000:]]
+    output = responder.apply_compression(chunks[0], more_body=True)
+    assert responder.window == chunks[0]
+    output += responder.apply_compression(chunks[1], more_body=True)
+    assert responder.window == body[500_000 - 32 * 1024 : 500_000]
+    output += responder.apply_compression(chunks[2], more_body=False)
+    assert responder.window == b""
+    assert gzip.decompress(output) == body
+
+
+async def test_zstd_threads_come_from_budget() -> None:
+    budget = ThreadBudget(max_threads=2)
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[ZstdAlgorithm(threads=-1, thread_budget=budget)],
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get("/", headers={"accept-encoding": "zstd"})
+        assert response.headers["Content-Encoding"] == "zstd"
+        assert response.text == BODY
+
+    assert budget.in_use == 0
+
+
+async def test_parallel_gzip_stream_ending_with_empty_chunk() -> None:
+    # Every chunk is large enough for parallel compression, but the empty
+    # chunk ending the stream must still end the deflate stream.
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[
+            GzipAlgorithm(
+                parallel_threshold=0,
+                parallel_block_size=64 * 1024,
+                thread_budget=ThreadBudget(max_threads=4),
+            )
+        ],
+    )
+
+    async with get_test_client(middleware) as client:
+        response = await client.get(
+            "/streaming", headers={"accept-encoding": "gzip"}
+        )
+
+    assert response.status_code == 200
+    assert response.text == BODY
@@ -0,0 +1,329 @@
+import gzip
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from asgi_compression import (
+    BackgroundRecompressor,
+    BrotliAlgorithm,
+    CompressionAlgorithm,
+    CompressionMiddleware,
+    DiskVariantCache,
+    ETagMode,
+    GzipAlgorithm,
+    MemoryVariantCache,
+)
+from asgi_compression.ranges import (
+    RangeNotSatisfiable,
+    if_range_matches,
+    parse_range,
+)
+from asgi_compression.types import ASGIApp
+
+from .utils import RecordingHooks, get_file_app, request
+
+BODY = " ".join(f"line-{i}" for i in range(20000))
+LAST_MODIFIED = "Wed, 21 Oct 2015 07:28:00 GMT"
+
+
+def get_app(seen: Optional[list[Optional[str]]] = None) -> Starlette:
+    headers = {
+        "ETag": '"export"',
+        "Last-Modified": LAST_MODIFIED,
+        "Accept-Ranges": "bytes",
+    }
+
+    async def export(request: Request) -> PlainTextResponse:
+        if seen is not None:
+            seen.append(request.headers.get("range"))
+        return PlainTextResponse(BODY, headers=headers)
+
+    async def stream(request: Request) -> StreamingResponse:
+        if seen is not None:
+            seen.append(request.headers.get("range"))
+
+        async def chunks():
+            for offset in range(0, len(BODY), 4096):
+                yield BODY[offset : offset + 4096]
+
+        return StreamingResponse(chunks(), headers=headers)
+
+    return Starlette(
+        routes=[Route("/", endpoint=export), Route("/stream", endpoint=stream)]
+    )
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-9", (0, 10)),
+        ("bytes=90-", (90, 100)),
+        ("bytes=-10", (90, 100)),
+        ("bytes=-1000", (0, 100)),
+        ("bytes=50-1000", (50, 100)),
+        ("bytes = 1-2", (1, 3)),
+        ("bytes=5-2", None),
+        ("bytes=0-1,5-6", None),
+        ("items=0-9", None),
+        ("bytes=-", None),
+    ],
+)
+def test_parse_range(header: str, expected: Optional[tuple[int, int]]):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=-0"])
+def test_parse_range_not_satisfiable(header: str) -> None:
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 100)
+
+
+def test_if_range_matches() -> None:
+    assert if_range_matches('"a"', '"a"', None)
+    assert not if_range_matches('"a"', '"b"', None)
+    assert not if_range_matches('W/"a"', 'W/"a"', None)
+    assert not if_range_matches('"a"', 'W/"a"', None)
+    assert if_range_matches(LAST_MODIFIED, None, LAST_MODIFIED)
+    assert not if_range_matches(LAST_MODIFIED, '"a"', None)
+
+
+async def test_range_served_from_cache() -> None:
+    hooks = RecordingHooks()
+    seen: list[Optional[str]] = []
+    middleware = CompressionMiddleware(
+        app=get_app(seen),
+        algorithms=[GzipAlgorithm()],
+        cache=MemoryVariantCache(),
+        hooks=hooks,
+        range_requests=True,
+    )
+    full = await request(middleware)
+    assert full.status == 200
+    assert full.headers["accept-ranges"] == "bytes"
+    assert gzip.decompress(full.body) == BODY.encode()
+
+    chunks = len(hooks.chunks)
+    response = await request(middleware, range="bytes=100-199")
+    assert response.status == 206
+    assert response.headers["content-range"] == (
+        f"bytes 100-199/{len(full.body)}"
+    )
+    assert response.headers["content-length"] == "100"
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.body == full.body[100:200]
+    # Served from the cached variant, nothing was compressed.
+    assert len(hooks.chunks) == chunks
+    # The app always sent the whole body.
+    assert seen == [None, None]
+
+    response = await request(middleware, range=f"bytes={len(full.body)}-")
+    assert response.status == 416
+    assert response.headers["content-range"] == f"bytes */{len(full.body)}"
+    assert response.body == b""
+    assert "content-encoding" not in response.headers
+    assert "etag" not in response.headers
+
+
+@pytest.mark.parametrize("cache", ["memory", "disk"])
+async def test_unsatisfiable_range_not_encoded(
+    tmp_path: Path, cache: str
+) -> None:
+    path = tmp_path / "export.txt"
+    path.write_bytes(BODY.encode())
+    middleware = CompressionMiddleware(
+        app=get_file_app(path),
+        algorithms=[GzipAlgorithm()],
+        cache=(
+            MemoryVariantCache()
+            if cache == "memory"
+            else DiskVariantCache(str(tmp_path / "cache"))
+        ),
+        content_digest=True,
+        range_requests=True,
+    )
+    full = await request(middleware)
+    response = await request(middleware, range=f"bytes={len(full.body)}-")
+    assert response.status == 416
+    assert response.headers["content-range"] == f"bytes */{len(full.body)}"
+    assert response.headers["content-length"] == "0"
+    assert response.body == b""
+    for name in ("content-encoding", "content-digest", "etag"):
+        assert name not in response.headers
+
+
+@pytest.mark.parametrize(
+    "if_range, partial",
+    [
+        ("{etag}", True),
+        ('"export"', False),
+        ("W/{etag}", False),
+        # Dates are shared by every encoding, they don't tell the variant.
+        (LAST_MODIFIED, False),
+    ],
+)
+async def test_if_range(if_range: str, partial: bool) -> None:
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[GzipAlgorithm()],
+        cache=MemoryVariantCache(),
+        range_requests=True,
+    )
+    full = await request(middleware)
+    etag = full.headers["etag"]
+    assert etag.startswith('"export-gzip-')
+    response = await request(
+        middleware, range="bytes=-100", if_range=if_range.format(etag=etag)
+    )
+    assert response.headers["etag"] == etag
+    if partial:
+        assert response.status == 206
+        assert response.body == full.body[-100:]
+    else:
+        assert response.status == 200
+        assert response.body == full.body
+
+
+async def test_if_range_of_another_variant() -> None:
+    def get_middleware(*algorithms: CompressionAlgorithm) -> ASGIApp:
+        return CompressionMiddleware(
+            app=get_app(),
+            algorithms=list(algorithms),
+            cache=MemoryVariantCache(),
+            range_requests=True,
+        )
+
+    middleware = get_middleware(GzipAlgorithm(), BrotliAlgorithm())
+    gzipped = await request(middleware, accept_encoding="gzip")
+    # The download resumes with another encoding, or after the
+    # configuration changed: the bytes differ, so does the ETag.
+    for resumed_middleware, accept_encoding in [
+        (middleware, "br"),
+        (get_middleware(GzipAlgorithm(compresslevel=1)), "gzip"),
+    ]:
+        response = await request(
+            resumed_middleware,
+            accept_encoding=accept_encoding,
+            range="bytes=10-",
+            if_range=gzipped.headers["etag"],
+        )
+        assert response.status == 200
+        assert response.headers["etag"] != gzipped.headers["etag"]
+
+
+def test_range_requests_require_strong_etags() -> None:
+    with pytest.raises(ValueError):
+        CompressionMiddleware(
+            app=get_app(),
+            algorithms=[GzipAlgorithm()],
+            cache=MemoryVariantCache(),
+            etag_mode=ETagMode.WEAK,
+            range_requests=True,
+        )
+
+
+async def test_no_ranges_without_stable_variant() -> None:
+    seen: list[Optional[str]] = []
+    middleware = CompressionMiddleware(
+        app=get_app(seen),
+        algorithms=[GzipAlgorithm()],
+        cache=MemoryVariantCache(),
+        range_requests=True,
+    )
+    response = await request(middleware, "/stream", range="bytes=0-9")
+    assert response.status == 200
+    assert "accept-ranges" not in response.headers
+    assert gzip.decompress(response.body) == BODY.encode()
+    # Unencoded responses are left to the app.
+    await request(middleware, "/stream", "identity", range="bytes=0-9")
+    assert seen == [None, "bytes=0-9"]
+
+
+async def test_no_ranges_before_recompression() -> None:
+    recompressor = BackgroundRecompressor(
+        hot_threshold=2,
+        executor=ThreadPoolExecutor(max_workers=1),
+    )
+    middleware = CompressionMiddleware(
+        app=get_app(),
+        algorithms=[BrotliAlgorithm(quality=1, background_quality=11)],
+        cache=MemoryVariantCache(),
+        recompressor=recompressor,
+        range_requests=True,
+    )
+    for _ in range(3):
+        response = await request(middleware, "/", "br", range="bytes=0-9")
+        assert response.status == 200
+        assert "accept-ranges" not in response.headers
+    await recompressor.drain()
+
+    # The body won't change anymore once upgraded.
+    full = await request(middleware, "/", "br")
+    assert full.headers["accept-ranges"] == "bytes"
+    response = await request(middleware, "/", "br", range="bytes=0-9")
+    assert response.status == 206
+    assert response.body == full.body[:10]
+    recompressor.shutdown()
+
+
+async def test_range_of_cached_file(tmp_path: Path) -> None:
+    path = tmp_path / "export.txt"
+    path.write_bytes(BODY.encode())
+    middleware = CompressionMiddleware(
+        app=get_file_app(path),
+        algorithms=[GzipAlgorithm()],
+        cache=DiskVariantCache(str(tmp_path / "cache")),
+        range_requests=True,
+    )
+    full = await request(middleware)
+    assert full.status == 200
+    assert full.headers["accept-ranges"] == "bytes"
+
+    response = await request(middleware, range="bytes=10-")
+    assert response.status == 206
+    assert response.headers["content-length"] == str(len(full.body) - 10)
+    (message,) = response.messages
+    assert message["type"] == "http.response.zerocopysend"
+    assert message["offset"] == 10
+    assert response.body == full.body[10:]
+
+
+def test_range_requests_require_cache() -> None:
+    with pytest.raises(ValueError):
+        CompressionMiddleware(
+            app=get_app(),
+            algorithms=[GzipAlgorithm()],
+            range_requests=True,
+        )
+
+
+async def test_ranges_resumed_across_workers(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def worker() -> CompressionMiddleware:
+        return CompressionMiddleware(
+            app=get_app(),
+            # Parallel gzip members carry a modification time.
+            algorithms=[GzipAlgorithm(parallel_threshold=0)],
+            cache=MemoryVariantCache(),
+            etag_mode=ETagMode.SUFFIX,
+            range_requests=True,
+        )
+
+    monkeypatch.setattr(time, "time", lambda: 1_000_000_000.0)
+    full = await request(worker())
+    # Resumed on another worker, which compresses the body later, from
+    # within the modification time of the gzip header.
+    monkeypatch.setattr(time, "time", lambda: 1_700_000_000.0)
+    response = await request(
+        worker(), range="bytes=6-", if_range=full.headers["etag"]
+    )
+    assert response.status == 206
+    assert full.body[:6] + response.body == full.body
+    assert gzip.decompress(full.body[:6] + response.body) == BODY.encode()
@@ -0,0 +1,186 @@
+import asyncio
+import gzip
+import sys
+import threading
+import typing
+
+import brotli
+import pytest
+
+from asgi_compression.base import DEFAULT_MINIMUM_SIZE, ContentEncoding
+from asgi_compression.brotli import BrotliAlgorithm
+from asgi_compression.cache import CachedVariant, MemoryVariantCache
+from asgi_compression.gzip import GzipAlgorithm
+from asgi_compression.hooks import CompressionSummary
+from asgi_compression.metrics import CompressionMetrics
+from asgi_compression.middleware import CompressionMiddleware
+from asgi_compression.types import Message, Receive, Scope, Send
+from asgi_compression.zstd import ZstdAlgorithm
+
+from .utils import decompress_zstd
+
+THREADS = 8
+BODY = b"".join(b"%08d lorem ipsum dolor sit amet\n" % i for i in range(4000))
+
+
+@pytest.fixture(autouse=True)
+def frequent_switches() -> typing.Iterator[None]:
+    """Switch threads as often as possible, so races show under the GIL."""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        yield
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def run_threads(target: typing.Callable[[int], None]) -> None:
+    errors: list[BaseException] = []
+    barrier = threading.Barrier(THREADS)
+
+    def run(index: int) -> None:
+        try:
+            barrier.wait()
+            target(index)
+        except BaseException as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=run, args=(index,)) for index in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_memory_cache_shared_by_threads() -> None:
+    cache = MemoryVariantCache(max_size=64 * 100, max_entry_size=100)
+
+    def use(index: int) -> None:
+        for i in range(2000):
+            key = ("gzip", b"%d" % (i % 97))
+            if cache.get(key) is None:
+                cache.set(key, CachedVariant(body=b"x" * (i % 100)))
+
+    run_threads(use)
+    assert cache.size == sum(
+        len(variant.body) for variant in cache._entries.values()
+    )
+    assert cache.size <= cache.max_size
+
+
+def test_cache_hits_counted_by_threads() -> None:
+    cache = MemoryVariantCache()
+    key = ("gzip", b"hot")
+    cache.set(key, CachedVariant(body=b"x"))
+
+    def hit(index: int) -> None:
+        for _ in range(5000):
+            variant = cache.get(key)
+            assert variant is not None
+            cache.hit(key, variant)
+
+    run_threads(hit)
+    variant = cache.get(key)
+    assert variant is not None and variant.hits == THREADS * 5000
+
+
+def test_metrics_shared_by_threads() -> None:
+    metrics = CompressionMetrics()
+    summary = CompressionSummary(
+        encoding=ContentEncoding.GZIP, bytes_in=10, bytes_out=3, duration_ns=7
+    )
+
+    def record(index: int) -> None:
+        for _ in range(5000):
+            metrics.on_finish(summary)
+
+    run_threads(record)
+    assert metrics.snapshot() == {
+        "responses": THREADS * 5000,
+        "compressed_responses": THREADS * 5000,
+        "bypassed_responses": 0,
+        "bytes_in": THREADS * 5000 * 10,
+        "bytes_out": THREADS * 5000 * 3,
+        "duration_ns": THREADS * 5000 * 7,
+    }
+
+
+def test_profiles_dont_mutate_algorithms() -> None:
+    algorithm = GzipAlgorithm()
+    middleware = CompressionMiddleware(
+        app=app, algorithms=[algorithm], minimum_size=10
+    )
+    assert algorithm.minimum_size == DEFAULT_MINIMUM_SIZE
+    assert middleware.algorithms[0].minimum_size == 10
+    # Configured sizes are kept, and the algorithm isn't copied.
+    explicit = GzipAlgorithm(minimum_size=20)
+    middleware = CompressionMiddleware(
+        app=app, algorithms=[explicit], minimum_size=10
+    )
+    assert middleware.algorithms[0] is explicit
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain")],
+        }
+    )
+    await send({"type": "http.response.body", "body": BODY})
+
+
+@pytest.mark.parametrize(
+    "encoding, decompress",
+    [
+        ("gzip", gzip.decompress),
+        ("br", brotli.decompress),
+        ("zstd", decompress_zstd),
+    ],
+)
+def test_middleware_shared_by_event_loops(
+    encoding: str, decompress: typing.Callable[[bytes], bytes]
+) -> None:
+    """One middleware serving event loops in several threads."""
+    metrics = CompressionMetrics()
+    cache = MemoryVariantCache()
+    middleware = CompressionMiddleware(
+        app=app,
+        algorithms=[ZstdAlgorithm(), BrotliAlgorithm(), GzipAlgorithm()],
+        hooks=metrics,
+        cache=cache,
+    )
+    bodies: list[bytes] = []
+
+    async def request() -> None:
+        chunks: list[bytes] = []
+
+        async def receive() -> Message:
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message: Message) -> None:
+            if message["type"] == "http.response.body":
+                chunks.append(message["body"])
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "headers": [(b"accept-encoding", encoding.encode())],
+        }
+        await middleware(scope, receive, send)
+        bodies.append(b"".join(chunks))
+
+    async def serve() -> None:
+        await asyncio.gather(*(request() for _ in range(20)))
+
+    run_threads(lambda index: asyncio.run(serve()))
+
+    assert metrics.responses == THREADS * 20
+    assert len(cache) == 1
+    assert len(set(bodies)) == 1
+    assert decompress(bodies[0]) == BODY
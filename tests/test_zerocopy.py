@@ -0,0 +1,230 @@
+import gzip
+import os
+import threading
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+import pytest
+
+from asgi_compression.cache import (
+    CachedVariant,
+    DiskVariantCache,
+    MemoryVariantCache,
+    VariantKey,
+)
+from asgi_compression.gzip import GzipAlgorithm
+from asgi_compression.middleware import CompressionMiddleware
+from asgi_compression.types import Receive, Scope, Send
+
+from .utils import RecordingHooks, get_file_app, request
+
+BODY = b"".join(b"line %d of the export\n" % i for i in range(100_000))
+
+
+@pytest.fixture
+def export(tmp_path: Path) -> Path:
+    path = tmp_path / "export.txt"
+    path.write_bytes(BODY)
+    return path
+
+
+async def test_zerocopysend_is_compressed(export: Path) -> None:
+    hooks = RecordingHooks()
+    middleware = CompressionMiddleware(
+        app=get_file_app(export),
+        algorithms=[GzipAlgorithm()],
+        hooks=hooks,
+    )
+
+    response = await request(middleware)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert [message["type"] for message in response.messages] == [
+        "http.response.body"
+    ]
+    assert int(response.headers["content-length"]) == len(response.body)
+    assert gzip.decompress(response.body) == BODY
+    # Compressed in slices.
+    assert hooks.summaries[0].chunks > 1
+
+
+async def test_zerocopysend_range(export: Path) -> None:
+    middleware = CompressionMiddleware(
+        app=get_file_app(export, offset=1000, count=5000),
+        algorithms=[GzipAlgorithm()],
+    )
+
+    response = await request(middleware)
+    assert gzip.decompress(response.body) == BODY[1000:6000]
+
+
+@pytest.mark.parametrize(
+    "content_type, accept_encoding, count",
+    [
+        (b"text/event-stream", "gzip", None),
+        (b"text/plain", "identity", None),
+        (b"text/plain", "gzip", 100),
+    ],
+)
+async def test_zerocopysend_passthrough(
+    export: Path,
+    content_type: bytes,
+    accept_encoding: str,
+    count: Optional[int],
+) -> None:
+    middleware = CompressionMiddleware(
+        app=get_file_app(export, content_type=content_type, count=count),
+        algorithms=[GzipAlgorithm()],
+    )
+
+    response = await request(middleware, accept_encoding=accept_encoding)
+    assert "content-encoding" not in response.headers
+    assert [message["type"] for message in response.messages] == [
+        "http.response.zerocopysend"
+    ]
+    assert response.body == BODY[:count]
+
+
+async def test_zerocopysend_pre_encoded(tmp_path: Path) -> None:
+    path = tmp_path / "export.txt.gz"
+    path.write_bytes(gzip.compress(BODY))
+    middleware = CompressionMiddleware(
+        app=get_file_app(path, pre_encoded="gzip"),
+        algorithms=[GzipAlgorithm()],
+        pre_encoded=True,
+    )
+
+    response = await request(middleware)
+    assert response.status == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-length"] == str(path.stat().st_size)
+    assert [message["type"] for message in response.messages] == [
+        "http.response.zerocopysend"
+    ]
+    assert gzip.decompress(response.body) == BODY
+
+
+async def test_zerocopysend_disk_cache(export: Path, tmp_path: Path) -> None:
+    cache = DiskVariantCache(str(tmp_path / "cache"))
+    hooks = RecordingHooks()
+    middleware = CompressionMiddleware(
+        app=get_file_app(export),
+        algorithms=[GzipAlgorithm()],
+        cache=cache,
+        hooks=hooks,
+    )
+
+    first = await request(middleware)
+    second = await request(middleware)
+
+    assert [message["type"] for message in second.messages] == [
+        "http.response.zerocopysend"
+    ]
+    assert second.body == first.body
+    assert gzip.decompress(second.body) == BODY
+    assert second.headers["content-length"] == str(len(first.body))
+    assert second.headers["content-encoding"] == "gzip"
+    assert hooks.summaries[1].chunks == 0
+    assert len(os.listdir(cache.directory)) == 1
+
+    # Modifying the file invalidates the cached variant.
+    export.write_bytes(BODY[::-1])
+    third = await request(middleware)
+    assert gzip.decompress(third.body) == BODY[::-1]
+
+
+class ThreadRecordingDiskCache(DiskVariantCache):
+    def __init__(self, directory: str) -> None:
+        super().__init__(directory)
+        self.threads: set[int] = set()
+
+    def get(self, key: VariantKey) -> Optional[CachedVariant]:
+        self.threads.add(threading.get_ident())
+        return super().get(key)
+
+    def set(self, key: VariantKey, variant: CachedVariant) -> None:
+        self.threads.add(threading.get_ident())
+        super().set(key, variant)
+
+    def open(self, key: VariantKey) -> Optional[BinaryIO]:
+        self.threads.add(threading.get_ident())
+        return super().open(key)
+
+
+@pytest.mark.parametrize("path", ["file", "body"])
+async def test_disk_cache_off_the_event_loop(
+    export: Path, tmp_path: Path, path: str
+) -> None:
+    cache = ThreadRecordingDiskCache(str(tmp_path / "cache"))
+
+    async def body_app(scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        await send({"type": "http.response.body", "body": BODY})
+
+    app = get_file_app(export) if path == "file" else body_app
+    middleware = CompressionMiddleware(
+        app=app, algorithms=[GzipAlgorithm()], cache=cache
+    )
+
+    first = await request(middleware)
+    second = await request(middleware)
+    assert second.body == first.body
+    assert cache.threads
+    assert threading.get_ident() not in cache.threads
+
+
+async def test_zerocopysend_memory_cache(export: Path) -> None:
+    middleware = CompressionMiddleware(
+        app=get_file_app(export, count=50_000),
+        algorithms=[GzipAlgorithm()],
+        cache=MemoryVariantCache(),
+    )
+
+    first = await request(middleware)
+    second = await request(middleware)
+    assert second.body == first.body
+    assert gzip.decompress(second.body) == BODY[:50_000]
+
+
+def test_disk_cache_eviction(tmp_path: Path) -> None:
+    cache = DiskVariantCache(str(tmp_path), max_size=10)
+    cache.set(("gzip", b"a"), CachedVariant(body=b"aaaa"))
+    cache.set(("gzip", b"b"), CachedVariant(body=b"bbbb"))
+    os.utime(cache.path(("gzip", b"a")), ns=(0, 0))
+    cache.set(("gzip", b"c"), CachedVariant(body=b"cccc"))
+
+    assert cache.get(("gzip", b"a")) is None
+    variant = cache.get(("gzip", b"b"))
+    assert variant is not None and variant.body == b"bbbb"
+    assert cache.get(("gzip", b"c")) is not None
+
+
+def test_disk_cache_scanned_only_to_evict(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "old.gzip").write_bytes(b"oooo")
+    cache = DiskVariantCache(str(tmp_path), max_size=10)
+    assert cache.size == 4
+
+    scans = 0
+    scan = cache._scan
+
+    def counting_scan():
+        nonlocal scans
+        scans += 1
+        return scan()
+
+    monkeypatch.setattr(cache, "_scan", counting_scan)
+    cache.set(("gzip", b"a"), CachedVariant(body=b"aaaa"))
+    cache.set(("gzip", b"a"), CachedVariant(body=b"aaa"))
+    assert (scans, cache.size) == (0, 7)
+
+    cache.set(("gzip", b"b"), CachedVariant(body=b"bbbb"))
+    assert (scans, cache.size) == (1, 7)
+    assert not (tmp_path / "old.gzip").exists()
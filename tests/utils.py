@@ -1,14 +1,27 @@
+import asyncio
 import sys
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from copy import copy
 from importlib import reload
+from pathlib import Path
 from types import ModuleType
+from typing import Optional
 
 import pytest
 from httpx import ASGITransport, AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
 
-from asgi_compression.types import ASGIApp
+from asgi_compression import (
+    CompressionHooks,
+    CompressionSummary,
+    ContentEncoding,
+)
+from asgi_compression.base import PRE_ENCODED_KEY
+from asgi_compression.types import ASGIApp, Message, Receive, Scope, Send
+from asgi_compression.zstd import ZstdDecompressor
 
 
 @asynccontextmanager
@@ -27,8 +40,165 @@ def unimport_module(
     module_name: str,
     to_reload: ModuleType,
 ) -> None:
+    # Restore the module's globals once the test is done, so later tests
+    # don't see objects from the reloaded module.
+    namespace = vars(to_reload)
+    for name, value in list(namespace.items()):
+        monkeypatch.setitem(namespace, name, value)
+
     sys_modules = copy(sys.modules)
     sys_modules[module_name] = None  # type: ignore
     monkeypatch.delitem(sys.modules, module_name, raising=False)
     monkeypatch.setattr("sys.modules", sys_modules)
     reload(to_reload)
+
+
+class RecordingHooks(CompressionHooks):
+    def __init__(self) -> None:
+        self.started: list[ContentEncoding] = []
+        self.chunks: list[tuple[int, int]] = []
+        self.summaries: list[CompressionSummary] = []
+
+    def on_start(self, scope: Scope, encoding: ContentEncoding) -> None:
+        self.started.append(encoding)
+
+    def on_chunk(self, in_bytes: int, out_bytes: int, ns: int) -> None:
+        assert ns >= 0
+        self.chunks.append((in_bytes, out_bytes))
+
+    def on_finish(self, summary: CompressionSummary) -> None:
+        self.summaries.append(summary)
+
+
+def get_streaming_app() -> Starlette:
+    async def homepage(request):
+        return PlainTextResponse("x" * 4000)
+
+    async def streaming(request):
+        async def generator() -> AsyncGenerator[bytes, None]:
+            for _ in range(10):
+                yield b"x" * 400
+
+        return StreamingResponse(generator(), media_type="text/plain")
+
+    return Starlette(
+        routes=[
+            Route("/", endpoint=homepage),
+            Route("/streaming", endpoint=streaming),
+        ]
+    )
+
+
+def get_file_app(
+    path: Path,
+    content_type: bytes = b"text/plain",
+    offset: int = 0,
+    count: Optional[int] = None,
+    pre_encoded: Optional[str] = None,
+) -> ASGIApp:
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        size = path.stat().st_size if count is None else count
+        start: Message = {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(size).encode()),
+            ],
+        }
+        if pre_encoded is not None:
+            start[PRE_ENCODED_KEY] = pre_encoded
+        await send(start)
+        with path.open("rb") as file:
+            message: Message = {
+                "type": "http.response.zerocopysend",
+                "file": file,
+                "offset": offset,
+            }
+            if count is not None:
+                message["count"] = count
+            await send(message)
+
+    return app
+
+
+class Response:
+    """The messages sent for a response, recorded as a server would."""
+
+    def __init__(self) -> None:
+        self.start: Message = {}
+        self.status = 0
+        self.headers: dict[str, str] = {}
+        self.messages: list[Message] = []
+        self.trailers: Optional[Message] = None
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            self.status = message["status"]
+            self.headers = {
+                key.decode().lower(): value.decode()
+                for key, value in message["headers"]
+            }
+        elif message["type"] == "http.response.trailers":
+            self.trailers = message
+        else:
+            assert self.trailers is None
+            if message["type"] == "http.response.zerocopysend":
+                # Read it like a server would, before the file is closed.
+                file = message["file"]
+                file.seek(message.get("offset", 0))
+                body = file.read(message.get("count", -1))
+                message = {**message, "body": body}
+            self.messages.append(message)
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(message["body"] for message in self.messages)
+
+
+async def request(
+    app: ASGIApp,
+    path: str = "/",
+    accept_encoding: str = "gzip",
+    trailers: bool = False,
+    **headers: str,
+) -> Response:
+    """GET `path` from `app`, with zero-copy sends supported."""
+    extensions: dict[str, dict] = {"http.response.zerocopysend": {}}
+    if trailers:
+        extensions["http.response.trailers"] = {}
+    scope: Scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": b"",
+        "headers": [
+            (b"accept-encoding", accept_encoding.encode()),
+            *(
+                (name.replace("_", "-").encode(), value.encode())
+                for name, value in headers.items()
+            ),
+        ],
+        "extensions": extensions,
+    }
+    received = False
+
+    async def receive() -> Message:
+        nonlocal received
+        if received:
+            # Starlette listens for a disconnect while streaming.
+            await asyncio.Event().wait()
+        received = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    response = Response()
+    await app(scope, receive, response)
+    return response
+
+
+def decompress_zstd(body: bytes) -> bytes:
+    decompressor = ZstdDecompressor()
+    output = b"".join(decompressor.decompress(body))
+    decompressor.finish()
+    return output